@@ -1,13 +1,45 @@
+import hashlib
+import time
+from dataclasses import dataclass
 from typing import Optional
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.core.config import settings
+from app.core.cache import TTLCache
 from app.models.user import User
 
 security = HTTPBearer(auto_error=False)  # auto_error=False permite que sea opcional
 
+# Usuarios autenticados por email: evita un find_one a MongoDB en cada petición protegida
+# Se invalida desde auth_google cuando el usuario se crea o actualiza
+user_cache: TTLCache[User] = TTLCache(
+    maxsize=settings.USER_CACHE_MAXSIZE,
+    ttl=settings.USER_CACHE_TTL_SECONDS
+)
+
+
+@dataclass(frozen=True)
+class TokenContext:
+    """
+    Datos de un token JWT ya verificado
+    Se decodifica una sola vez por petición y lo comparten todas las dependencias
+    """
+    token: str
+    email: str
+    emision: datetime  # Claim iat (o momento de la primera verificación si el token no lo trae)
+    caducidad: datetime  # Claim exp
+    exp: float  # Claim exp como timestamp, para comprobar la caducidad sin volver a decodificar
+
+
+# Tokens ya verificados indexados por su digest SHA-256: evita repetir la verificación HMAC
+# de un mismo token en peticiones sucesivas. Las entradas caducadas (exp) se descartan al leerlas
+token_cache: TTLCache[TokenContext] = TTLCache(
+    maxsize=settings.TOKEN_CACHE_MAXSIZE,
+    ttl=settings.TOKEN_CACHE_TTL_SECONDS
+)
+
 async def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
     Crea un token JWT para el usuario autenticado
@@ -18,12 +50,76 @@ async def create_access_token(data: dict, expires_delta: Optional[timedelta] = N
     else:
         expire = datetime.utcnow() + timedelta(minutes=30)  # Token válido por 30 minutos
     
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
     return encoded_jwt
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+async def get_user_by_email(email: str) -> Optional[User]:
+    """
+    Obtiene el usuario por email pasando por la caché en memoria
+    """
+    user = user_cache.get(email)
+    if user is None:
+        user = await User.find_one(User.email == email)
+        if user is not None:
+            user_cache.set(email, user)
+    return user
+
+
+def invalidate_user(email: str) -> None:
+    """
+    Elimina al usuario de la caché (llamar tras crear o modificar el usuario)
+    """
+    user_cache.pop(email)
+
+
+def decode_token(token: str) -> Optional[TokenContext]:
+    """
+    Verifica y decodifica un token JWT pasando por la caché de tokens verificados
+    Devuelve None si el token no es válido, ha caducado o no tiene email (sub)
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    context = token_cache.get(digest)
+    if context is not None:
+        if context.exp > time.time():
+            return context
+        token_cache.pop(digest)
+        return None
+    
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+    except JWTError:
+        return None
+    
+    email = payload.get("sub")
+    exp = payload.get("exp")
+    if email is None or exp is None:
+        return None
+    
+    context = TokenContext(
+        token=token,
+        email=email,
+        emision=datetime.fromtimestamp(payload.get("iat", datetime.utcnow().timestamp())),
+        caducidad=datetime.fromtimestamp(exp),
+        exp=float(exp)
+    )
+    token_cache.set(digest, context)
+    return context
+
+
+async def get_token_context(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[TokenContext]:
+    """
+    Decodifica el token Bearer de la petición (None si no hay token o no es válido)
+    FastAPI cachea las dependencias por petición, así que get_current_user,
+    get_current_user_optional y extract_token_info comparten una única decodificación
+    """
+    if not credentials:
+        return None
+    return decode_token(credentials.credentials)
+
+
+async def get_current_user(token_context: Optional[TokenContext] = Depends(get_token_context)) -> User:
     """
     Obtiene el usuario actual desde el token JWT
     Dependency para proteger rutas
@@ -34,38 +130,23 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    if token_context is None:
         raise credentials_exception
     
-    user = await User.find_one(User.email == email)
+    user = await get_user_by_email(token_context.email)
     if user is None:
         raise credentials_exception
     
     return user
 
 
-async def get_current_user_optional(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[User]:
+async def get_current_user_optional(token_context: Optional[TokenContext] = Depends(get_token_context)) -> Optional[User]:
     """
     Obtiene el usuario actual si está autenticado, None si no
     Útil para rutas que permiten acceso público pero muestran más info si estás logueado
     """
-    if not credentials:
-        return None
-    
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-    except JWTError:
+    if token_context is None:
         return None
     
-    user = await User.find_one(User.email == email)
+    user = await get_user_by_email(token_context.email)
     return user
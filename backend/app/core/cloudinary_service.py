@@ -1,10 +1,14 @@
 """
 Servicio para subir imágenes a Cloudinary
 """
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import cloudinary
 import cloudinary.uploader
 from app.core.config import settings
-from typing import Optional
+from app.core.cache import TTLCache
+from typing import Any, BinaryIO, Callable, Dict, Optional, Union
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,21 +22,107 @@ cloudinary.config(
 )
 
 
-async def upload_image(file_content: bytes, filename: str) -> Optional[str]:
+class UploadQueueFull(Exception):
+    """La cola de subidas está llena: el cliente debe reintentar más tarde"""
+
+
+class UploadExecutor:
+    """
+    Ejecuta las llamadas síncronas del SDK de Cloudinary fuera del event loop
+    Usa un pool de hilos dedicado (no el executor por defecto del loop) y un semáforo
+    con el mismo tamaño, de modo que las subidas lentas no bloquean al resto de
+    peticiones ni acaparan los hilos que usan otras librerías
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cloudinary")
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise UploadQueueFull("Demasiadas subidas de imágenes en curso, inténtalo más tarde")
+
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+upload_executor = UploadExecutor(
+    max_workers=settings.CLOUDINARY_UPLOAD_WORKERS,
+    max_queue=settings.CLOUDINARY_UPLOAD_MAX_QUEUE
+)
+
+# SHA-256 del contenido -> secure_url, delante de la colección `imagenes`
+image_url_cache: TTLCache[str] = TTLCache(
+    maxsize=settings.IMAGE_DEDUP_CACHE_MAXSIZE,
+    ttl=settings.IMAGE_DEDUP_CACHE_TTL_SECONDS
+)
+
+
+async def upload_image(file_content: Union[bytes, BinaryIO], filename: str) -> Optional[str]:
     """
     Sube una imagen a Cloudinary y retorna la URL segura
+    La subida se ejecuta en el pool dedicado `upload_executor`, sin bloquear el event loop
+    Los ficheros se envían por trozos de CLOUDINARY_UPLOAD_CHUNK_SIZE (upload_large),
+    así que la memoria usada por subida no depende del tamaño de la imagen
     
     Args:
-        file_content: Contenido del archivo en bytes
+        file_content: Contenido del archivo en bytes o fichero abierto en modo binario
         filename: Nombre del archivo original
         
     Returns:
         URL de la imagen subida o None si falla
+        
+    Raises:
+        UploadQueueFull: si hay demasiadas subidas esperando turno
     """
+    if isinstance(file_content, (bytes, bytearray)):
+        upload_func, upload_options = cloudinary.uploader.upload, {}
+    else:
+        upload_func, upload_options = cloudinary.uploader.upload_large, {
+            "chunk_size": settings.CLOUDINARY_UPLOAD_CHUNK_SIZE
+        }
+    
     try:
         # Subir imagen a Cloudinary
-        result = cloudinary.uploader.upload(
+        result = await upload_executor.run(
+            upload_func,
             file_content,
+            **upload_options,
             folder="eventual/eventos",  # Carpeta en Cloudinary
             resource_type="image",
             allowed_formats=["jpg", "jpeg", "png", "gif", "webp"],
@@ -45,6 +135,8 @@ async def upload_image(file_content: bytes, filename: str) -> Optional[str]:
         logger.info(f"Imagen subida exitosamente: {result['secure_url']}")
         return result["secure_url"]
         
+    except UploadQueueFull:
+        raise
     except Exception as e:
         logger.error(f"Error al subir imagen a Cloudinary: {str(e)}")
         raise Exception(f"Error al subir imagen: {str(e)}")
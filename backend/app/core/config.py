@@ -1,3 +1,4 @@
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -20,6 +21,73 @@ class Settings(BaseSettings):
     CLOUDINARY_CLOUD_NAME: str
     CLOUDINARY_API_KEY: str
     CLOUDINARY_API_SECRET: str
+    CLOUDINARY_UPLOAD_WORKERS: int = 4  # Subidas simultáneas a Cloudinary por proceso
+    CLOUDINARY_UPLOAD_MAX_QUEUE: int = 32  # Subidas esperando turno antes de responder 503
+    CLOUDINARY_BATCH_PARALLELISM: int = 3  # Subidas simultáneas dentro de una misma petición por lotes
+    CLOUDINARY_UPLOAD_CHUNK_SIZE: int = 5 * 1024 * 1024  # Trozo por petición a Cloudinary (mínimo 5MB)
+
+    # Caché en memoria SHA-256 -> URL de imágenes ya subidas (además de la colección imagenes)
+    IMAGE_DEDUP_CACHE_MAXSIZE: int = 4096
+    IMAGE_DEDUP_CACHE_TTL_SECONDS: float = 24 * 3600
+
+    # Geocoding (Nominatim / OpenStreetMap)
+    NOMINATIM_URL: str = "https://nominatim.openstreetmap.org"
+    NOMINATIM_USER_AGENT: str = "Eventual/1.0"
+    NOMINATIM_MAX_REQUESTS_PER_SECOND: float = 1.0  # Política de uso de Nominatim: 1 req/s
+    GEOCODING_CACHE_MAXSIZE: int = 4096
+    GEOCODING_CACHE_TTL_SECONDS: float = 7 * 24 * 3600
+    GEOCODING_REVERSE_DECIMALS: int = 4  # Redondeo de coordenadas en la caché inversa (~11 m)
+
+    # Gazetteer local para reverse geocoding offline (GeoNames TSV o CSV name,latitude,longitude)
+    GAZETTEER_PATH: Optional[str] = None
+    GAZETTEER_MAX_DISTANCE_KM: float = 25.0  # Más lejos se considera fallo (y se pregunta a Nominatim)
+    GAZETTEER_NOMINATIM_FALLBACK: bool = True
+    
+    # Longitud del geohash que identifica un establecimiento junto a su nombre (7 → celdas de ~150 m)
+    ESTABLECIMIENTO_GEOHASH_PRECISION: int = 7
+    # Una reseña se agrupa con el establecimiento del mismo nombre más cercano de su celda o las
+    # 8 vecinas si está a menos de esta distancia (evita partirlo en dos junto al borde de una celda)
+    ESTABLECIMIENTO_RADIO_FUSION_M: float = 150.0
+    
+    # Teselas vectoriales (MVT) de reseñas: caché en memoria invalidada por tesela en cada escritura
+    # La invalidación solo llega al proceso que atiende la escritura: con varias instancias
+    # (serverless) las demás pueden servir una tesela desactualizada hasta TILE_CACHE_TTL_SECONDS
+    TILE_CACHE_MAXSIZE: int = 2048
+    TILE_CACHE_TTL_SECONDS: float = 30.0
+    TILE_MAX_ZOOM: int = 20
+    TILE_MAX_FEATURES: int = 20000  # Tope de puntos por tesela (a zoom bajo usar /resenas/clusters)
+    
+    # Índice de sugerencias de /resenas/sugerencias: se mantiene con las escrituras de este proceso
+    # y se reconstruye pasado este tiempo para recoger las de otras instancias
+    SUGERENCIAS_TTL_SECONDS: float = 300.0
+    
+    # Exportación en streaming /resenas/export: documentos por lote leído de MongoDB y por trozo enviado
+    EXPORT_BATCH_SIZE: int = 1000
+    
+    # Importación masiva NDJSON (POST /resenas/import y manage.py importar)
+    IMPORT_BATCH_SIZE: int = 500  # Reseñas por insert_many
+    IMPORT_MAX_LINE_BYTES: int = 64 * 1024  # Líneas más largas se rechazan sin acumularlas en memoria
+    IMPORT_MAX_ERRORES: int = 1000  # Errores detallados en el informe; del resto solo se cuentan
+    
+    # Caché de respuestas de lectura (bytes serializados), invalidada por etiquetas en cada escritura
+    # "memoria": por proceso (en serverless cada instancia solo ve sus propias escrituras hasta el TTL)
+    # "mongo": compartida entre instancias (colecciones cache_respuestas y cache_etiquetas)
+    RESPONSE_CACHE_BACKEND: Literal["memoria", "mongo", "ninguna"] = "memoria"
+    RESPONSE_CACHE_TTL_SECONDS: float = 30.0
+    RESPONSE_CACHE_MAXSIZE: int = 2048  # Solo backend memoria
+    RESPONSE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024  # Solo backend memoria
+    
+    # Single-flight de consultas de lectura (/resenas/ubicacion y /resenas/establecimiento):
+    # peticiones idénticas simultáneas comparten una sola consulta a MongoDB
+    SINGLEFLIGHT_MAX_WAITERS: int = 500  # Peticiones que se unen a una consulta; las siguientes lanzan otra
+
+    # Caché en memoria de usuarios autenticados (get_current_user)
+    USER_CACHE_MAXSIZE: int = 1024
+    USER_CACHE_TTL_SECONDS: float = 60.0
+
+    # Caché de tokens JWT ya verificados (por digest SHA-256 del token)
+    TOKEN_CACHE_MAXSIZE: int = 4096
+    TOKEN_CACHE_TTL_SECONDS: float = 300.0
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,189 @@
+"""
+Geocodificación inversa offline a partir de un gazetteer local
+
+Carga un fichero de localidades (formato GeoNames: TSV sin cabecera, como
+cities15000.txt, o CSV con cabecera name,latitude,longitude[,country_code])
+en un k-d tree implícito sobre arrays compactos. Los puntos se guardan como
+vectores unitarios 3D, de modo que el vecino euclídeo más cercano es también el
+más cercano sobre la esfera y no hay problemas en el antimeridiano ni en los polos.
+"""
+import csv
+import logging
+import math
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Columnas del formato de volcado de GeoNames (https://download.geonames.org/export/dump/)
+GEONAMES_NAME = 1
+GEONAMES_LATITUDE = 4
+GEONAMES_LONGITUDE = 5
+GEONAMES_COUNTRY_CODE = 8
+
+
+@dataclass(frozen=True)
+class Localidad:
+    """Localidad más cercana a un punto"""
+    nombre: str
+    pais: str
+    latitud: float
+    longitud: float
+    distancia_km: float
+
+    @property
+    def display_name(self) -> str:
+        return f"{self.nombre}, {self.pais}" if self.pais else self.nombre
+
+
+def _to_xyz(latitude: float, longitude: float) -> Tuple[float, float, float]:
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat)
+
+
+def _chord_to_km(chord_squared: float) -> float:
+    chord = math.sqrt(chord_squared)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class Gazetteer:
+    """
+    Índice de vecino más cercano sobre localidades (k-d tree implícito de 3 dimensiones)
+    El nodo de cada rango [lo, hi) es su elemento central; el eje alterna x, y, z por nivel
+    """
+
+    def __init__(self, registros: Iterable[Tuple[str, str, float, float]]):
+        puntos = []
+        for nombre, pais, latitude, longitude in registros:
+            puntos.append((*_to_xyz(latitude, longitude), nombre, pais, latitude, longitude))
+
+        self._build(puntos, 0, len(puntos), 0)
+
+        self._x = array("d", (p[0] for p in puntos))
+        self._y = array("d", (p[1] for p in puntos))
+        self._z = array("d", (p[2] for p in puntos))
+        self._lat = array("d", (p[5] for p in puntos))
+        self._lon = array("d", (p[6] for p in puntos))
+        self._nombres: List[str] = [p[3] for p in puntos]
+        self._paises: List[str] = [p[4] for p in puntos]
+
+    @staticmethod
+    def _build(puntos: list, lo: int, hi: int, axis: int) -> None:
+        # Ordenar cada rango por su eje deja la mediana en el centro; se hace iterativo
+        # para no depender del límite de recursión con ficheros grandes
+        pendientes = [(lo, hi, axis)]
+        while pendientes:
+            lo, hi, axis = pendientes.pop()
+            if hi - lo <= 1:
+                continue
+            puntos[lo:hi] = sorted(puntos[lo:hi], key=lambda p: p[axis])
+            mid = (lo + hi) // 2
+            siguiente = (axis + 1) % 3
+            pendientes.append((lo, mid, siguiente))
+            pendientes.append((mid + 1, hi, siguiente))
+
+    def __len__(self) -> int:
+        return len(self._nombres)
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[Localidad]:
+        """Localidad más cercana al punto, o None si el gazetteer está vacío"""
+        n = len(self._nombres)
+        if n == 0:
+            return None
+
+        q = _to_xyz(latitude, longitude)
+        qx, qy, qz = q
+        xs, ys, zs = self._x, self._y, self._z
+        ejes = (xs, ys, zs)
+        best_d = math.inf
+        best = -1
+
+        # (lo, hi, eje, cota inferior de la distancia² a cualquier punto del rango)
+        pila = [(0, n, 0, 0.0)]
+        while pila:
+            lo, hi, axis, cota = pila.pop()
+            if lo >= hi or cota >= best_d:
+                continue
+
+            mid = (lo + hi) >> 1
+            dx = xs[mid] - qx
+            dy = ys[mid] - qy
+            dz = zs[mid] - qz
+            d = dx * dx + dy * dy + dz * dz
+            if d < best_d:
+                best_d = d
+                best = mid
+
+            diff = q[axis] - ejes[axis][mid]
+            siguiente = 0 if axis == 2 else axis + 1
+            if diff < 0:
+                pila.append((mid + 1, hi, siguiente, diff * diff))
+                pila.append((lo, mid, siguiente, 0.0))
+            else:
+                pila.append((lo, mid, siguiente, diff * diff))
+                pila.append((mid + 1, hi, siguiente, 0.0))
+
+        return Localidad(
+            nombre=self._nombres[best],
+            pais=self._paises[best],
+            latitud=self._lat[best],
+            longitud=self._lon[best],
+            distancia_km=_chord_to_km(best_d)
+        )
+
+    def nearest_batch(self, puntos: Sequence[Tuple[float, float]]) -> List[Optional[Localidad]]:
+        """Localidad más cercana para cada (latitud, longitud) de la lista"""
+        return [self.nearest(latitude, longitude) for latitude, longitude in puntos]
+
+
+def _leer_registros(path: str) -> Iterator[Tuple[str, str, float, float]]:
+    """
+    Lee (nombre, país, latitud, longitud) de un fichero GeoNames (TSV) o CSV con cabecera
+    Las filas mal formadas se ignoran
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        primera = f.readline()
+        f.seek(0)
+
+        if "latitude" in primera.lower():
+            reader = csv.DictReader(f)
+            for fila in reader:
+                try:
+                    yield (
+                        fila["name"],
+                        fila.get("country_code") or "",
+                        float(fila["latitude"]),
+                        float(fila["longitude"])
+                    )
+                except (KeyError, TypeError, ValueError):
+                    continue
+        else:
+            for fila in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                try:
+                    yield (
+                        fila[GEONAMES_NAME],
+                        fila[GEONAMES_COUNTRY_CODE],
+                        float(fila[GEONAMES_LATITUDE]),
+                        float(fila[GEONAMES_LONGITUDE])
+                    )
+                except (IndexError, ValueError):
+                    continue
+
+
+_gazetteer: Optional[Gazetteer] = None
+
+
+def load_gazetteer(path: str) -> Gazetteer:
+    """Carga el gazetteer del fichero indicado y lo deja activo para reverse_geocode"""
+    global _gazetteer
+    _gazetteer = Gazetteer(_leer_registros(path))
+    logging.info(f"Gazetteer cargado desde {path}: {len(_gazetteer)} localidades")
+    return _gazetteer
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Gazetteer activo o None si no se ha configurado GAZETTEER_PATH"""
+    return _gazetteer
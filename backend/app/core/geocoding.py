@@ -1,53 +1,175 @@
+import asyncio
+import re
+import time
 import httpx
-from typing import Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 import logging
+from app.core.config import settings
+from app.core.cache import TTLCache
+from app.core.singleflight import SingleFlight
+from app.core.gazetteer import get_gazetteer
+
+
+class NominatimClient:
+    """
+    Cliente HTTP de Nominatim (OpenStreetMap) con conexiones persistentes
+    El httpx.AsyncClient se crea una vez y se reutiliza, evitando un handshake TCP/TLS por consulta
+    La URL base es configurable (NOMINATIM_URL) para apuntar a otra instancia o a un stub local
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        user_agent: str,
+        timeout: float = 10.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.transport = transport
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"User-Agent": self.user_agent},  # Nominatim requiere un User-Agent
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=2),
+                transport=self.transport
+            )
+        return self._http
+
+    async def search(self, query: str) -> List[Dict[str, Any]]:
+        # Documentación: https://nominatim.org/release-docs/develop/api/Search/
+        response = await self._client().get("/search", params={
+            "q": query,
+            "format": "json",
+            "limit": 1,
+            "addressdetails": 1
+        })
+        response.raise_for_status()
+        return response.json()
+
+    async def reverse(self, latitude: float, longitude: float) -> Dict[str, Any]:
+        response = await self._client().get("/reverse", params={
+            "lat": latitude,
+            "lon": longitude,
+            "format": "json",
+            "zoom": 10
+        })
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+class TokenBucket:
+    """
+    Limitador de tasa tipo token bucket: como máximo `rate` peticiones por segundo
+    Las llamadas que no encuentran token esperan su turno en orden de llegada
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+_upstream = NominatimClient(settings.NOMINATIM_URL, settings.NOMINATIM_USER_AGENT)
+_rate_limiter = TokenBucket(rate=settings.NOMINATIM_MAX_REQUESTS_PER_SECOND)
+_singleflight = SingleFlight()
+
+# Consultas directas por texto normalizado -> (lat, lon); () si Nominatim no encontró nada
+forward_cache: TTLCache[Tuple[float, ...]] = TTLCache(
+    maxsize=settings.GEOCODING_CACHE_MAXSIZE,
+    ttl=settings.GEOCODING_CACHE_TTL_SECONDS
+)
+# Consultas inversas por coordenadas redondeadas -> nombre; "" si no se encontró nada
+reverse_cache: TTLCache[str] = TTLCache(
+    maxsize=settings.GEOCODING_CACHE_MAXSIZE,
+    ttl=settings.GEOCODING_CACHE_TTL_SECONDS
+)
+
+
+def set_geocoding_upstream(client: NominatimClient) -> None:
+    """
+    Sustituye el cliente de Nominatim (p. ej. por uno contra un servidor stub) y vacía las cachés
+    """
+    global _upstream
+    _upstream = client
+    forward_cache.clear()
+    reverse_cache.clear()
+
+
+async def close_geocoding_client() -> None:
+    """Cierra las conexiones persistentes con Nominatim (shutdown de la app)"""
+    await _upstream.aclose()
+
+
+def normalize_query(location_name: str) -> str:
+    """Normaliza el texto de búsqueda para usarlo como clave de caché"""
+    return re.sub(r"\s+", " ", location_name).strip().lower()
 
 
 async def geocode_location(location_name: str) -> Optional[Tuple[float, float]]:
     """
     Obtiene las coordenadas (latitud, longitud) de una ubicación usando Nominatim (OpenStreetMap)
-    
+    Los resultados se cachean por texto normalizado y las consultas concurrentes idénticas
+    comparten una única petición a Nominatim (limitada a NOMINATIM_MAX_REQUESTS_PER_SECOND)
+
     Args:
         location_name: Nombre del país o ciudad a geocodificar
-        
+
     Returns:
         Tupla (latitud, longitud) o None si no se encuentra
     """
-    # Usar Nominatim (OpenStreetMap) - servicio gratuito
-    # Documentación: https://nominatim.org/release-docs/develop/api/Search/
-    url = "https://nominatim.openstreetmap.org/search"
-    
-    params = {
-        "q": location_name,
-        "format": "json",
-        "limit": 1,
-        "addressdetails": 1
-    }
-    
-    headers = {
-        "User-Agent": "Eventual/1.0"  # Nominatim requiere un User-Agent
-    }
-    
+    query = normalize_query(location_name)
+
+    cached = forward_cache.get(query)
+    if cached is not None:
+        return cached or None
+
+    return await _singleflight.do(("search", query), lambda: _geocode_upstream(query))
+
+
+async def _geocode_upstream(query: str) -> Optional[Tuple[float, float]]:
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, headers=headers, timeout=10.0)
-            response.raise_for_status()
-            
-            results = response.json()
-            
-            if not results or len(results) == 0:
-                logging.warning(f"No se encontraron coordenadas para: {location_name}")
-                return None
-            
-            result = results[0]
-            latitude = float(result['lat'])
-            longitude = float(result['lon'])
-            
-            logging.info(f"Geocodificado '{location_name}': ({latitude}, {longitude})")
-            return (latitude, longitude)
-            
+        await _rate_limiter.acquire()
+        results = await _upstream.search(query)
+
+        if not results or len(results) == 0:
+            logging.warning(f"No se encontraron coordenadas para: {query}")
+            forward_cache.set(query, ())
+            return None
+
+        result = results[0]
+        latitude = float(result['lat'])
+        longitude = float(result['lon'])
+
+        logging.info(f"Geocodificado '{query}': ({latitude}, {longitude})")
+        forward_cache.set(query, (latitude, longitude))
+        return (latitude, longitude)
+
     except httpx.HTTPError as e:
-        logging.error(f"Error HTTP en geocoding para '{location_name}': {str(e)}")
+        logging.error(f"Error HTTP en geocoding para '{query}': {str(e)}")
         return None
     except (KeyError, ValueError) as e:
         logging.error(f"Error al parsear respuesta de geocoding: {str(e)}")
@@ -60,39 +182,54 @@ async def geocode_location(location_name: str) -> Optional[Tuple[float, float]]:
 async def reverse_geocode(latitude: float, longitude: float) -> Optional[str]:
     """
     Obtiene el nombre de la ubicación a partir de coordenadas (reverse geocoding)
-    
+    Si hay gazetteer local (GAZETTEER_PATH) se resuelve offline; Nominatim solo se consulta
+    si no hay localidad a menos de GAZETTEER_MAX_DISTANCE_KM y GAZETTEER_NOMINATIM_FALLBACK está activo
+    Las consultas a Nominatim se cachean por coordenadas redondeadas a GEOCODING_REVERSE_DECIMALS
+
     Args:
         latitude: Latitud
         longitude: Longitud
-        
+
     Returns:
         Nombre de la ubicación o None si no se encuentra
     """
-    url = "https://nominatim.openstreetmap.org/reverse"
-    
-    params = {
-        "lat": latitude,
-        "lon": longitude,
-        "format": "json",
-        "zoom": 10
-    }
-    
-    headers = {
-        "User-Agent": "Eventual/1.0"
-    }
-    
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, headers=headers, timeout=10.0)
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            if 'display_name' in result:
-                return result['display_name']
-            
+    gazetteer = get_gazetteer()
+    if gazetteer is not None:
+        localidad = gazetteer.nearest(latitude, longitude)
+        if localidad is not None and localidad.distancia_km <= settings.GAZETTEER_MAX_DISTANCE_KM:
+            return localidad.display_name
+        if not settings.GAZETTEER_NOMINATIM_FALLBACK:
             return None
-            
+
+    key = (
+        round(latitude, settings.GEOCODING_REVERSE_DECIMALS),
+        round(longitude, settings.GEOCODING_REVERSE_DECIMALS)
+    )
+
+    cached = reverse_cache.get(key)
+    if cached is not None:
+        return cached or None
+
+    return await _singleflight.do(("reverse", key), lambda: _reverse_upstream(*key))
+
+
+async def reverse_geocode_batch(points: List[Tuple[float, float]]) -> List[Optional[str]]:
+    """
+    Reverse geocoding de varios puntos (latitud, longitud), en el mismo orden
+    Los puntos que resuelve el gazetteer local no esperan a los que van a Nominatim
+    """
+    return await asyncio.gather(*(reverse_geocode(latitude, longitude) for latitude, longitude in points))
+
+
+async def _reverse_upstream(latitude: float, longitude: float) -> Optional[str]:
+    try:
+        await _rate_limiter.acquire()
+        result = await _upstream.reverse(latitude, longitude)
+
+        name = result.get('display_name') or ""
+        reverse_cache.set((latitude, longitude), name)
+        return name or None
+
     except Exception as e:
         logging.error(f"Error en reverse geocoding: {str(e)}")
         return None
@@ -0,0 +1,170 @@
+"""
+Codificación geohash (base32) de coordenadas
+
+Un geohash de n caracteres identifica una celda rectangular; los prefijos de un
+geohash son las celdas que la contienen, así que agrupar o filtrar por prefijo
+equivale a agrupar o filtrar por zona. Precisión aproximada por longitud:
+5 → ~4.9 km, 6 → ~1.2 km, 7 → ~150 m, 8 → ~38 m.
+"""
+import math
+from typing import List, Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+# Carácter inmediatamente posterior a "z": [g, g + FIN_RANGO) son los geohash que empiezan por g
+FIN_RANGO = "{"
+
+
+def encode(latitud: float, longitud: float, precision: int = 9) -> str:
+    """Geohash de `precision` caracteres del punto"""
+    lat_min, lat_max = -90.0, 90.0
+    lon_min, lon_max = -180.0, 180.0
+    chars = []
+    bits = 0
+    valor = 0
+    es_longitud = True  # Los bits alternan longitud/latitud empezando por longitud
+
+    while len(chars) < precision:
+        if es_longitud:
+            mid = (lon_min + lon_max) / 2
+            if longitud >= mid:
+                valor = (valor << 1) | 1
+                lon_min = mid
+            else:
+                valor <<= 1
+                lon_max = mid
+        else:
+            mid = (lat_min + lat_max) / 2
+            if latitud >= mid:
+                valor = (valor << 1) | 1
+                lat_min = mid
+            else:
+                valor <<= 1
+                lat_max = mid
+        es_longitud = not es_longitud
+
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[valor])
+            bits = 0
+            valor = 0
+
+    return "".join(chars)
+
+
+def bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """Celda del geohash como (lat_min, lon_min, lat_max, lon_max)"""
+    lat_min, lat_max = -90.0, 90.0
+    lon_min, lon_max = -180.0, 180.0
+    es_longitud = True
+
+    for c in geohash:
+        try:
+            valor = _DECODE[c]
+        except KeyError:
+            raise ValueError(f"Carácter de geohash no válido: {c!r}")
+        for shift in range(4, -1, -1):
+            bit = (valor >> shift) & 1
+            if es_longitud:
+                mid = (lon_min + lon_max) / 2
+                if bit:
+                    lon_min = mid
+                else:
+                    lon_max = mid
+            else:
+                mid = (lat_min + lat_max) / 2
+                if bit:
+                    lat_min = mid
+                else:
+                    lat_max = mid
+            es_longitud = not es_longitud
+
+    return lat_min, lon_min, lat_max, lon_max
+
+
+def decode(geohash: str) -> Tuple[float, float]:
+    """Centro (latitud, longitud) de la celda del geohash"""
+    lat_min, lon_min, lat_max, lon_max = bounds(geohash)
+    return (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+
+
+def tamano_celda(precision: int) -> Tuple[float, float]:
+    """Alto y ancho en grados (lat, lon) de una celda de `precision` caracteres"""
+    bits = 5 * precision
+    bits_lon = (bits + 1) // 2
+    bits_lat = bits // 2
+    return 180.0 / (1 << bits_lat), 360.0 / (1 << bits_lon)
+
+
+def vecinas(geohash: str) -> List[str]:
+    """Las 8 celdas de la misma precisión que rodean la celda (menos junto a los polos)"""
+    precision = len(geohash)
+    alto, ancho = tamano_celda(precision)
+    latitud, longitud = decode(geohash)
+    celdas = []
+    for dlat in (alto, 0.0, -alto):
+        lat = latitud + dlat
+        if not -90.0 < lat < 90.0:
+            continue
+        for dlon in (-ancho, 0.0, ancho):
+            if dlat or dlon:
+                lon = (longitud + dlon + 180.0) % 360.0 - 180.0  # Da la vuelta en el antimeridiano
+                celdas.append(encode(lat, lon, precision))
+    return [celda for celda in dict.fromkeys(celdas) if celda != geohash]
+
+
+def precision_para_zoom(zoom: int, maxima: int = 9) -> int:
+    """
+    Precisión de geohash adecuada para agrupar marcadores en un mapa web con ese zoom
+    Da celdas de aproximadamente un cuarto de tesela (~64 px) de ancho
+    """
+    return max(1, min(maxima, round(2 * (zoom + 2) / 5)))
+
+
+def celdas_bbox(
+    lat_min: float,
+    lon_min: float,
+    lat_max: float,
+    lon_max: float,
+    precision: int
+) -> List[str]:
+    """
+    Geohash de `precision` caracteres de todas las celdas que cortan el rectángulo
+    El rectángulo no debe cruzar el antimeridiano (dividirlo antes en dos)
+    """
+    alto, ancho = tamano_celda(precision)
+    # Índices de celda en la rejilla global; se codifica el centro de cada una
+    fila_min = math.floor((lat_min + 90.0) / alto)
+    fila_max = min(math.floor((lat_max + 90.0) / alto), (1 << (5 * precision // 2)) - 1)
+    col_min = math.floor((lon_min + 180.0) / ancho)
+    col_max = min(math.floor((lon_max + 180.0) / ancho), (1 << ((5 * precision + 1) // 2)) - 1)
+
+    return [
+        encode(-90.0 + (fila + 0.5) * alto, -180.0 + (col + 0.5) * ancho, precision)
+        for fila in range(fila_min, fila_max + 1)
+        for col in range(col_min, col_max + 1)
+    ]
+
+
+def cobertura_bbox(
+    lat_min: float,
+    lon_min: float,
+    lat_max: float,
+    lon_max: float,
+    max_celdas: int = 32,
+    precision_maxima: int = 9
+) -> List[str]:
+    """
+    Conjunto pequeño de prefijos de geohash que cubre el rectángulo: la precisión más fina
+    (hasta precision_maxima) con la que bastan max_celdas celdas
+    """
+    cubierta = [""]  # Precisión 0: el prefijo vacío cubre el mundo entero
+    for precision in range(1, precision_maxima + 1):
+        alto, ancho = tamano_celda(precision)
+        n = (math.floor((lat_max + 90.0) / alto) - math.floor((lat_min + 90.0) / alto) + 1) * \
+            (math.floor((lon_max + 180.0) / ancho) - math.floor((lon_min + 180.0) / ancho) + 1)
+        if n > max_celdas:
+            break
+        cubierta = celdas_bbox(lat_min, lon_min, lat_max, lon_max, precision)
+    return cubierta
@@ -0,0 +1,83 @@
+"""
+Lectura de ficheros NDJSON (una reseña JSON por línea) para la importación masiva
+
+Las líneas se extraen de un flujo de trozos de bytes (el cuerpo de la petición o un
+fichero) según llegan, sin leer el fichero entero: en memoria solo está la línea en
+curso, y una línea más larga que el máximo se descarta sin acumularla.
+"""
+import json
+from typing import AsyncIterator, Optional, Tuple, Type, TypeVar
+from pydantic import BaseModel, ValidationError
+
+M = TypeVar("M", bound=BaseModel)
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def leer_lineas(
+    chunks: AsyncIterator[bytes],
+    max_bytes: int
+) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    (número de línea desde 1, contenido sin el salto de línea) de cada línea del flujo
+    El contenido es None si la línea supera max_bytes
+    """
+    numero = 0
+    pendiente = bytearray()
+    descartando = False  # Línea en curso demasiado larga: se ignora hasta el siguiente salto
+
+    async for chunk in chunks:
+        inicio = 0
+        while True:
+            fin = chunk.find(b"\n", inicio)
+            if fin == -1:
+                if not descartando:
+                    pendiente += chunk[inicio:]
+                    if len(pendiente) > max_bytes:
+                        descartando = True
+                        pendiente.clear()
+                break
+
+            numero += 1
+            if not descartando:
+                pendiente += chunk[inicio:fin]
+            if descartando or len(pendiente) > max_bytes:
+                yield numero, None
+            else:
+                yield numero, bytes(pendiente)
+            descartando = False
+            pendiente.clear()
+            inicio = fin + 1
+
+    if descartando:
+        yield numero + 1, None
+    elif pendiente.strip():
+        yield numero + 1, bytes(pendiente)
+
+
+async def leer_fichero(ruta: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Trozos de un fichero local (para la importación desde la línea de comandos)"""
+    with open(ruta, "rb") as fichero:
+        while chunk := fichero.read(chunk_size):
+            yield chunk
+
+
+def validar_fila(linea: bytes, esquema: Type[M]) -> M:
+    """
+    Valida una línea NDJSON con el esquema
+    Lanza ValueError con un mensaje legible para el informe de errores
+    """
+    try:
+        datos = json.loads(linea)
+    except ValueError as e:  # JSONDecodeError y UnicodeDecodeError
+        raise ValueError(f"JSON no válido: {e}")
+    if not isinstance(datos, dict):
+        raise ValueError("Cada línea debe ser un objeto JSON")
+
+    try:
+        return esquema.model_validate(datos)
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(parte) for parte in error['loc']) or 'fila'}: {error['msg']}"
+            for error in e.errors()
+        ))
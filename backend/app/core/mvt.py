@@ -0,0 +1,221 @@
+"""
+Teselas vectoriales Mapbox (MVT) de puntos
+
+Codificador mínimo de la especificación Mapbox Vector Tile 2.1
+(https://github.com/mapbox/vector-tile-spec) para capas de puntos, escrito
+directamente en protobuf para no añadir dependencias, y la caché de teselas
+codificadas con invalidación por tesela.
+"""
+import math
+import struct
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+EXTENT = 4096  # Resolución de la rejilla de coordenadas dentro de la tesela
+BUFFER = 64  # Margen (en unidades de EXTENT) para no recortar símbolos en los bordes
+MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+_TIPO_PUNTO = 1
+_CMD_MOVE_TO = 1
+
+Tesela = Tuple[int, int, int]
+
+
+# --- Geometría de teselas (Web Mercator, esquema XYZ) ---
+
+def tesela_valida(z: int, x: int, y: int) -> bool:
+    return z >= 0 and 0 <= x < (1 << z) and 0 <= y < (1 << z)
+
+
+def _mercator(latitud: float, longitud: float) -> Tuple[float, float]:
+    """Coordenadas normalizadas [0, 1) de Web Mercator; y crece hacia el sur"""
+    latitud = max(-85.05112878, min(85.05112878, latitud))
+    lat = math.radians(latitud)
+    mx = (longitud + 180.0) / 360.0
+    my = (1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0
+    return mx, my
+
+
+def teselas_de_punto(latitud: float, longitud: float, z: int, buffer: int = BUFFER) -> List[Tesela]:
+    """
+    Teselas de nivel z en las que aparece el punto: la que lo contiene y, si cae a menos
+    de `buffer` unidades de un borde, también las vecinas (lo incluyen en su margen)
+    """
+    n = 1 << z
+    mx, my = _mercator(latitud, longitud)
+    margen = buffer / EXTENT
+    xs = {min(int(mx * n + d), n - 1) for d in (-margen, 0.0, margen) if 0 <= mx * n + d}
+    ys = {min(int(my * n + d), n - 1) for d in (-margen, 0.0, margen) if 0 <= my * n + d}
+    return [(z, x, y) for x in xs for y in ys]
+
+
+def bbox_tesela(z: int, x: int, y: int, buffer: int = 0) -> Tuple[float, float, float, float]:
+    """Rectángulo (lat_min, lon_min, lat_max, lon_max) de la tesela, ampliado en `buffer` unidades"""
+    n = 1 << z
+    margen = buffer / EXTENT
+
+    def lon(tx: float) -> float:
+        return max(-180.0, min(180.0, tx / n * 360.0 - 180.0))
+
+    def lat(ty: float) -> float:
+        ty = max(0.0, min(float(n), ty))
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return lat(y + 1 + margen), lon(x - margen), lat(y - margen), lon(x + 1 + margen)
+
+
+# --- Codificación protobuf ---
+
+def _varint(valor: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = valor & 0x7F
+        valor >>= 7
+        if valor:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(valor: int) -> int:
+    return (valor << 1) ^ (valor >> 31)
+
+
+def _clave(campo: int, tipo: int) -> bytes:
+    return _varint((campo << 3) | tipo)
+
+
+def _bytes(campo: int, datos: bytes) -> bytes:
+    return _clave(campo, 2) + _varint(len(datos)) + datos
+
+
+def _empaquetado(campo: int, valores: Iterable[int]) -> bytes:
+    return _bytes(campo, b"".join(_varint(v) for v in valores))
+
+
+def _valor(valor: Any) -> bytes:
+    """Mensaje Value de MVT"""
+    if isinstance(valor, bool):
+        return _clave(7, 0) + _varint(int(valor))
+    if isinstance(valor, int) and valor >= 0:
+        return _clave(5, 0) + _varint(valor)
+    if isinstance(valor, (int, float)):
+        return _clave(3, 1) + struct.pack("<d", float(valor))
+    return _bytes(1, str(valor).encode("utf-8"))
+
+
+def encode_tesela_puntos(
+    capa: str,
+    z: int,
+    x: int,
+    y: int,
+    puntos: Iterable[Tuple[float, float, Dict[str, Any]]]
+) -> bytes:
+    """
+    Tesela MVT con una capa de puntos (latitud, longitud, propiedades)
+    Las propiedades se codifican con tablas de claves y valores compartidas por la capa
+    """
+    n = 1 << z
+    claves: Dict[str, int] = {}
+    valores: Dict[Tuple[type, Any], int] = {}
+    features: List[bytes] = []
+
+    for latitud, longitud, propiedades in puntos:
+        mx, my = _mercator(latitud, longitud)
+        px = round((mx * n - x) * EXTENT)
+        py = round((my * n - y) * EXTENT)
+
+        tags = []
+        for k, v in propiedades.items():
+            if v is None:
+                continue
+            tags.append(claves.setdefault(k, len(claves)))
+            tags.append(valores.setdefault((type(v), v), len(valores)))
+
+        features.append(_bytes(2, (
+            _empaquetado(2, tags)
+            + _clave(3, 0) + _varint(_TIPO_PUNTO)
+            + _empaquetado(4, ((1 << 3) | _CMD_MOVE_TO, _zigzag(px), _zigzag(py)))
+        )))
+
+    layer = (
+        _clave(15, 0) + _varint(2)
+        + _bytes(1, capa.encode("utf-8"))
+        + b"".join(features)
+        + b"".join(_bytes(3, k.encode("utf-8")) for k in claves)
+        + b"".join(_bytes(4, _valor(v)) for _, v in valores)
+        + _clave(5, 0) + _varint(EXTENT)
+    )
+    return _bytes(3, layer)
+
+
+# --- Caché de teselas ---
+
+class TileCache:
+    """
+    Caché de teselas codificadas, por (z, x, y, versión de la tesela)
+    Cada escritura sube la versión solo de las teselas que contienen el punto afectado
+    (una por nivel de zoom), así que una tesela calculada antes de la escritura
+    ya no se puede servir ni guardar aunque su cálculo termine después
+    Las versiones se guardan solo para las últimas teselas invalidadas; las olvidadas
+    pasan a la versión base, que sube al olvidar, invalidando de más pero nunca de menos
+    Es por proceso: las escrituras atendidas por otra instancia no la invalidan, así que el
+    TTL (TILE_CACHE_TTL_SECONDS, corto) acota cuánto tiempo puede servir una tesela desactualizada
+    """
+
+    def __init__(self, maxsize: int, ttl: float, max_zoom: int):
+        self.max_zoom = max_zoom
+        self._teselas: TTLCache[bytes] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._versiones: "OrderedDict[Tesela, int]" = OrderedDict()
+        self._max_versiones = maxsize * 8
+        self._reloj = 0
+        self._base = 0
+        self.invalidaciones = 0
+
+    def version(self, tesela: Tesela) -> int:
+        return self._versiones.get(tesela, self._base)
+
+    def get(self, tesela: Tesela) -> Tuple[int, Optional[bytes]]:
+        """Versión vigente de la tesela y su contenido en caché (o None)"""
+        version = self.version(tesela)
+        return version, self._teselas.get((*tesela, version))
+
+    def set(self, tesela: Tesela, version: int, datos: bytes) -> None:
+        """Guarda la tesela si nadie la ha invalidado desde que se leyó su versión"""
+        if self.version(tesela) == version:
+            self._teselas.set((*tesela, version), datos)
+
+    def invalidar_punto(self, latitud: float, longitud: float) -> None:
+        """Invalida en todos los niveles de zoom las teselas en las que aparece el punto"""
+        for z in range(self.max_zoom + 1):
+            for tesela in teselas_de_punto(latitud, longitud, z):
+                self._teselas.pop((*tesela, self.version(tesela)))
+                self._reloj += 1
+                self._versiones[tesela] = self._reloj
+                self._versiones.move_to_end(tesela)
+        self.invalidaciones += 1
+
+        while len(self._versiones) > self._max_versiones:
+            _, version = self._versiones.popitem(last=False)
+            self._base = max(self._base, version)
+
+    def clear(self) -> None:
+        self._teselas.clear()
+
+    def stats(self) -> Dict[Hashable, Any]:
+        return {
+            **self._teselas.stats(),
+            "max_zoom": self.max_zoom,
+            "invalidaciones": self.invalidaciones,
+            "versiones": len(self._versiones),
+        }
+
+
+tile_cache = TileCache(
+    maxsize=settings.TILE_CACHE_MAXSIZE,
+    ttl=settings.TILE_CACHE_TTL_SECONDS,
+    max_zoom=settings.TILE_MAX_ZOOM
+)
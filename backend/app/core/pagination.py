@@ -0,0 +1,116 @@
+"""
+Paginación por cursor (keyset)
+
+El cursor es opaco para el cliente: codifica en base64 los valores de la clave
+de ordenación del último documento devuelto, p. ej. (created_at, _id).
+La página siguiente filtra por "estrictamente después de esos valores", de modo
+que MongoDB no recorre ni descarta los documentos de las páginas anteriores.
+"""
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple, Type
+from bson import ObjectId, json_util
+from bson.errors import BSONError
+from fastapi import HTTPException, status
+
+
+def encode_cursor(*values: Any) -> str:
+    """Codifica los valores de la clave de ordenación en un cursor opaco"""
+    raw = json_util.dumps(list(values)).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: Type) -> List[Any]:
+    """
+    Decodifica un cursor generado por encode_cursor
+    Lanza 400 si el cursor está corrupto o sus valores no son de los tipos esperados
+    (también si es JSON válido con valores extendidos inválidos, p. ej. {"$oid": "zz"})
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json_util.loads(raw)
+    except (binascii.Error, ValueError, TypeError, BSONError, ArithmeticError, RecursionError):
+        values = None
+
+    if (
+        not isinstance(values, list)
+        or len(values) != len(types)
+        or not all(isinstance(v, t) for v, t in zip(values, types))
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="cursor no es válido",
+        )
+    return values
+
+
+def next_cursor(resenas: Sequence[dict], limit: int) -> Optional[str]:
+    """
+    Cursor de la página siguiente para documentos ordenados por (created_at, _id)
+    None si la página no está completa (no hay más resultados)
+    """
+    if len(resenas) < limit:
+        return None
+    last = resenas[-1]
+    return encode_cursor(last["created_at"], last["_id"])
+
+
+def decode_keyset_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, ObjectId]]:
+    """Decodifica un cursor (created_at, _id) generado por next_cursor"""
+    if not cursor:
+        return None
+    created_at, resena_id = decode_cursor(cursor, datetime, ObjectId)
+    return created_at, resena_id
+
+
+def next_search_cursor(resultados: Sequence[Tuple[dict, float]], limit: int) -> Optional[str]:
+    """
+    Cursor de la página siguiente para resultados (documento, relevancia) de la búsqueda por texto,
+    ordenados por (relevancia, created_at, _id)
+    """
+    if len(resultados) < limit:
+        return None
+    last, score = resultados[-1]
+    return encode_cursor(score, last["created_at"], last["_id"])
+
+
+def decode_search_cursor(cursor: Optional[str]) -> Optional[Tuple[float, datetime, ObjectId]]:
+    """Decodifica un cursor (relevancia, created_at, _id) generado por next_search_cursor"""
+    if not cursor:
+        return None
+    score, created_at, resena_id = decode_cursor(cursor, (int, float), datetime, ObjectId)
+    return score, created_at, resena_id
+
+
+def next_distance_cursor(
+    resenas: Sequence[dict],
+    limit: int,
+    anterior: Optional[Tuple[float, List[ObjectId]]] = None
+) -> Optional[str]:
+    """
+    Cursor de la página siguiente para resultados de $geoNear, ordenados por distancia_km
+    $geoNear no desempata reseñas a la misma distancia (mismas coordenadas, p. ej. del mismo
+    establecimiento): el cursor lleva la última distancia y los _id ya devueltos a esa distancia,
+    sumando los del cursor `anterior` si la página entera está a esa misma distancia
+    """
+    if len(resenas) < limit:
+        return None
+    distancia = resenas[-1]["distancia_km"]
+    ids = [r["_id"] for r in resenas if r["distancia_km"] == distancia]
+    if anterior and anterior[0] == distancia:
+        ids = anterior[1] + ids
+    return encode_cursor(distancia, ids)
+
+
+def decode_distance_cursor(cursor: Optional[str]) -> Optional[Tuple[float, List[ObjectId]]]:
+    """Decodifica un cursor (distancia_km, _id a esa distancia) generado por next_distance_cursor"""
+    if not cursor:
+        return None
+    distancia, ids = decode_cursor(cursor, (int, float), list)
+    if not all(isinstance(i, ObjectId) for i in ids):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="cursor no es válido",
+        )
+    return distancia, ids
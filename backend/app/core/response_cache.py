@@ -0,0 +1,400 @@
+"""
+Caché de respuestas de lectura con invalidación por etiquetas
+
+Se guardan los bytes ya serializados de la respuesta (cuerpo y cabeceras propias como
+X-Next-Cursor) con clave ruta + parámetros normalizados. Cada entrada lleva etiquetas
+de lo que contiene (la reseña, el autor, una casilla de valoración, una celda de
+geohash...) y cada escritura invalida las etiquetas de la reseña que cambia, así que
+solo se descartan las respuestas afectadas.
+
+Backends intercambiables (RESPONSE_CACHE_BACKEND):
+- memoria: LRU con TTL y tope de bytes en el proceso. En serverless cada instancia
+  tiene la suya y solo ve las invalidaciones de sus propias escrituras (las demás
+  pueden servir datos antiguos hasta el TTL)
+- mongo: colecciones compartidas por todas las instancias (cache_respuestas con
+  índice TTL y cache_etiquetas con la versión de cada etiqueta)
+
+Las etiquetas tienen versión, como las teselas de mvt.TileCache: una respuesta que
+empezó a calcularse antes de una invalidación de sus etiquetas no se guarda.
+"""
+import json
+import logging
+import math
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+from urllib.parse import urlencode
+from pymongo import UpdateOne
+from starlette.responses import Response
+from app.core import geohash
+from app.core.config import settings
+from app.models.cache import CacheEtiqueta, CacheRespuesta
+
+# --- Etiquetas ---
+
+ETIQUETA_RESENAS = "resenas"  # Cualquier alta, edición o baja (listado general)
+PRECISION_CELDA = 4  # Celdas de geohash de ~39 x 20 km para las búsquedas por zona
+MAX_CELDAS_ZONA = 64
+
+
+def etiqueta_resena(resena_id: Any) -> str:
+    return f"resena:{resena_id}"
+
+
+def etiqueta_autor(email_autor: str) -> str:
+    return f"autor:{email_autor}"
+
+
+def etiqueta_valoracion(valoracion: float) -> str:
+    return f"valoracion:{min(int(valoracion), 5)}"
+
+
+def etiquetas_rango_valoracion(min_valoracion: float, max_valoracion: float) -> List[str]:
+    return [f"valoracion:{v}" for v in range(min(int(min_valoracion), 5), min(int(max_valoracion), 5) + 1)]
+
+
+def etiquetas_resena(
+    resena_id: Any,
+    email_autor: str,
+    valoracion: float,
+    latitud: float,
+    longitud: float
+) -> Set[str]:
+    """
+    Etiquetas que invalida una escritura de la reseña: la celda se etiqueta con todos sus
+    prefijos, porque una búsqueda amplia se etiqueta con celdas más grandes (etiquetas_zona)
+    """
+    celda = geohash.encode(latitud, longitud, PRECISION_CELDA)
+    return {
+        ETIQUETA_RESENAS,
+        etiqueta_resena(resena_id),
+        etiqueta_autor(email_autor),
+        etiqueta_valoracion(valoracion),
+        *(f"celda:{celda[:n]}" for n in range(1, PRECISION_CELDA + 1)),
+    }
+
+
+def etiquetas_zona(latitud: float, longitud: float, radio_km: float) -> List[str]:
+    """Celdas de geohash (como mucho MAX_CELDAS_ZONA) que cubren el círculo de la búsqueda"""
+    dlat = radio_km / 111.32
+    coseno = math.cos(math.radians(latitud))
+    dlon = 180.0 if coseno < 1e-6 else min(180.0, radio_km / (111.32 * coseno))
+    lat_min, lat_max = max(-90.0, latitud - dlat), min(90.0, latitud + dlat)
+
+    if dlon >= 180.0:
+        rectangulos = [(-180.0, 180.0)]
+    elif longitud - dlon < -180.0:
+        rectangulos = [(longitud - dlon + 360.0, 180.0), (-180.0, longitud + dlon)]
+    elif longitud + dlon > 180.0:
+        rectangulos = [(longitud - dlon, 180.0), (-180.0, longitud + dlon - 360.0)]
+    else:
+        rectangulos = [(longitud - dlon, longitud + dlon)]
+
+    celdas = set()
+    for oeste, este in rectangulos:
+        celdas.update(geohash.cobertura_bbox(
+            lat_min, oeste, lat_max, este,
+            max_celdas=MAX_CELDAS_ZONA // len(rectangulos),
+            precision_maxima=PRECISION_CELDA
+        ))
+    return [f"celda:{celda}" for celda in sorted(celdas)]
+
+
+# --- Backends ---
+
+class CacheBackend(ABC):
+    """Almacén de respuestas serializadas con etiquetas versionadas"""
+
+    nombre = ""
+
+    @abstractmethod
+    async def get(self, clave: str) -> Optional[bytes]:
+        """Valor vigente de la clave o None"""
+
+    @abstractmethod
+    async def versiones(self, etiquetas: Iterable[str]) -> Dict[str, int]:
+        """Versión actual de cada etiqueta (se lee antes de calcular la respuesta)"""
+
+    @abstractmethod
+    async def set(self, clave: str, valor: bytes, versiones: Dict[str, int]) -> bool:
+        """Guarda el valor con sus etiquetas si ninguna ha cambiado de versión; devuelve si se guardó"""
+
+    @abstractmethod
+    async def invalidar(self, etiquetas: Iterable[str]) -> None:
+        """Sube la versión de las etiquetas y descarta las entradas que las llevan"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoriaBackend(CacheBackend):
+    """
+    LRU en memoria del proceso acotada por número de entradas y por bytes, con TTL
+    No es thread-safe: está pensada para usarse desde el event loop
+    """
+
+    nombre = "memoria"
+
+    def __init__(self, maxsize: int, max_bytes: int, ttl: float):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entradas: "OrderedDict[str, Tuple[float, bytes, Tuple[str, ...]]]" = OrderedDict()
+        self._por_etiqueta: Dict[str, Set[str]] = {}
+        # Versiones solo de las últimas etiquetas invalidadas; las olvidadas pasan a la base
+        # (que sube al olvidar), invalidando de más pero nunca de menos
+        self._versiones: "OrderedDict[str, int]" = OrderedDict()
+        self._max_versiones = maxsize * 8
+        self._reloj = 0
+        self._base = 0
+        self.bytes = 0
+        self.invalidaciones = 0
+
+    def _version(self, etiqueta: str) -> int:
+        return self._versiones.get(etiqueta, self._base)
+
+    def _quitar(self, clave: str) -> None:
+        _, valor, etiquetas = self._entradas.pop(clave)
+        self.bytes -= len(valor)
+        for etiqueta in etiquetas:
+            claves = self._por_etiqueta.get(etiqueta)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del self._por_etiqueta[etiqueta]
+
+    async def get(self, clave: str) -> Optional[bytes]:
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        if entrada[0] < monotonic():
+            self._quitar(clave)
+            return None
+        self._entradas.move_to_end(clave)
+        return entrada[1]
+
+    async def versiones(self, etiquetas: Iterable[str]) -> Dict[str, int]:
+        return {etiqueta: self._version(etiqueta) for etiqueta in etiquetas}
+
+    async def set(self, clave: str, valor: bytes, versiones: Dict[str, int]) -> bool:
+        if len(valor) > self.max_bytes:
+            return False
+        if any(self._version(etiqueta) != version for etiqueta, version in versiones.items()):
+            return False
+
+        if clave in self._entradas:
+            self._quitar(clave)
+        self._entradas[clave] = (monotonic() + self.ttl, valor, tuple(versiones))
+        self.bytes += len(valor)
+        for etiqueta in versiones:
+            self._por_etiqueta.setdefault(etiqueta, set()).add(clave)
+
+        while len(self._entradas) > self.maxsize or self.bytes > self.max_bytes:
+            self._quitar(next(iter(self._entradas)))
+        return True
+
+    async def invalidar(self, etiquetas: Iterable[str]) -> None:
+        for etiqueta in etiquetas:
+            self._reloj += 1
+            self._versiones[etiqueta] = self._reloj
+            self._versiones.move_to_end(etiqueta)
+            for clave in list(self._por_etiqueta.get(etiqueta, ())):
+                self._quitar(clave)
+        self.invalidaciones += 1
+
+        while len(self._versiones) > self._max_versiones:
+            _, version = self._versiones.popitem(last=False)
+            self._base = max(self._base, version)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entradas),
+            "maxsize": self.maxsize,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "etiquetas": len(self._por_etiqueta),
+            "invalidaciones": self.invalidaciones,
+        }
+
+
+class MongoBackend(CacheBackend):
+    """
+    Caché compartida por todas las instancias en MongoDB
+    Entre la comprobación de versiones y la escritura de set queda una ventana mínima
+    (dos operaciones seguidas) en la que una invalidación concurrente no se detecta
+    """
+
+    nombre = "mongo"
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.invalidaciones = 0
+
+    async def get(self, clave: str) -> Optional[bytes]:
+        doc = await CacheRespuesta.get_motor_collection().find_one(
+            {"_id": clave, "expira_at": {"$gt": datetime.utcnow()}},
+            {"valor": 1}
+        )
+        return doc["valor"] if doc else None
+
+    async def versiones(self, etiquetas: Iterable[str]) -> Dict[str, int]:
+        etiquetas = list(etiquetas)
+        docs = await CacheEtiqueta.get_motor_collection().find(
+            {"_id": {"$in": etiquetas}},
+            {"version": 1}
+        ).to_list(None)
+        actuales = {doc["_id"]: doc["version"] for doc in docs}
+        return {etiqueta: actuales.get(etiqueta, 0) for etiqueta in etiquetas}
+
+    async def set(self, clave: str, valor: bytes, versiones: Dict[str, int]) -> bool:
+        if await self.versiones(versiones) != versiones:
+            return False
+        await CacheRespuesta.get_motor_collection().replace_one(
+            {"_id": clave},
+            {
+                "valor": valor,
+                "etiquetas": list(versiones),
+                "expira_at": datetime.utcnow() + timedelta(seconds=self.ttl)
+            },
+            upsert=True
+        )
+        return True
+
+    async def invalidar(self, etiquetas: Iterable[str]) -> None:
+        etiquetas = list(etiquetas)
+        if not etiquetas:
+            return
+        # Las versiones deben sobrevivir a las respuestas que dependen de ellas
+        expira_at = datetime.utcnow() + timedelta(seconds=max(self.ttl * 10, 3600))
+        await CacheEtiqueta.get_motor_collection().bulk_write(
+            [
+                UpdateOne({"_id": etiqueta}, {"$inc": {"version": 1}, "$set": {"expira_at": expira_at}}, upsert=True)
+                for etiqueta in etiquetas
+            ],
+            ordered=False
+        )
+        await CacheRespuesta.get_motor_collection().delete_many({"etiquetas": {"$in": etiquetas}})
+        self.invalidaciones += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ttl": self.ttl, "invalidaciones": self.invalidaciones}
+
+
+# --- Caché de respuestas ---
+
+class ResponseCache:
+    """
+    Caché de respuestas JSON sobre un backend (None = desactivada)
+    Un fallo del backend nunca hace fallar la petición: se responde sin caché
+    """
+
+    CABECERAS = ("X-Next-Cursor",)  # Cabeceras propias que forman parte de la respuesta cacheada
+
+    def __init__(self, backend: Optional[CacheBackend]):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.rechazadas = 0  # Respuestas no guardadas por una invalidación durante su cálculo
+        self.errores = 0
+        self.bytes_servidos = 0
+
+    @staticmethod
+    def clave(ruta: str, params: Mapping[str, Any]) -> str:
+        """Clave normalizada: ruta + parámetros ordenados por nombre, sin los que son None"""
+        return f"{ruta}?{urlencode(sorted((k, str(v)) for k, v in params.items() if v is not None))}"
+
+    @staticmethod
+    def _empaquetar(respuesta: Response) -> bytes:
+        cabeceras = {k: respuesta.headers[k] for k in ResponseCache.CABECERAS if k in respuesta.headers}
+        return json.dumps(cabeceras).encode() + b"\n" + respuesta.body
+
+    @staticmethod
+    def _desempaquetar(valor: bytes) -> Response:
+        cabeceras, cuerpo = valor.split(b"\n", 1)
+        return Response(content=cuerpo, media_type="application/json", headers=json.loads(cabeceras))
+
+    async def responder(
+        self,
+        ruta: str,
+        params: Mapping[str, Any],
+        etiquetas: Iterable[str],
+        calcular: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        """
+        Respuesta cacheada para (ruta, params) o, si no la hay, la calculada con `calcular`,
+        que se guarda con `etiquetas` si es un 200 (las excepciones no se cachean)
+        Cabecera X-Cache: HIT o MISS
+        """
+        if self.backend is None:
+            return await calcular()
+
+        clave = self.clave(ruta, params)
+        versiones = None
+        try:
+            valor = await self.backend.get(clave)
+            if valor is not None:
+                self.hits += 1
+                self.bytes_servidos += len(valor)
+                respuesta = self._desempaquetar(valor)
+                respuesta.headers["X-Cache"] = "HIT"
+                return respuesta
+            versiones = await self.backend.versiones(etiquetas)
+        except Exception as e:
+            self.errores += 1
+            logging.warning(f"Caché de respuestas no disponible ({self.backend.nombre}): {str(e)}")
+
+        self.misses += 1
+        respuesta = await calcular()
+
+        if versiones is not None and respuesta.status_code == 200:
+            try:
+                if not await self.backend.set(clave, self._empaquetar(respuesta), versiones):
+                    self.rechazadas += 1
+            except Exception as e:
+                self.errores += 1
+                logging.warning(f"Error al guardar en la caché de respuestas: {str(e)}")
+
+        respuesta.headers["X-Cache"] = "MISS"
+        return respuesta
+
+    async def invalidar(self, etiquetas: Iterable[str]) -> None:
+        """Invalida las respuestas con alguna de las etiquetas (llamar en cada escritura)"""
+        if self.backend is None:
+            return
+        try:
+            await self.backend.invalidar(etiquetas)
+        except Exception as e:
+            # Las entradas afectadas se servirán hasta su TTL
+            self.errores += 1
+            logging.error(f"Error al invalidar la caché de respuestas: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend.nombre if self.backend else None,
+            **(self.backend.stats() if self.backend else {}),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "bytes_servidos": self.bytes_servidos,
+            "rechazadas": self.rechazadas,
+            "errores": self.errores,
+        }
+
+
+def _crear_backend() -> Optional[CacheBackend]:
+    if settings.RESPONSE_CACHE_BACKEND == "memoria":
+        return MemoriaBackend(
+            maxsize=settings.RESPONSE_CACHE_MAXSIZE,
+            max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+            ttl=settings.RESPONSE_CACHE_TTL_SECONDS
+        )
+    if settings.RESPONSE_CACHE_BACKEND == "mongo":
+        return MongoBackend(ttl=settings.RESPONSE_CACHE_TTL_SECONDS)
+    return None
+
+
+response_cache = ResponseCache(_crear_backend())
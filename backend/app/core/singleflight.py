@@ -0,0 +1,118 @@
+"""
+Single-flight: agrupa llamadas concurrentes idénticas en una sola ejecución
+
+Si llega una llamada con la misma clave mientras otra está en curso, espera el
+resultado de la primera en lugar de lanzar su propia operación. En cuanto la
+operación termina la clave se libera: no se sirven resultados antiguos.
+"""
+import asyncio
+import hmac
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _Vuelo:
+    """Operación en curso y número de llamadas que se le han unido"""
+    __slots__ = ("task", "esperando")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.esperando = 0
+
+
+class SingleFlight:
+    """
+    Agrupa por clave las llamadas concurrentes a una misma operación asíncrona
+    Con max_waiters, a una operación en curso se le unen como mucho ese número de llamadas;
+    la siguiente lanza otra operación, a la que se unen las que lleguen después
+    Lleva estadísticas por clave de las últimas max_claves_stats claves usadas
+    """
+
+    def __init__(self, max_waiters: Optional[int] = None, max_claves_stats: int = 256):
+        self.max_waiters = max_waiters
+        self.max_claves_stats = max_claves_stats
+        self._inflight: Dict[Hashable, _Vuelo] = {}
+        self._stats: "OrderedDict[Hashable, Dict[str, int]]" = OrderedDict()
+        self.llamadas = 0
+        self.ejecuciones = 0
+        self.compartidas = 0
+        self.desbordes = 0  # Operaciones extra lanzadas por llegar a max_waiters
+        self._sal = os.urandom(16)  # Clave del HMAC de las claves en stats(), distinta en cada proceso
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        stats = self._stats_clave(key)
+        stats["llamadas"] += 1
+        self.llamadas += 1
+
+        vuelo = self._inflight.get(key)
+        lleno = vuelo is not None and self.max_waiters is not None and vuelo.esperando >= self.max_waiters
+        if vuelo is None or lleno:
+            vuelo = _Vuelo(asyncio.ensure_future(fn()))
+            self._inflight[key] = vuelo
+            vuelo.task.add_done_callback(lambda t, v=vuelo: self._release(key, v))
+            stats["ejecuciones"] += 1
+            self.ejecuciones += 1
+            if lleno:
+                self.desbordes += 1
+        else:
+            vuelo.esperando += 1
+            stats["compartidas"] += 1
+            stats["max_esperando"] = max(stats["max_esperando"], vuelo.esperando)
+            self.compartidas += 1
+
+        # shield: si un llamador se cancela, la operación sigue para el resto
+        return await asyncio.shield(vuelo.task)
+
+    def olvidar(self) -> None:
+        """
+        Las llamadas siguientes ya no se unen a las operaciones en curso (que terminan
+        para quienes ya las esperan); llamar tras una escritura que cambie los resultados
+        """
+        self._inflight.clear()
+
+    def _release(self, key: Hashable, vuelo: _Vuelo) -> None:
+        if self._inflight.get(key) is vuelo:
+            del self._inflight[key]
+        if not vuelo.task.cancelled():
+            vuelo.task.exception()  # Marca la excepción como recogida aunque no quede nadie esperando
+
+    def _stats_clave(self, key: Hashable) -> Dict[str, int]:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = {"llamadas": 0, "ejecuciones": 0, "compartidas": 0, "max_esperando": 0}
+            while len(self._stats) > self.max_claves_stats:
+                self._stats.popitem(last=False)
+        else:
+            self._stats.move_to_end(key)
+        return stats
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def stats(self, top: int = 20) -> Dict[str, Any]:
+        """
+        Totales y las `top` claves con más llamadas compartidas
+        Las claves llevan datos de usuarios (búsquedas, coordenadas): se identifican solo por
+        la operación (primer elemento de la tupla) y un HMAC con una clave aleatoria del proceso,
+        que no se puede invertir probando búsquedas o coordenadas habituales
+        """
+        claves = sorted(self._stats.items(), key=lambda item: item[1]["compartidas"], reverse=True)[:top]
+        return {
+            "en_curso": len(self._inflight),
+            "max_waiters": self.max_waiters,
+            "llamadas": self.llamadas,
+            "ejecuciones": self.ejecuciones,
+            "compartidas": self.compartidas,
+            "desbordes": self.desbordes,
+            "claves": [
+                {
+                    "operacion": clave[0] if isinstance(clave, tuple) and clave else None,
+                    "clave": hmac.new(self._sal, repr(clave).encode(), "sha256").hexdigest()[:16],
+                    **stats
+                }
+                for clave, stats in claves
+            ],
+        }
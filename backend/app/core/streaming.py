@@ -0,0 +1,24 @@
+"""
+Respuestas en streaming que liberan sus recursos aunque el cliente se desconecte
+
+StreamingResponse deja de iterar el cuerpo cuando el cliente se va, pero no siempre
+cierra el generador: con ASGI >= 2.4 (el envío falla con OSError) queda pendiente
+hasta que lo recoge el recolector de basura, y con él los cursores de MongoDB que
+tenga abiertos, que siguen vivos en el servidor hasta su timeout (10 minutos).
+"""
+import anyio
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse que cierra siempre el generador del cuerpo (aclose) al terminar"""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                with anyio.CancelScope(shield=True):
+                    await aclose()
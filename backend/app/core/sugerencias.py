@@ -0,0 +1,169 @@
+"""
+Índice en memoria para autocompletar nombres de establecimientos
+
+Cada nombre distinto (normalizado sin tildes ni mayúsculas) se guarda en un array
+ordenado una vez por cada palabra en la que empieza, de modo que "cen" encuentra
+tanto "Central Burger" como "Café Central". La búsqueda es un bisect sobre ese
+array más una selección de los k nombres con más reseñas entre las coincidencias.
+Se construye en la primera búsqueda (no al arrancar: retrasaría cada arranque en frío
+en serverless con un $group sobre toda la colección) y desde entonces se mantiene al día
+con cada alta, edición y borrado que atiende este proceso. Las escrituras de otras
+instancias no llegan: el índice se reconstruye cada SUGERENCIAS_TTL_SECONDS.
+"""
+import asyncio
+import heapq
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from app.core.config import settings
+from app.core.texto import normalizar_texto
+
+# Mayor que cualquier carácter de un texto normalizado: cota superior del rango de un prefijo
+_FIN_PREFIJO = "\U0010ffff"
+
+
+class IndiceSugerencias:
+    """Nombres de establecimiento distintos con su número de reseñas, buscables por prefijo"""
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl  # Segundos hasta reconstruir (None: nunca)
+        self._claves: List[Tuple[str, str]] = []  # (sufijo desde una palabra, nombre normalizado)
+        self._variantes: Dict[str, Counter] = {}  # nombre normalizado -> escrituras originales y su uso
+        self._totales: Dict[str, int] = {}  # nombre normalizado -> número de reseñas
+        self.construido = False
+        self._construido_en = 0.0
+        self._pendientes: Optional[List[Tuple[str, int]]] = None  # Cambios recibidos durante una construcción
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _sufijos(normalizado: str) -> List[str]:
+        palabras = normalizado.split()
+        return [" ".join(palabras[i:]) for i in range(len(palabras))]
+
+    def construir(self, conteos: Iterable[Tuple[str, int]]) -> None:
+        """Reconstruye el índice a partir de pares (nombre_establecimiento, número de reseñas)"""
+        variantes: Dict[str, Counter] = {}
+        for nombre, total in conteos:
+            normalizado = normalizar_texto(nombre)
+            if normalizado and total > 0:
+                variantes.setdefault(normalizado, Counter())[nombre] += total
+
+        self._variantes = variantes
+        self._totales = {normalizado: sum(c.values()) for normalizado, c in variantes.items()}
+        self._claves = sorted(
+            (sufijo, normalizado)
+            for normalizado in variantes
+            for sufijo in self._sufijos(normalizado)
+        )
+        self.construido = True
+        self._construido_en = time.monotonic()
+
+    @property
+    def vigente(self) -> bool:
+        """Construido y sin superar el TTL"""
+        return self.construido and (self.ttl is None or time.monotonic() - self._construido_en < self.ttl)
+
+    async def asegurar(self, cargar: Callable[[], Awaitable[Iterable[Tuple[str, int]]]]) -> None:
+        """
+        Construye el índice con los conteos que devuelve `cargar` si no está construido o ha
+        superado el TTL. Las búsquedas simultáneas durante la construcción esperan a la misma carga
+        Los cambios que llegan mientras `cargar` está en curso se guardan y se aplican después,
+        porque la carga puede haber leído la colección antes de esas escrituras (si ya las
+        incluía quedan contadas de más hasta la siguiente reconstrucción)
+        """
+        if self.vigente:
+            return
+        async with self._lock:
+            if self.vigente:
+                return
+            self._pendientes = []
+            try:
+                conteos = await cargar()
+            except BaseException:
+                self._pendientes = None
+                raise
+            pendientes, self._pendientes = self._pendientes, None
+            self.construir(conteos)
+            for nombre, cantidad in pendientes:
+                self.anadir(nombre, cantidad)
+
+    def anadir(self, nombre: str, cantidad: int = 1) -> None:
+        """
+        Suma `cantidad` reseñas al establecimiento (negativo para restar)
+        Sin efecto si el índice aún no está construido ni construyéndose: la construcción ya
+        leerá la reseña de MongoDB
+        """
+        normalizado = normalizar_texto(nombre)
+        if not normalizado:
+            return
+        if self._pendientes is not None:
+            self._pendientes.append((nombre, cantidad))
+        if not self.construido:
+            return
+
+        variantes = self._variantes.get(normalizado)
+        if variantes is None:
+            if cantidad <= 0:
+                return
+            variantes = self._variantes[normalizado] = Counter()
+            self._totales[normalizado] = 0
+            for sufijo in self._sufijos(normalizado):
+                insort(self._claves, (sufijo, normalizado))
+
+        variantes[nombre] += cantidad
+        if variantes[nombre] <= 0:
+            del variantes[nombre]
+        self._totales[normalizado] += cantidad
+
+        if self._totales[normalizado] <= 0 or not variantes:
+            self._eliminar(normalizado)
+
+    def quitar(self, nombre: str) -> None:
+        """Resta una reseña al establecimiento"""
+        self.anadir(nombre, -1)
+
+    def renombrar(self, anterior: str, nuevo: str) -> None:
+        """Mueve una reseña de un nombre de establecimiento a otro"""
+        if anterior != nuevo:
+            self.quitar(anterior)
+            self.anadir(nuevo)
+
+    def _eliminar(self, normalizado: str) -> None:
+        del self._variantes[normalizado]
+        del self._totales[normalizado]
+        for sufijo in self._sufijos(normalizado):
+            i = bisect_left(self._claves, (sufijo, normalizado))
+            if i < len(self._claves) and self._claves[i] == (sufijo, normalizado):
+                del self._claves[i]
+
+    def buscar(self, prefijo: str, k: int = 10) -> List[Tuple[str, int]]:
+        """
+        Hasta k establecimientos con alguna palabra que empiece por el prefijo (la última palabra
+        puede estar a medias), como (nombre, número de reseñas), de más a menos reseñas
+        """
+        consulta = normalizar_texto(prefijo)
+        if not consulta:
+            return []
+
+        inicio = bisect_left(self._claves, (consulta,))
+        fin = bisect_left(self._claves, (consulta + _FIN_PREFIJO,), lo=inicio)
+        candidatos = {normalizado for _, normalizado in self._claves[inicio:fin]}
+
+        mejores = heapq.nsmallest(k, candidatos, key=lambda n: (-self._totales[n], n))
+        return [(self._variantes[n].most_common(1)[0][0], self._totales[n]) for n in mejores]
+
+    def __len__(self) -> int:
+        return len(self._totales)
+
+    def stats(self) -> dict:
+        return {
+            "construido": self.construido,
+            "vigente": self.vigente,
+            "pendientes": len(self._pendientes) if self._pendientes is not None else 0,
+            "establecimientos": len(self._totales),
+            "claves": len(self._claves)
+        }
+
+
+indice_sugerencias = IndiceSugerencias(ttl=settings.SUGERENCIAS_TTL_SECONDS)
@@ -0,0 +1,39 @@
+"""
+Normalización de texto para búsquedas
+
+Los nombres y direcciones se guardan además como lista de términos normalizados
+(sin tildes, en minúsculas) para poder buscarlos por prefijo con un índice
+multikey, en lugar de usar expresiones regulares sin anclar sobre el texto original.
+"""
+import re
+import unicodedata
+from typing import Dict, List, Union
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalizar_texto(texto: str) -> str:
+    """Quita tildes y diacríticos, pasa a minúsculas y deja las palabras separadas por un espacio"""
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    sin_marcas = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(_WORD_RE.findall(sin_marcas.casefold()))
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Términos normalizados distintos del texto, en orden de aparición"""
+    return list(dict.fromkeys(normalizar_texto(texto).split()))
+
+
+def campos_busqueda(nombre_establecimiento: str, direccion: str) -> Dict[str, Union[str, List[str]]]:
+    """
+    Campos derivados de búsqueda de una reseña
+    - busqueda_nombre: nombre normalizado completo (para premiar coincidencias desde el inicio)
+    - terminos_nombre: términos del nombre (pesan más en la relevancia)
+    - terminos: términos del nombre y la dirección (campo indexado)
+    """
+    terminos_nombre = tokenizar(nombre_establecimiento)
+    return {
+        "busqueda_nombre": normalizar_texto(nombre_establecimiento),
+        "terminos_nombre": terminos_nombre,
+        "terminos": list(dict.fromkeys(terminos_nombre + tokenizar(direccion))),
+    }
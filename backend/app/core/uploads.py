@@ -0,0 +1,191 @@
+"""
+Recepción de ficheros multipart en streaming
+
+El cuerpo de la petición se procesa a trozos según llega: cada fichero se escribe
+en un SpooledTemporaryFile (en memoria hasta 1MB, después en disco) y el límite de
+tamaño se comprueba con cada trozo, de modo que una subida demasiado grande se
+rechaza sin haberla leído entera y nunca se construye una copia completa en RAM.
+El SHA-256 del contenido se calcula sobre la marcha para deduplicar imágenes.
+"""
+import hashlib
+from dataclasses import dataclass, field
+from tempfile import SpooledTemporaryFile
+from typing import List, Optional
+from fastapi import HTTPException, Request, status
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+SPOOL_MAX_SIZE = 1024 * 1024  # Hasta 1MB por fichero en memoria, el resto a disco
+MULTIPART_OVERHEAD = 64 * 1024  # Margen para cabeceras y boundaries al validar Content-Length
+
+
+@dataclass
+class ArchivoRecibido:
+    """Fichero recibido en una petición multipart, ya volcado a un fichero temporal"""
+    field_name: str
+    filename: str
+    content_type: str
+    file: SpooledTemporaryFile
+    size: int = 0
+    error: Optional[str] = None  # Motivo de rechazo si no se aborta la petición entera
+    hasher: "hashlib._Hash" = field(default_factory=hashlib.sha256, repr=False)
+
+    @property
+    def sha256(self) -> str:
+        """Digest SHA-256 del contenido, calculado mientras se recibía"""
+        return self.hasher.hexdigest()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _StreamingMultipartParser:
+    """
+    Callbacks de python-multipart que vuelcan cada fichero a disco a medida que llega
+    """
+
+    def __init__(self, max_bytes: int, max_files: int, error_tamano: str, abortar_si_excede: bool):
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.error_tamano = error_tamano
+        self.abortar_si_excede = abortar_si_excede
+        self.archivos: List[ArchivoRecibido] = []
+        self._actual: Optional[ArchivoRecibido] = None
+        self._headers: dict = {}
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_part_begin(self) -> None:
+        self._actual = None
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"filename" not in options:
+            return  # Campo de formulario normal: se ignora
+
+        if len(self.archivos) >= self.max_files:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"No se pueden subir más de {self.max_files} archivos a la vez"
+            )
+
+        self._actual = ArchivoRecibido(
+            field_name=options.get(b"name", b"").decode("utf-8", errors="replace"),
+            filename=options[b"filename"].decode("utf-8", errors="replace"),
+            content_type=self._headers.get(b"content-type", b"").decode("latin-1"),
+            file=SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        )
+        self.archivos.append(self._actual)
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._actual is None or self._actual.error:
+            return
+        self._actual.size += end - start
+        if self._actual.size > self.max_bytes:
+            if self.abortar_si_excede:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=self.error_tamano
+                )
+            # Se marca el fichero como erróneo y se descarta el resto de sus bytes
+            self._actual.error = self.error_tamano
+            self._actual.file.truncate(0)
+            return
+        chunk = data[start:end]
+        self._actual.hasher.update(chunk)
+        self._actual.file.write(chunk)
+
+    def on_part_end(self) -> None:
+        if self._actual is not None:
+            self._actual.file.seek(0)
+        self._actual = None
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+
+async def recibir_archivos(
+    request: Request,
+    *,
+    max_bytes: int,
+    max_files: int = 1,
+    error_tamano: str = "El archivo es demasiado grande",
+    abortar_si_excede: bool = True
+) -> List[ArchivoRecibido]:
+    """
+    Lee en streaming los ficheros de una petición multipart/form-data
+
+    Args:
+        request: Petición entrante (el cuerpo aún no se ha leído)
+        max_bytes: Tamaño máximo por fichero; se comprueba según llegan los bytes
+        max_files: Número máximo de ficheros en la petición
+        error_tamano: Mensaje de error si un fichero supera max_bytes
+        abortar_si_excede: Si es True un fichero demasiado grande aborta la petición (400);
+            si es False se marca ese fichero con `error` y se siguen leyendo los demás
+
+    Returns:
+        Ficheros recibidos, posicionados al inicio. El llamador debe cerrarlos
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Se esperaba un cuerpo multipart/form-data"
+        )
+
+    # Rechazo inmediato si el cliente ya anuncia un cuerpo imposible
+    content_length = request.headers.get("content-length")
+    if abortar_si_excede and content_length and content_length.isdigit():
+        if int(content_length) > max_bytes * max_files + MULTIPART_OVERHEAD:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=error_tamano
+            )
+
+    handler = _StreamingMultipartParser(max_bytes, max_files, error_tamano, abortar_si_excede)
+    parser = MultipartParser(boundary, handler.callbacks())
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except MultipartParseError:
+        for archivo in handler.archivos:
+            archivo.close()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cuerpo multipart mal formado"
+        )
+    except Exception:
+        for archivo in handler.archivos:
+            archivo.close()
+        raise
+
+    if not handler.archivos:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No se ha recibido ningún archivo"
+        )
+
+    return handler.archivos
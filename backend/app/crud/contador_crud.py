@@ -0,0 +1,75 @@
+from typing import Awaitable, Callable, Optional
+from datetime import datetime
+from pymongo import ReturnDocument
+from app.models.contador import Contador
+
+
+class ContadorCRUD:
+    """
+    CRUD operations para Contadores
+    Los contadores se crean perezosamente (primer conteo exacto) y después se
+    mantienen con $inc en cada alta/baja, sin volver a recorrer la colección
+    Un contador con exacto=False solo acumula incrementos hasta que se reconcilia con un conteo
+    """
+    
+    @staticmethod
+    async def get(clave: str) -> Optional[int]:
+        """
+        Obtiene el valor del contador o None si todavía no tiene un conteo exacto
+        (no existe o solo lleva los incrementos recibidos antes de inicializarlo)
+        """
+        doc = await Contador.get_motor_collection().find_one(
+            {"clave": clave, "exacto": {"$ne": False}},
+            {"total": 1}
+        )
+        return doc["total"] if doc else None
+    
+    @staticmethod
+    async def inicializar(clave: str, contar: Callable[[], Awaitable[int]], intentos: int = 3) -> int:
+        """
+        Fija el contador al conteo exacto que devuelve `contar`
+        Primero se asegura el documento (upsert) para que ningún incremento concurrente se pierda,
+        y el conteo solo se guarda si el contador no ha cambiado mientras se contaba; si cambió
+        se vuelve a contar. Si ya tenía un conteo exacto no se toca
+        Devuelve el valor vigente del contador
+        """
+        coleccion = Contador.get_motor_collection()
+        total = 0
+        
+        for _ in range(intentos):
+            doc = await coleccion.find_one_and_update(
+                {"clave": clave},
+                {"$setOnInsert": {"total": 0, "exacto": False, "updated_at": datetime.utcnow()}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            if doc.get("exacto", True):
+                return doc["total"]
+            
+            total = await contar()
+            fijado = await coleccion.find_one_and_update(
+                {"clave": clave, "exacto": False, "total": doc["total"]},
+                {"$set": {"total": total, "exacto": True, "updated_at": datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER
+            )
+            if fijado:
+                return fijado["total"]
+        
+        # Escrituras continuas: se devuelve el último conteo sin fijarlo; se reintentará en la próxima lectura
+        return total
+    
+    @staticmethod
+    async def incrementar(clave: str, cantidad: int = 1) -> None:
+        """
+        Suma `cantidad` (puede ser negativa) al contador
+        Si aún no existe se crea marcado como no exacto: inicializar lo reconcilia con un conteo
+        """
+        await Contador.get_motor_collection().update_one(
+            {"clave": clave},
+            {
+                "$inc": {"total": cantidad},
+                "$set": {"updated_at": datetime.utcnow()},
+                "$setOnInsert": {"exacto": False}
+            },
+            upsert=True
+        )
@@ -0,0 +1,390 @@
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+from datetime import datetime
+from pymongo import ReturnDocument, ReplaceOne, UpdateOne
+from app.models.establecimiento import Establecimiento
+from app.models.resena import Resena
+from app.core import geohash
+from app.core.config import settings
+from app.core.texto import normalizar_texto
+
+
+def claves_candidatas(nombre_establecimiento: str, latitud: float, longitud: float) -> List[str]:
+    """
+    Claves con las que puede existir ya el establecimiento del punto: nombre normalizado +
+    geohash de su celda (la clave de un establecimiento nuevo) y de cada celda vecina
+    """
+    normalizado = normalizar_texto(nombre_establecimiento)
+    celda = geohash.encode(latitud, longitud, settings.ESTABLECIMIENTO_GEOHASH_PRECISION)
+    return [f"{normalizado}|{c}" for c in [celda, *geohash.vecinas(celda)]]
+
+
+def _distancia_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia aproximada en metros (equirectangular: basta a la escala de unas celdas)"""
+    dlon = (lon2 - lon1 + 180.0) % 360.0 - 180.0
+    x = math.radians(dlon) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371008.8 * math.hypot(x, y)
+
+
+def elegir_clave(
+    nombre_establecimiento: str,
+    latitud: float,
+    longitud: float,
+    posiciones: Dict[str, Tuple[float, float]]
+) -> str:
+    """
+    Clave del establecimiento de una reseña: la del establecimiento existente más cercano
+    (posiciones: clave -> ubicación) con el mismo nombre en su celda o las vecinas y a menos de
+    ESTABLECIMIENTO_RADIO_FUSION_M; si no hay ninguno, la clave de su celda
+    Así el mismo local reseñado a ambos lados del borde de una celda es un solo establecimiento
+    """
+    candidatas = claves_candidatas(nombre_establecimiento, latitud, longitud)
+    mejor, mejor_distancia = candidatas[0], math.inf
+    for clave in candidatas:
+        posicion = posiciones.get(clave)
+        if posicion is None:
+            continue
+        distancia = _distancia_m(latitud, longitud, *posicion)
+        if distancia <= settings.ESTABLECIMIENTO_RADIO_FUSION_M and distancia < mejor_distancia:
+            mejor, mejor_distancia = clave, distancia
+    return mejor
+
+
+def bucket_valoracion(valoracion: float) -> str:
+    """Casilla del histograma: parte entera de la valoración ("0".."5")"""
+    return str(min(int(valoracion), 5))
+
+
+class EstablecimientoCRUD:
+    """
+    CRUD operations para Establecimientos
+    Los agregados (count, sum, histograma...) se actualizan con $inc/$min/$max en una sola
+    operación atómica por alta, edición o baja de reseña; la media se fija a continuación
+    solo si el documento no ha cambiado entretanto (la escritura posterior la fija por él)
+    """
+
+    @staticmethod
+    async def get(clave: str) -> Optional[Establecimiento]:
+        """
+        Obtiene un establecimiento por su clave
+        """
+        return await Establecimiento.find_one({"clave": clave})
+
+    @staticmethod
+    async def resolver_claves(puntos: Sequence[Tuple[str, float, float]]) -> List[str]:
+        """
+        Clave de establecimiento (elegir_clave) de cada (nombre, latitud, longitud), con una sola
+        consulta de los establecimientos candidatos; los puntos del lote sin establecimiento
+        existente se agrupan entre sí en el orden recibido
+        Dos primeras reseñas simultáneas a ambos lados de un borde pueden crear dos
+        establecimientos; reconstruir() los une
+        """
+        candidatas = {clave for punto in puntos for clave in claves_candidatas(*punto)}
+        cursor = Establecimiento.get_motor_collection().find(
+            {"clave": {"$in": list(candidatas)}},
+            {"clave": 1, "latitud": 1, "longitud": 1}
+        )
+        posiciones = {doc["clave"]: (doc["latitud"], doc["longitud"]) async for doc in cursor}
+
+        claves = []
+        for nombre, latitud, longitud in puntos:
+            clave = elegir_clave(nombre, latitud, longitud, posiciones)
+            posiciones.setdefault(clave, (latitud, longitud))
+            claves.append(clave)
+        return claves
+
+    @staticmethod
+    async def resolver_clave(nombre_establecimiento: str, latitud: float, longitud: float) -> str:
+        """Clave de establecimiento de una reseña (ver resolver_claves)"""
+        return (await EstablecimientoCRUD.resolver_claves([(nombre_establecimiento, latitud, longitud)]))[0]
+
+    @staticmethod
+    async def buscar(nombre_establecimiento: str, latitud: float, longitud: float) -> Optional[Establecimiento]:
+        """Establecimiento al que se agruparía una reseña con ese nombre y ubicación, si existe"""
+        return await EstablecimientoCRUD.get(
+            await EstablecimientoCRUD.resolver_clave(nombre_establecimiento, latitud, longitud)
+        )
+
+    @staticmethod
+    async def registrar_resena(resena: Resena) -> None:
+        """
+        Suma una reseña nueva a los agregados de su establecimiento (lo crea si no existe)
+        """
+        collection = Establecimiento.get_motor_collection()
+        doc = await collection.find_one_and_update(
+            {"clave": resena.establecimiento},
+            {
+                "$inc": {
+                    "count": 1,
+                    "sum": resena.valoracion,
+                    f"histograma.{bucket_valoracion(resena.valoracion)}": 1
+                },
+                "$min": {"min": resena.valoracion},
+                "$max": {"max": resena.valoracion, "ultima_resena_at": resena.created_at},
+                "$set": {"updated_at": datetime.utcnow()},
+                "$setOnInsert": {
+                    "nombre": resena.nombre_establecimiento,
+                    "direccion": resena.direccion,
+                    "latitud": resena.latitud,
+                    "longitud": resena.longitud,
+                    "geohash": geohash.encode(resena.latitud, resena.longitud)
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        await EstablecimientoCRUD._fijar_media(doc)
+
+    @staticmethod
+    async def registrar_resenas(resenas: List[Resena]) -> None:
+        """
+        Suma un lote de reseñas nuevas a los agregados (importación masiva): una actualización
+        por establecimiento en un solo bulk_write, y la media recalculada en el servidor
+        con una actualización por pipeline sobre los establecimientos tocados
+        """
+        grupos: Dict[str, dict] = {}
+        for resena in resenas:
+            grupo = grupos.get(resena.establecimiento)
+            if grupo is None:
+                grupo = grupos[resena.establecimiento] = {
+                    "inc": {"count": 0, "sum": 0.0},
+                    "min": resena.valoracion,
+                    "max": resena.valoracion,
+                    "ultima_resena_at": resena.created_at,
+                    "primera": resena
+                }
+            bucket = f"histograma.{bucket_valoracion(resena.valoracion)}"
+            grupo["inc"]["count"] += 1
+            grupo["inc"]["sum"] += resena.valoracion
+            grupo["inc"][bucket] = grupo["inc"].get(bucket, 0) + 1
+            grupo["min"] = min(grupo["min"], resena.valoracion)
+            grupo["max"] = max(grupo["max"], resena.valoracion)
+            grupo["ultima_resena_at"] = max(grupo["ultima_resena_at"], resena.created_at)
+        
+        if not grupos:
+            return
+        
+        ahora = datetime.utcnow()
+        operaciones = []
+        for clave, grupo in grupos.items():
+            primera = grupo["primera"]
+            operaciones.append(UpdateOne(
+                {"clave": clave},
+                {
+                    "$inc": grupo["inc"],
+                    "$min": {"min": grupo["min"]},
+                    "$max": {"max": grupo["max"], "ultima_resena_at": grupo["ultima_resena_at"]},
+                    "$set": {"updated_at": ahora},
+                    "$setOnInsert": {
+                        "nombre": primera.nombre_establecimiento,
+                        "direccion": primera.direccion,
+                        "latitud": primera.latitud,
+                        "longitud": primera.longitud,
+                        "geohash": geohash.encode(primera.latitud, primera.longitud)
+                    }
+                },
+                upsert=True
+            ))
+        
+        collection = Establecimiento.get_motor_collection()
+        await collection.bulk_write(operaciones, ordered=False)
+        await collection.update_many(
+            {"clave": {"$in": list(grupos)}, "count": {"$gt": 0}},
+            [{"$set": {"avg": {"$divide": ["$sum", "$count"]}}}]
+        )
+    
+    @staticmethod
+    async def cambiar_valoracion(clave: str, anterior: float, nueva: float) -> None:
+        """
+        Actualiza los agregados cuando una reseña del establecimiento cambia de valoración
+        """
+        inc = {"sum": nueva - anterior}
+        if bucket_valoracion(anterior) != bucket_valoracion(nueva):
+            inc[f"histograma.{bucket_valoracion(anterior)}"] = -1
+            inc[f"histograma.{bucket_valoracion(nueva)}"] = 1
+
+        doc = await Establecimiento.get_motor_collection().find_one_and_update(
+            {"clave": clave},
+            {
+                "$inc": inc,
+                "$min": {"min": nueva},
+                "$max": {"max": nueva},
+                "$set": {"updated_at": datetime.utcnow()}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is None:
+            return
+
+        # Si la valoración antigua era un extremo, el nuevo extremo solo se conoce releyendo las reseñas
+        extremos = None
+        if anterior in (doc.get("min"), doc.get("max")):
+            extremos = await EstablecimientoCRUD._extremos(clave)
+        await EstablecimientoCRUD._fijar_media(doc, extremos)
+
+    @staticmethod
+    async def retirar_resena(clave: str, valoracion: float) -> None:
+        """
+        Resta una reseña ya eliminada (o movida a otro establecimiento) de los agregados
+        Si el establecimiento se queda sin reseñas se elimina
+        """
+        collection = Establecimiento.get_motor_collection()
+        doc = await collection.find_one_and_update(
+            {"clave": clave},
+            {
+                "$inc": {
+                    "count": -1,
+                    "sum": -valoracion,
+                    f"histograma.{bucket_valoracion(valoracion)}": -1
+                },
+                "$set": {"updated_at": datetime.utcnow()}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is None:
+            return
+
+        if doc["count"] <= 0:
+            await collection.delete_one({"_id": doc["_id"], "count": {"$lte": 0}})
+            return
+
+        await EstablecimientoCRUD._fijar_media(doc, await EstablecimientoCRUD._extremos(clave))
+
+    @staticmethod
+    async def _fijar_media(doc: dict, extremos: Optional[dict] = None) -> None:
+        """
+        Fija avg = sum / count (y los extremos recalculados, si los hay) sobre el estado
+        devuelto por la última actualización; si otra escritura se ha colado, no toca nada
+        Quita del histograma las casillas que se han quedado a 0 (solo si siguen a 0)
+        """
+        collection = Establecimiento.get_motor_collection()
+        valores = {"avg": doc["sum"] / doc["count"] if doc["count"] > 0 else None}
+        if extremos:
+            valores.update(extremos)
+
+        await collection.update_one(
+            {"_id": doc["_id"], "count": doc["count"], "sum": doc["sum"]},
+            {"$set": valores}
+        )
+
+        for bucket, n in doc.get("histograma", {}).items():
+            if n <= 0:
+                await collection.update_one(
+                    {"_id": doc["_id"], f"histograma.{bucket}": {"$lte": 0}},
+                    {"$unset": {f"histograma.{bucket}": ""}}
+                )
+
+    @staticmethod
+    async def _extremos(clave: str) -> Optional[dict]:
+        """
+        Valoración mínima y máxima y fecha de la última reseña, recalculadas desde las reseñas
+        """
+        docs = await Resena.aggregate([
+            {"$match": {"establecimiento": clave}},
+            {
+                "$group": {
+                    "_id": None,
+                    "min": {"$min": "$valoracion"},
+                    "max": {"$max": "$valoracion"},
+                    "ultima_resena_at": {"$max": "$created_at"}
+                }
+            },
+            {"$project": {"_id": 0}}
+        ]).to_list()
+        return docs[0] if docs else None
+
+    @staticmethod
+    async def reconstruir(batch_size: int = 500) -> int:
+        """
+        Recalcula desde cero la colección de establecimientos a partir de las reseñas:
+        asigna la clave de establecimiento a cada reseña y reescribe los agregados
+        Pensado para el backfill inicial o para reparar desvíos (ejecutar sin tráfico de escritura)
+        Devuelve el número de establecimientos
+        """
+        resenas = Resena.get_motor_collection()
+
+        # De la más antigua a la más reciente: cada establecimiento queda en la ubicación
+        # de su primera reseña, como al registrarlas una a una
+        posiciones: Dict[str, Tuple[float, float]] = {}
+        operaciones = []
+        cursor = resenas.find(
+            {},
+            {"nombre_establecimiento": 1, "latitud": 1, "longitud": 1, "establecimiento": 1}
+        ).sort([("created_at", 1), ("_id", 1)]).batch_size(batch_size)
+        async for doc in cursor:
+            clave = elegir_clave(doc["nombre_establecimiento"], doc["latitud"], doc["longitud"], posiciones)
+            posiciones.setdefault(clave, (doc["latitud"], doc["longitud"]))
+            if doc.get("establecimiento") != clave:
+                operaciones.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"establecimiento": clave}}))
+            if len(operaciones) >= batch_size:
+                await resenas.bulk_write(operaciones, ordered=False)
+                operaciones = []
+        if operaciones:
+            await resenas.bulk_write(operaciones, ordered=False)
+
+        inicio = datetime.utcnow()
+        establecimientos = Establecimiento.get_motor_collection()
+        total = 0
+        operaciones = []
+        agregados = await Resena.aggregate([
+            {"$sort": {"created_at": 1}},
+            {
+                "$group": {
+                    "_id": {"clave": "$establecimiento", "bucket": {"$floor": "$valoracion"}},
+                    "n": {"$sum": 1},
+                    "sum": {"$sum": "$valoracion"},
+                    "min": {"$min": "$valoracion"},
+                    "max": {"$max": "$valoracion"},
+                    "ultima_resena_at": {"$max": "$created_at"},
+                    "primera_resena_at": {"$min": "$created_at"},
+                    "nombre": {"$first": "$nombre_establecimiento"},
+                    "direccion": {"$first": "$direccion"},
+                    "latitud": {"$first": "$latitud"},
+                    "longitud": {"$first": "$longitud"}
+                }
+            },
+            {"$sort": {"primera_resena_at": 1}},
+            {
+                "$group": {
+                    "_id": "$_id.clave",
+                    "count": {"$sum": "$n"},
+                    "sum": {"$sum": "$sum"},
+                    "min": {"$min": "$min"},
+                    "max": {"$max": "$max"},
+                    "ultima_resena_at": {"$max": "$ultima_resena_at"},
+                    "histograma": {"$push": {"bucket": "$_id.bucket", "n": "$n"}},
+                    "nombre": {"$first": "$nombre"},
+                    "direccion": {"$first": "$direccion"},
+                    "latitud": {"$first": "$latitud"},
+                    "longitud": {"$first": "$longitud"}
+                }
+            }
+        ]).to_list()
+
+        for agregado in agregados:
+            histograma = {}
+            for casilla in agregado.pop("histograma"):
+                bucket = bucket_valoracion(casilla["bucket"])
+                histograma[bucket] = histograma.get(bucket, 0) + casilla["n"]
+
+            clave = agregado.pop("_id")
+            documento = {
+                **agregado,
+                "clave": clave,
+                "geohash": geohash.encode(agregado["latitud"], agregado["longitud"]),
+                "avg": agregado["sum"] / agregado["count"],
+                "histograma": histograma,
+                "updated_at": datetime.utcnow()
+            }
+            operaciones.append(ReplaceOne({"clave": clave}, documento, upsert=True))
+            total += 1
+            if len(operaciones) >= batch_size:
+                await establecimientos.bulk_write(operaciones, ordered=False)
+                operaciones = []
+        if operaciones:
+            await establecimientos.bulk_write(operaciones, ordered=False)
+
+        # Establecimientos que ya no tienen reseñas
+        await establecimientos.delete_many({"updated_at": {"$lt": inicio}})
+        return total
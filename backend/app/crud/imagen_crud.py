@@ -0,0 +1,39 @@
+from typing import Optional
+from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.models.imagen import ImagenSubida
+
+
+class ImagenCRUD:
+    """
+    CRUD operations para Imágenes subidas (deduplicación por contenido)
+    """
+    
+    @staticmethod
+    async def get_url(sha256: str) -> Optional[str]:
+        """
+        Obtiene la URL de una imagen ya subida con ese digest, o None
+        """
+        doc = await ImagenSubida.get_motor_collection().find_one({"sha256": sha256}, {"url": 1})
+        return doc["url"] if doc else None
+    
+    @staticmethod
+    async def registrar(sha256: str, url: str, size: int) -> str:
+        """
+        Registra la URL de una imagen recién subida y devuelve la URL registrada
+        Si otra petición ya registró el mismo digest se conserva y se devuelve la primera URL
+        """
+        collection = ImagenSubida.get_motor_collection()
+        try:
+            doc = await collection.find_one_and_update(
+                {"sha256": sha256},
+                {"$setOnInsert": {"url": url, "size": size, "created_at": datetime.utcnow()}},
+                projection={"url": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Dos upserts simultáneos: el índice único deja insertar solo a uno
+            doc = await collection.find_one({"sha256": sha256}, {"url": 1})
+        return doc["url"]
@@ -1,16 +1,71 @@
-from typing import List, Optional
+import re
+from collections import Counter
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Type
+import anyio
 from beanie import PydanticObjectId
-from app.models.resena import Resena
-from app.schemas.resena import ResenaCreate, ResenaUpdate
+from pydantic import BaseModel
+from pymongo import ReturnDocument, UpdateOne, DESCENDING
+from pymongo.errors import BulkWriteError
+from app.models.resena import Resena, PuntoGeoJSON
+from app.schemas.resena import (
+    ResenaCreate, ResenaUpdate, RESENA_PROYECCION, ImportacionError, ImportacionResponse
+)
+from app.crud.contador_crud import ContadorCRUD
+from app.crud.establecimiento_crud import EstablecimientoCRUD
+from app.core.texto import campos_busqueda, normalizar_texto, tokenizar
+from app.core.sugerencias import indice_sugerencias
+from app.core import geohash
+from app.core.mvt import tile_cache
+from app.core.response_cache import response_cache, etiquetas_resena
+from app.core.importacion import leer_lineas, validar_fila
+from app.core.singleflight import SingleFlight
+from app.core.config import settings
 from datetime import datetime
 
 
+# Clave de ordenación estable para listados: más recientes primero
+# (_id desempata reseñas creadas en el mismo milisegundo)
+ORDEN_RECIENTES = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+# Consultas de lectura idénticas y simultáneas (un sitio popular compartido) se agrupan en una
+# sola consulta a MongoDB; cada escritura llama a olvidar() para que las peticiones posteriores
+# no se unan a consultas lanzadas antes de ella
+consultas_singleflight = SingleFlight(max_waiters=settings.SINGLEFLIGHT_MAX_WAITERS)
+
+
+def clave_contador_autor(email_autor: str) -> str:
+    """Clave del contador de reseñas de un autor"""
+    return f"autor:{email_autor}"
+
+
+async def _compartida(clave: tuple, consulta) -> List[dict]:
+    """
+    Ejecuta la consulta con single-flight y devuelve una copia de cada documento:
+    quienes comparten el resultado lo adaptan en el sitio (resena_lectura) por separado
+    """
+    docs = await consultas_singleflight.do(clave, consulta)
+    return [dict(doc) for doc in docs]
+
+
 class ResenaCRUD:
     """
     CRUD operations para Reseñas
     Separa la lógica de acceso a datos de los endpoints
     """
     
+    @staticmethod
+    def _filtro_keyset(despues_de: Tuple[datetime, PydanticObjectId]) -> dict:
+        """
+        Filtro keyset para continuar tras el último (created_at, _id) de la página anterior
+        """
+        created_at, resena_id = despues_de
+        return {
+            "$or": [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": resena_id}}
+            ]
+        }
+    
     @staticmethod
     async def create(
         resena_data: ResenaCreate,
@@ -23,6 +78,37 @@ class ResenaCRUD:
         """
         Crea una nueva reseña
         """
+        resena = ResenaCRUD._nueva_resena(
+            resena_data, email_autor, nombre_autor, token_emision, token_caducidad, token_oauth
+        )
+        resena.establecimiento = await EstablecimientoCRUD.resolver_clave(
+            resena.nombre_establecimiento, resena.latitud, resena.longitud
+        )
+        await resena.insert()
+        consultas_singleflight.olvidar()
+        await ContadorCRUD.incrementar(clave_contador_autor(email_autor), 1)
+        await EstablecimientoCRUD.registrar_resena(resena)
+        indice_sugerencias.anadir(resena.nombre_establecimiento)
+        tile_cache.invalidar_punto(resena.latitud, resena.longitud)
+        await response_cache.invalidar(etiquetas_resena(
+            resena.id, email_autor, resena.valoracion, resena.latitud, resena.longitud
+        ))
+        return resena
+    
+    @staticmethod
+    def _nueva_resena(
+        resena_data: ResenaCreate,
+        email_autor: str,
+        nombre_autor: str,
+        token_emision: datetime,
+        token_caducidad: datetime,
+        token_oauth: str,
+        created_at: Optional[datetime] = None
+    ) -> Resena:
+        """
+        Documento de una reseña nueva con sus campos derivados (ubicación, geohash, búsqueda...)
+        salvo la clave de establecimiento, que se resuelve contra los existentes al insertarla
+        """
         resena = Resena(
             nombre_establecimiento=resena_data.nombre_establecimiento,
             direccion=resena_data.direccion,
@@ -34,84 +120,578 @@ class ResenaCRUD:
             token_emision=token_emision,
             token_caducidad=token_caducidad,
             token_oauth=token_oauth,
-            imagenes=resena_data.imagenes
+            imagenes=resena_data.imagenes,
+            ubicacion=PuntoGeoJSON.desde_coordenadas(resena_data.latitud, resena_data.longitud),
+            geohash=geohash.encode(resena_data.latitud, resena_data.longitud),
+            **campos_busqueda(resena_data.nombre_establecimiento, resena_data.direccion)
         )
-        await resena.insert()
+        if created_at is not None:
+            resena.created_at = created_at
         return resena
     
+    @staticmethod
+    async def create_many(resenas: List[Resena]) -> Dict[int, str]:
+        """
+        Inserta un lote de reseñas con un insert_many no ordenado (un fallo no detiene el resto)
+        y actualiza contadores de autor, establecimientos, sugerencias y teselas con las insertadas
+        Devuelve los errores por posición en el lote
+        """
+        if not resenas:
+            return {}
+        
+        claves = await EstablecimientoCRUD.resolver_claves(
+            [(resena.nombre_establecimiento, resena.latitud, resena.longitud) for resena in resenas]
+        )
+        for resena, clave in zip(resenas, claves):
+            resena.id = PydanticObjectId()
+            resena.establecimiento = clave
+        
+        errores: Dict[int, str] = {}
+        try:
+            await Resena.insert_many(resenas, ordered=False)
+        except BulkWriteError as e:
+            errores = {error["index"]: error["errmsg"] for error in e.details.get("writeErrors", [])}
+        consultas_singleflight.olvidar()
+        
+        insertadas = [resena for i, resena in enumerate(resenas) if i not in errores]
+        
+        for email_autor, total in Counter(resena.email_autor for resena in insertadas).items():
+            await ContadorCRUD.incrementar(clave_contador_autor(email_autor), total)
+        await EstablecimientoCRUD.registrar_resenas(insertadas)
+        etiquetas = set()
+        for resena in insertadas:
+            indice_sugerencias.anadir(resena.nombre_establecimiento)
+            tile_cache.invalidar_punto(resena.latitud, resena.longitud)
+            etiquetas |= etiquetas_resena(
+                resena.id, resena.email_autor, resena.valoracion, resena.latitud, resena.longitud
+            )
+        await response_cache.invalidar(etiquetas)
+        
+        return errores
+    
+    @staticmethod
+    async def importar(
+        chunks: AsyncIterator[bytes],
+        email_autor: Optional[str],
+        nombre_autor: Optional[str],
+        token_emision: datetime,
+        token_caducidad: datetime,
+        token_oauth: str,
+        esquema: Type[ResenaCreate] = ResenaCreate,
+        batch_size: int = 500,
+        max_bytes_linea: int = 64 * 1024,
+        max_errores: int = 1000
+    ) -> ImportacionResponse:
+        """
+        Importa reseñas desde un flujo NDJSON (una reseña por línea) validando cada fila con
+        `esquema` y escribiéndolas con create_many en lotes de batch_size
+        Memoria acotada: la línea en curso, un lote y como mucho max_errores errores detallados
+        Si el esquema trae email_autor / nombre_autor / created_at (ResenaImportacion),
+        los de la fila tienen prioridad sobre los indicados
+        """
+        informe = ImportacionResponse()
+        lote: List[Resena] = []
+        lineas_lote: List[int] = []
+        
+        def fallo(linea: int, error: str) -> None:
+            informe.fallidas += 1
+            if len(informe.errores) < max_errores:
+                informe.errores.append(ImportacionError(linea=linea, error=error))
+            else:
+                informe.errores_omitidos += 1
+        
+        async def escribir() -> None:
+            errores = await ResenaCRUD.create_many(lote)
+            informe.insertadas += len(lote) - len(errores)
+            for i, error in sorted(errores.items()):
+                fallo(lineas_lote[i], f"Error al insertar: {error}")
+            lote.clear()
+            lineas_lote.clear()
+        
+        async for numero, linea in leer_lineas(chunks, max_bytes_linea):
+            if linea is None:
+                fallo(numero, f"Línea demasiado larga (máximo {max_bytes_linea} bytes)")
+                continue
+            if not linea.strip():
+                continue
+            
+            try:
+                fila = validar_fila(linea, esquema)
+                autor = getattr(fila, "email_autor", None) or email_autor
+                if not autor:
+                    raise ValueError("email_autor: falta el autor de la reseña")
+                resena = ResenaCRUD._nueva_resena(
+                    fila,
+                    autor,
+                    getattr(fila, "nombre_autor", None) or nombre_autor or autor,
+                    token_emision,
+                    token_caducidad,
+                    token_oauth,
+                    created_at=getattr(fila, "created_at", None)
+                )
+            except ValueError as e:  # Incluye ValidationError de pydantic
+                fallo(numero, str(e))
+                continue
+            
+            lote.append(resena)
+            lineas_lote.append(numero)
+            if len(lote) >= batch_size:
+                await escribir()
+        
+        if lote:
+            await escribir()
+        return informe
+    
     @staticmethod
     async def get_all(
         skip: int = 0,
         limit: int = 100,
-        email_autor: Optional[str] = None
-    ) -> List[Resena]:
+        email_autor: Optional[str] = None,
+        despues_de: Optional[Tuple[datetime, PydanticObjectId]] = None,
+        proyeccion: Dict[str, int] = RESENA_PROYECCION
+    ) -> List[dict]:
         """
-        Obtiene todas las reseñas con paginación
+        Obtiene todas las reseñas con paginación, más recientes primero
         Si se proporciona email_autor, filtra por ese autor
+        Si se proporciona despues_de (created_at, _id), pagina por cursor e ignora skip
+        Devuelve documentos crudos con los campos de `proyeccion`
         """
-        query = Resena.find()
+        filtro = {}
         
         if email_autor:
-            query = query.find(Resena.email_autor == email_autor)
+            filtro["email_autor"] = email_autor
         
-        resenas = await query.skip(skip).limit(limit).to_list()
-        return resenas
+        if despues_de:
+            filtro.update(ResenaCRUD._filtro_keyset(despues_de))
+        
+        return await ResenaCRUD._find(filtro, skip=0 if despues_de else skip, limit=limit, proyeccion=proyeccion)
+    
+    @staticmethod
+    async def _find(filtro: dict, skip: int, limit: int, proyeccion: Dict[str, int]) -> List[dict]:
+        """Lectura proyectada, más recientes primero, sin construir modelos"""
+        cursor = Resena.get_motor_collection().find(filtro, proyeccion).sort(ORDEN_RECIENTES)
+        if skip:
+            cursor = cursor.skip(skip)
+        return await cursor.limit(limit).to_list(limit)
     
     @staticmethod
     async def count(email_autor: Optional[str] = None) -> int:
         """
         Cuenta el total de reseñas
-        Si se proporciona email_autor, cuenta solo las de ese autor
+        Sin filtro usa estimated_document_count (metadatos de la colección, sin recorrerla)
+        Si se proporciona email_autor, lee el contador del autor mantenido en create/delete
         """
-        query = Resena.find()
+        if not email_autor:
+            return await Resena.get_motor_collection().estimated_document_count()
         
-        if email_autor:
-            query = query.find(Resena.email_autor == email_autor)
+        clave = clave_contador_autor(email_autor)
+        total = await ContadorCRUD.get(clave)
         
-        return await query.count()
+        if total is None:
+            total = await ContadorCRUD.inicializar(
+                clave,
+                lambda: Resena.find(Resena.email_autor == email_autor).count()
+            )
+        
+        return total
     
     @staticmethod
-    async def get_by_id(resena_id: PydanticObjectId) -> Optional[Resena]:
+    async def get_by_id(resena_id: PydanticObjectId) -> Optional[dict]:
         """
-        Obtiene una reseña por su ID
+        Obtiene una reseña por su ID (documento crudo con los campos de RESENA_PROYECCION)
         """
-        return await Resena.get(resena_id)
+        return await Resena.get_motor_collection().find_one({"_id": resena_id}, RESENA_PROYECCION)
     
     @staticmethod
     async def get_by_establecimiento(
         nombre_establecimiento: str,
         skip: int = 0,
-        limit: int = 100
-    ) -> List[Resena]:
+        limit: int = 100,
+        despues_de: Optional[Tuple[float, datetime, PydanticObjectId]] = None,
+        proyeccion: Dict[str, int] = RESENA_PROYECCION
+    ) -> List[Tuple[dict, float]]:
         """
-        Obtiene reseñas por nombre del establecimiento (búsqueda parcial)
+        Busca reseñas por nombre del establecimiento o dirección, ordenadas por relevancia
+        Cada término de la búsqueda debe coincidir (como prefijo, sin tildes ni mayúsculas) con
+        algún término del nombre o la dirección; el filtro usa el índice multikey de `terminos`
+        Relevancia por término: 3 si es palabra exacta del nombre, 2 si es prefijo de una
+        palabra del nombre, 1 si solo aparece en la dirección; +2 si el nombre empieza por la búsqueda
+        Si se proporciona despues_de (relevancia, created_at, _id), pagina por cursor e ignora skip
+        Las búsquedas idénticas simultáneas comparten una sola consulta (single-flight)
+        Devuelve tuplas (documento crudo con los campos de `proyeccion`, relevancia)
         """
-        resenas = await Resena.find(
-            Resena.nombre_establecimiento.contains(nombre_establecimiento, case_insensitive=True)
-        ).skip(skip).limit(limit).to_list()
-        return resenas
+        consulta = normalizar_texto(nombre_establecimiento)
+        tokens = tokenizar(consulta)
+        if not tokens:
+            return []
+        if despues_de:
+            skip = 0
+        
+        docs = await _compartida(
+            ("establecimiento", consulta, skip, limit, despues_de, ",".join(proyeccion)),
+            lambda: ResenaCRUD._buscar_establecimiento(consulta, tokens, skip, limit, despues_de, proyeccion)
+        )
+        return [(doc, doc.pop("_relevancia")) for doc in docs]
+    
+    @staticmethod
+    async def _buscar_establecimiento(
+        consulta: str,
+        tokens: List[str],
+        skip: int,
+        limit: int,
+        despues_de: Optional[Tuple[float, datetime, PydanticObjectId]],
+        proyeccion: Dict[str, int]
+    ) -> List[dict]:
+        """Agregación de get_by_establecimiento; los documentos llevan _relevancia"""
+        puntuacion_tokens = [
+            {
+                "$cond": [
+                    {"$in": [token, "$terminos_nombre"]},
+                    3,
+                    {
+                        "$cond": [
+                            {
+                                "$anyElementTrue": [{
+                                    "$map": {
+                                        "input": "$terminos_nombre",
+                                        "as": "t",
+                                        "in": {"$eq": [{"$indexOfCP": ["$$t", token]}, 0]}
+                                    }
+                                }]
+                            },
+                            2,
+                            1
+                        ]
+                    }
+                ]
+            }
+            for token in tokens
+        ]
+        bonus_inicio = {
+            "$cond": [{"$eq": [{"$indexOfCP": [{"$ifNull": ["$busqueda_nombre", ""]}, consulta]}, 0]}, 2, 0]
+        }
+        
+        pipeline = [
+            {"$match": ResenaCRUD._filtro_terminos(tokens)},
+            {"$addFields": {"_relevancia": {"$add": puntuacion_tokens + [bonus_inicio]}}}
+        ]
+        
+        if despues_de:
+            score, created_at, resena_id = despues_de
+            pipeline.append({
+                "$match": {
+                    "$or": [
+                        {"_relevancia": {"$lt": score}},
+                        {"_relevancia": score, "created_at": {"$lt": created_at}},
+                        {"_relevancia": score, "created_at": created_at, "_id": {"$lt": resena_id}}
+                    ]
+                }
+            })
+        
+        pipeline.append({"$sort": {"_relevancia": -1, "created_at": -1, "_id": -1}})
+        if not despues_de and skip:
+            pipeline.append({"$skip": skip})
+        pipeline.append({"$limit": limit})
+        pipeline.append({"$project": {**proyeccion, "_relevancia": 1}})
+        
+        return await Resena.aggregate(pipeline).to_list()
+    
+    @staticmethod
+    def _filtro_terminos(tokens: List[str]) -> dict:
+        """Cada token debe ser prefijo de algún término del nombre o la dirección (índice de `terminos`)"""
+        return {"$and": [{"terminos": {"$regex": f"^{re.escape(token)}"}} for token in tokens]}
+    
+    @staticmethod
+    async def count_by_establecimiento() -> List[Tuple[str, int]]:
+        """
+        Número de reseñas de cada nombre de establecimiento distinto
+        Se usa para construir el índice de sugerencias al arrancar
+        """
+        docs = await Resena.aggregate([
+            {"$group": {"_id": "$nombre_establecimiento", "total": {"$sum": 1}}}
+        ]).to_list()
+        return [(doc["_id"], doc["total"]) for doc in docs]
+    
+    @staticmethod
+    async def _geo_near(
+        latitud: float,
+        longitud: float,
+        limit: int,
+        max_distancia_km: Optional[float] = None,
+        filtro: Optional[dict] = None,
+        proyeccion: Dict[str, int] = RESENA_PROYECCION,
+        despues_de: Optional[Tuple[float, List[PydanticObjectId]]] = None
+    ) -> List[dict]:
+        """
+        $geoNear sobre el índice 2dsphere de `ubicacion` (distancia esférica real):
+        las reseñas salen ya ordenadas por distancia y el filtro se aplica en la misma etapa
+        Si se proporciona despues_de (distancia_km, _id ya devueltos a esa distancia), empieza
+        en esa distancia (minDistance) y salta las reseñas ya devueltas
+        Devuelve documentos crudos con los campos de `proyeccion` y distancia_km
+        """
+        geo_near = {
+            "near": {"type": "Point", "coordinates": [longitud, latitud]},
+            "key": "ubicacion",
+            "distanceField": "distancia_km",
+            "distanceMultiplier": 0.001,  # metros -> km
+            "spherical": True
+        }
+        if max_distancia_km is not None:
+            geo_near["maxDistance"] = max_distancia_km * 1000
+        if filtro:
+            geo_near["query"] = filtro
+        
+        pipeline = [{"$geoNear": geo_near}]
+        if despues_de:
+            distancia, ids = despues_de
+            # minDistance con margen: km -> m puede no dar exactamente el mismo double;
+            # el corte exacto lo hace el $match sobre distancia_km
+            geo_near["minDistance"] = distancia * 1000 * (1 - 1e-9)
+            pipeline.append({"$match": {"$or": [
+                {"distancia_km": {"$gt": distancia}},
+                {"distancia_km": distancia, "_id": {"$nin": ids}}
+            ]}})
+        
+        pipeline += [
+            {"$limit": limit},
+            {"$project": {**proyeccion, "distancia_km": 1}}
+        ]
+        
+        return await Resena.aggregate(pipeline).to_list()
     
     @staticmethod
     async def get_by_location(
         latitud: float,
         longitud: float,
-        radio_km: float = 5.0
-    ) -> List[Resena]:
+        radio_km: float = 5.0,
+        limit: int = 100,
+        despues_de: Optional[Tuple[float, List[PydanticObjectId]]] = None,
+        proyeccion: Dict[str, int] = RESENA_PROYECCION
+    ) -> List[dict]:
+        """
+        Obtiene reseñas a menos de radio_km de una ubicación, ordenadas por distancia
+        Si se proporciona despues_de (distancia_km, _id ya devueltos a esa distancia), devuelve
+        la página siguiente
+        Las consultas idénticas simultáneas comparten una sola consulta (single-flight)
+        Devuelve documentos crudos con los campos de `proyeccion` y distancia_km
+        """
+        cursor = (despues_de[0], tuple(despues_de[1])) if despues_de else None
+        return await _compartida(
+            ("ubicacion", latitud, longitud, radio_km, limit, cursor, ",".join(proyeccion)),
+            lambda: ResenaCRUD._geo_near(
+                latitud, longitud, limit, max_distancia_km=radio_km, proyeccion=proyeccion,
+                despues_de=despues_de
+            )
+        )
+    
+    @staticmethod
+    async def get_nearest(
+        latitud: float,
+        longitud: float,
+        k: int = 10,
+        min_valoracion: Optional[float] = None,
+        proyeccion: Dict[str, int] = RESENA_PROYECCION
+    ) -> List[dict]:
+        """
+        Obtiene las k reseñas más cercanas a una ubicación, ordenadas por distancia
+        Si se indica min_valoracion, solo se consideran reseñas con al menos esa valoración
+        Devuelve documentos crudos con los campos de `proyeccion` y distancia_km
+        """
+        filtro = {"valoracion": {"$gte": min_valoracion}} if min_valoracion is not None else None
+        return await ResenaCRUD._geo_near(latitud, longitud, k, filtro=filtro, proyeccion=proyeccion)
+    
+    @staticmethod
+    def _filtro_bbox(lat_min: float, lon_min: float, lat_max: float, lon_max: float) -> dict:
+        """
+        Filtro de reseñas dentro del rectángulo: rangos sobre el índice de `geohash` (unas pocas
+        celdas que cubren el rectángulo) más el recorte exacto por latitud/longitud
+        Si lon_min > lon_max el rectángulo cruza el antimeridiano
         """
-        Obtiene reseñas cercanas a una ubicación
-        Nota: Implementación básica. Para producción, usar índices geoespaciales de MongoDB
+        if lon_min <= lon_max:
+            rectangulos = [(lon_min, lon_max)]
+        else:
+            rectangulos = [(lon_min, 180.0), (-180.0, lon_max)]
+        
+        filtros = []
+        for oeste, este in rectangulos:
+            rangos = [
+                {"geohash": {"$gte": celda, "$lt": celda + geohash.FIN_RANGO}}
+                for celda in geohash.cobertura_bbox(lat_min, oeste, lat_max, este)
+            ]
+            filtros.append({
+                "$or": rangos,
+                "latitud": {"$gte": lat_min, "$lte": lat_max},
+                "longitud": {"$gte": oeste, "$lte": este}
+            })
+        
+        return filtros[0] if len(filtros) == 1 else {"$or": filtros}
+    
+    @staticmethod
+    async def get_clusters(
+        lat_min: float,
+        lon_min: float,
+        lat_max: float,
+        lon_max: float,
+        precision: int
+    ) -> List[dict]:
+        """
+        Agrupa las reseñas del rectángulo por celdas de geohash de `precision` caracteres
+        El filtro usa el índice de `geohash` (ver _filtro_bbox); la agrupación la hace $group
+        Devuelve por celda: geohash, centroide (latitud, longitud), count, valoracion_media
+        y resena_id cuando la celda tiene una sola reseña
         """
-        # Aproximación básica: 1 grado ≈ 111 km
-        delta = radio_km / 111.0
+        pipeline = [
+            {"$match": ResenaCRUD._filtro_bbox(lat_min, lon_min, lat_max, lon_max)},
+            {
+                "$group": {
+                    "_id": {"$substrBytes": ["$geohash", 0, precision]},
+                    "count": {"$sum": 1},
+                    "latitud": {"$avg": "$latitud"},
+                    "longitud": {"$avg": "$longitud"},
+                    "valoracion_media": {"$avg": "$valoracion"},
+                    "resena_id": {"$first": "$_id"}
+                }
+            }
+        ]
         
-        resenas = await Resena.find(
-            Resena.latitud >= latitud - delta,
-            Resena.latitud <= latitud + delta,
-            Resena.longitud >= longitud - delta,
-            Resena.longitud <= longitud + delta
-        ).to_list()
+        clusters = await Resena.aggregate(pipeline).to_list()
+        for cluster in clusters:
+            cluster["geohash"] = cluster.pop("_id")
+            if cluster["count"] > 1:
+                cluster["resena_id"] = None
+        
+        return clusters
+    
+    @staticmethod
+    async def get_puntos(
+        lat_min: float,
+        lon_min: float,
+        lat_max: float,
+        lon_max: float,
+        limit: int
+    ) -> List[dict]:
+        """
+        Posición y valoración de las reseñas del rectángulo (documentos crudos con
+        _id, latitud, longitud y valoracion), para codificar teselas vectoriales
+        """
+        return await Resena.get_motor_collection().find(
+            ResenaCRUD._filtro_bbox(lat_min, lon_min, lat_max, lon_max),
+            {"latitud": 1, "longitud": 1, "valoracion": 1}
+        ).limit(limit).to_list(None)
+    
+    @staticmethod
+    async def exportar(
+        email_autor: Optional[str] = None,
+        min_valoracion: Optional[float] = None,
+        max_valoracion: Optional[float] = None,
+        texto: Optional[str] = None,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        proyeccion: Dict[str, int] = RESENA_PROYECCION,
+        batch_size: int = 1000
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Recorre todas las reseñas que cumplen los filtros, más recientes primero, en lotes
+        de batch_size documentos crudos con los campos de `proyeccion` (memoria constante)
+        Filtros: autor, rango de valoración, texto en nombre o dirección (como
+        get_by_establecimiento, sin ordenar por relevancia) y rectángulo
+        (lat_min, lon_min, lat_max, lon_max)
+        El cursor se cierra en el servidor al terminar o al cerrar el generador (aclose),
+        p. ej. si el cliente se desconecta a mitad de la exportación
+        """
+        filtros = []
+        if email_autor:
+            filtros.append({"email_autor": email_autor})
+        if min_valoracion is not None or max_valoracion is not None:
+            rango = {}
+            if min_valoracion is not None:
+                rango["$gte"] = min_valoracion
+            if max_valoracion is not None:
+                rango["$lte"] = max_valoracion
+            filtros.append({"valoracion": rango})
+        if texto:
+            tokens = tokenizar(normalizar_texto(texto))
+            if not tokens:
+                return
+            filtros.append(ResenaCRUD._filtro_terminos(tokens))
+        if bbox:
+            filtros.append(ResenaCRUD._filtro_bbox(*bbox))
         
-        return resenas
+        filtro = {} if not filtros else filtros[0] if len(filtros) == 1 else {"$and": filtros}
+        cursor = Resena.get_motor_collection().find(filtro, proyeccion) \
+            .sort(ORDEN_RECIENTES).batch_size(batch_size)
+        try:
+            while True:
+                lote = await cursor.to_list(batch_size)
+                if not lote:
+                    break
+                yield lote
+        finally:
+            # Protegido de la cancelación: al desconectarse el cliente la tarea está cancelada
+            with anyio.CancelScope(shield=True):
+                await cursor.close()
+    
+    @staticmethod
+    async def backfill_geohash(batch_size: int = 500) -> int:
+        """
+        Calcula el geohash de las reseñas que no lo tienen
+        Devuelve el número de reseñas actualizadas
+        """
+        collection = Resena.get_motor_collection()
+        cursor = collection.find({"geohash": None}, {"latitud": 1, "longitud": 1}).batch_size(batch_size)
+        
+        actualizadas = 0
+        operaciones = []
+        async for doc in cursor:
+            operaciones.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"geohash": geohash.encode(doc["latitud"], doc["longitud"])}}
+            ))
+            if len(operaciones) >= batch_size:
+                actualizadas += (await collection.bulk_write(operaciones, ordered=False)).modified_count
+                operaciones = []
+        
+        if operaciones:
+            actualizadas += (await collection.bulk_write(operaciones, ordered=False)).modified_count
+        
+        return actualizadas
+    
+    @staticmethod
+    async def backfill_ubicacion() -> int:
+        """
+        Rellena el campo GeoJSON `ubicacion` en reseñas antiguas a partir de latitud/longitud
+        Devuelve el número de reseñas actualizadas
+        """
+        result = await Resena.get_motor_collection().update_many(
+            {"ubicacion": None},
+            [{"$set": {"ubicacion": {"type": "Point", "coordinates": ["$longitud", "$latitud"]}}}]
+        )
+        return result.modified_count
+    
+    @staticmethod
+    async def backfill_busqueda(batch_size: int = 500) -> int:
+        """
+        Calcula los campos de búsqueda normalizados en reseñas que no los tienen
+        Devuelve el número de reseñas actualizadas
+        """
+        collection = Resena.get_motor_collection()
+        cursor = collection.find(
+            {"busqueda_nombre": None},
+            {"nombre_establecimiento": 1, "direccion": 1}
+        ).batch_size(batch_size)
+        
+        actualizadas = 0
+        operaciones = []
+        async for doc in cursor:
+            campos = campos_busqueda(doc["nombre_establecimiento"], doc.get("direccion", ""))
+            operaciones.append(UpdateOne({"_id": doc["_id"]}, {"$set": campos}))
+            if len(operaciones) >= batch_size:
+                actualizadas += (await collection.bulk_write(operaciones, ordered=False)).modified_count
+                operaciones = []
+        
+        if operaciones:
+            actualizadas += (await collection.bulk_write(operaciones, ordered=False)).modified_count
+        
+        return actualizadas
     
     @staticmethod
     async def update(
@@ -122,20 +702,143 @@ class ResenaCRUD:
         """
         Actualiza una reseña
         Solo el autor puede actualizarla
+        La comprobación de autoría y la escritura son una única operación atómica
+        (find_one_and_update sobre {_id, email_autor}) que envía solo los campos recibidos;
+        el documento anterior que devuelve sirve para mantener contadores y cachés
         """
-        resena = await Resena.get(resena_id)
+        update_data = resena_data.model_dump(exclude_unset=True)
+        if not update_data:
+            return await Resena.find_one({"_id": resena_id, "email_autor": email_autor})
+        
+        cambios = dict(update_data)
+        posicion_recibida = "latitud" in cambios or "longitud" in cambios
         
-        if not resena or resena.email_autor != email_autor:
+        # Campos derivados que se pueden calcular solo con lo recibido
+        if "latitud" in cambios and "longitud" in cambios:
+            cambios["geohash"] = geohash.encode(cambios["latitud"], cambios["longitud"])
+        if "nombre_establecimiento" in cambios and "direccion" in cambios:
+            cambios.update(campos_busqueda(cambios["nombre_establecimiento"], cambios["direccion"]))
+        if {"nombre_establecimiento", "latitud", "longitud"} <= cambios.keys():
+            cambios["establecimiento"] = await EstablecimientoCRUD.resolver_clave(
+                cambios["nombre_establecimiento"], cambios["latitud"], cambios["longitud"]
+            )
+        
+        if posicion_recibida:
+            # Actualización con pipeline: ubicacion se calcula en la misma escritura con la
+            # latitud/longitud resultantes, aunque solo llegue una de las dos ($literal evita
+            # que un texto que empiece por "$" se interprete como expresión)
+            operacion = [
+                {"$set": {k: {"$literal": v} for k, v in ResenaCRUD._a_mongo(cambios).items()}},
+                {"$set": {"ubicacion": {"type": "Point", "coordinates": ["$longitud", "$latitud"]}}}
+            ]
+        else:
+            operacion = {"$set": ResenaCRUD._a_mongo(cambios)}
+        
+        collection = Resena.get_motor_collection()
+        doc = await collection.find_one_and_update(
+            {"_id": resena_id, "email_autor": email_autor},
+            operacion,
+            return_document=ReturnDocument.BEFORE
+        )
+        if doc is None:
             return None
+        consultas_singleflight.olvidar()
         
-        update_data = resena_data.model_dump(exclude_unset=True)
+        anterior = Resena.model_validate(doc)
+        resena = anterior.model_copy(update=cambios)
+        posicion_anterior = (anterior.latitud, anterior.longitud)
+        posicion = (resena.latitud, resena.longitud)
+        if posicion_recibida:
+            resena = resena.model_copy(update={"ubicacion": PuntoGeoJSON.desde_coordenadas(*posicion)})
+        
+        # Derivados que dependen de campos no recibidos: se calculan con el estado resultante y
+        # cada uno se escribe filtrando solo por los campos de los que depende. Si otra edición
+        # cambia esos campos, su propio cálculo parte de un estado que ya incluye esta edición
+        # y es el que queda; si no los cambia, esta escritura sigue aplicándose
+        derivados = {}
+        if posicion != posicion_anterior and "geohash" not in cambios:
+            valor = geohash.encode(*posicion)
+            resultado = await collection.update_one(
+                {"_id": resena_id, "latitud": resena.latitud, "longitud": resena.longitud},
+                {"$set": {"geohash": valor}}
+            )
+            if resultado.matched_count == 1:
+                derivados["geohash"] = valor
+        
+        if (
+            (resena.nombre_establecimiento, resena.direccion) != (anterior.nombre_establecimiento, anterior.direccion)
+            and "terminos" not in cambios
+        ):
+            busqueda = campos_busqueda(resena.nombre_establecimiento, resena.direccion)
+            resultado = await collection.update_one(
+                {
+                    "_id": resena_id,
+                    "nombre_establecimiento": resena.nombre_establecimiento,
+                    "direccion": resena.direccion
+                },
+                {"$set": busqueda}
+            )
+            if resultado.matched_count == 1:
+                derivados.update(busqueda)
+        
+        # Solo se vuelve a resolver si cambia el nombre o la ubicación: la reseña sigue en su
+        # establecimiento aunque después se haya creado otro más cercano. El cambio de
+        # establecimiento se filtra también por el establecimiento anterior, y los agregados
+        # solo se mueven si la escritura se ha aplicado
+        if "establecimiento" not in cambios and (
+            resena.establecimiento is None
+            or normalizar_texto(resena.nombre_establecimiento) != normalizar_texto(anterior.nombre_establecimiento)
+            or posicion != posicion_anterior
+        ):
+            clave = await EstablecimientoCRUD.resolver_clave(resena.nombre_establecimiento, *posicion)
+            if clave != resena.establecimiento:
+                resultado = await collection.update_one(
+                    {
+                        "_id": resena_id,
+                        "nombre_establecimiento": resena.nombre_establecimiento,
+                        "latitud": resena.latitud,
+                        "longitud": resena.longitud,
+                        "establecimiento": anterior.establecimiento
+                    },
+                    {"$set": {"establecimiento": clave}}
+                )
+                if resultado.matched_count == 1:
+                    derivados["establecimiento"] = clave
+        
+        if derivados:
+            consultas_singleflight.olvidar()
+            resena = resena.model_copy(update=derivados)
+        
+        indice_sugerencias.renombrar(anterior.nombre_establecimiento, resena.nombre_establecimiento)
         
-        for field, value in update_data.items():
-            setattr(resena, field, value)
+        if resena.establecimiento != anterior.establecimiento:
+            if anterior.establecimiento:
+                await EstablecimientoCRUD.retirar_resena(anterior.establecimiento, anterior.valoracion)
+            await EstablecimientoCRUD.registrar_resena(resena)
+        elif resena.valoracion != anterior.valoracion:
+            await EstablecimientoCRUD.cambiar_valoracion(
+                resena.establecimiento, anterior.valoracion, resena.valoracion
+            )
         
-        await resena.save()
+        # Las teselas vectoriales solo llevan posición y valoración
+        if posicion != posicion_anterior:
+            tile_cache.invalidar_punto(*posicion_anterior)
+            tile_cache.invalidar_punto(*posicion)
+        elif resena.valoracion != anterior.valoracion:
+            tile_cache.invalidar_punto(*posicion)
+        
+        # Las respuestas cacheadas llevan la reseña entera: se invalidan siempre, antes y después
+        await response_cache.invalidar(
+            etiquetas_resena(resena_id, email_autor, anterior.valoracion, *posicion_anterior)
+            | etiquetas_resena(resena_id, email_autor, resena.valoracion, *posicion)
+        )
         return resena
     
+    @staticmethod
+    def _a_mongo(campos: dict) -> dict:
+        """Valores listos para $set (los submodelos como PuntoGeoJSON se pasan a dict)"""
+        return {k: v.model_dump() if isinstance(v, BaseModel) else v for k, v in campos.items()}
+    
     @staticmethod
     async def delete(
         resena_id: PydanticObjectId,
@@ -144,13 +847,31 @@ class ResenaCRUD:
         """
         Elimina una reseña
         Solo el autor puede eliminarla
+        Borrado atómico filtrado por {_id, email_autor} que devuelve solo los campos
+        necesarios para mantener contadores y cachés
         """
-        resena = await Resena.get(resena_id)
-        
-        if not resena or resena.email_autor != email_autor:
+        doc = await Resena.get_motor_collection().find_one_and_delete(
+            {"_id": resena_id, "email_autor": email_autor},
+            projection={
+                "nombre_establecimiento": 1,
+                "latitud": 1,
+                "longitud": 1,
+                "valoracion": 1,
+                "establecimiento": 1
+            }
+        )
+        if doc is None:
             return False
+        consultas_singleflight.olvidar()
         
-        await resena.delete()
+        await ContadorCRUD.incrementar(clave_contador_autor(email_autor), -1)
+        indice_sugerencias.quitar(doc["nombre_establecimiento"])
+        if doc.get("establecimiento"):
+            await EstablecimientoCRUD.retirar_resena(doc["establecimiento"], doc["valoracion"])
+        tile_cache.invalidar_punto(doc["latitud"], doc["longitud"])
+        await response_cache.invalidar(etiquetas_resena(
+            resena_id, email_autor, doc["valoracion"], doc["latitud"], doc["longitud"]
+        ))
         return True
     
     @staticmethod
@@ -158,14 +879,18 @@ class ResenaCRUD:
         min_valoracion: float = 0,
         max_valoracion: float = 5,
         skip: int = 0,
-        limit: int = 100
-    ) -> List[Resena]:
+        limit: int = 100,
+        despues_de: Optional[Tuple[datetime, PydanticObjectId]] = None,
+        proyeccion: Dict[str, int] = RESENA_PROYECCION
+    ) -> List[dict]:
         """
         Obtiene reseñas por rango de valoración
+        Si se proporciona despues_de (created_at, _id), pagina por cursor e ignora skip
+        Devuelve documentos crudos con los campos de `proyeccion`
         """
-        resenas = await Resena.find(
-            Resena.valoracion >= min_valoracion,
-            Resena.valoracion <= max_valoracion
-        ).skip(skip).limit(limit).to_list()
+        filtro = {"valoracion": {"$gte": min_valoracion, "$lte": max_valoracion}}
+        
+        if despues_de:
+            filtro.update(ResenaCRUD._filtro_keyset(despues_de))
         
-        return resenas
+        return await ResenaCRUD._find(filtro, skip=0 if despues_de else skip, limit=limit, proyeccion=proyeccion)
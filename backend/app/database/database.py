@@ -4,6 +4,14 @@ from beanie import init_beanie
 from app.core.config import settings
 from app.models.user import User
 from app.models.resena import Resena
+from app.models.contador import Contador
+from app.models.imagen import ImagenSubida
+from app.models.establecimiento import Establecimiento
+from app.models.cache import CacheRespuesta, CacheEtiqueta
+from app.database.indices import crear_indices_en_segundo_plano
+
+# Modelos registrados en Beanie
+DOCUMENT_MODELS = [User, Resena, Contador, ImagenSubida, Establecimiento, CacheRespuesta, CacheEtiqueta]
 
 # Cliente global para reutilización en serverless
 _client = None
@@ -18,9 +26,12 @@ async def init_db():
         
         await init_beanie(
             database=_client[settings.MONGODB_DATABASE_NAME],
-            document_models=[User, Resena]
+            document_models=DOCUMENT_MODELS
         )
         
+        # Índices gestionados: no se espera a que terminen de construirse
+        crear_indices_en_segundo_plano(DOCUMENT_MODELS)
+        
         logging.info("Conexión a MongoDB y Beanie inicializados exitosamente.")
     
     return _client
@@ -0,0 +1,88 @@
+"""
+Índices gestionados fuera de init_beanie
+
+Beanie crea los índices de `Settings.indexes` esperando a que terminen, lo que en
+una colección grande bloquea el arranque en frío. Ahí quedan solo los índices sin los
+que alguna consulta falla (unique, 2dsphere de $geoNear); los que solo sirven
+para rendimiento se declaran en `Settings.indices_gestionados` del modelo y se
+crean aquí en segundo plano: createIndexes es idempotente (si el índice ya existe
+con la misma definición no hace nada), así que se puede lanzar en cada arranque.
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence, Type
+from beanie import Document
+from pymongo import IndexModel
+from pymongo.errors import PyMongoError
+
+_tarea: Optional["asyncio.Task"] = None
+
+
+def indices_gestionados(modelo: Type[Document]) -> List[IndexModel]:
+    """Índices declarados en `Settings.indices_gestionados` del modelo"""
+    settings = getattr(modelo, "Settings", None)
+    return list(getattr(settings, "indices_gestionados", []))
+
+
+async def crear_indices(modelos: Sequence[Type[Document]]) -> None:
+    """Crea los índices gestionados que falten; un fallo en un modelo no impide los demás"""
+    for modelo in modelos:
+        indices = indices_gestionados(modelo)
+        if not indices:
+            continue
+        collection = modelo.get_motor_collection()
+        try:
+            nombres = await collection.create_indexes(indices)
+            logging.info(f"Índices de {collection.name} comprobados: {', '.join(nombres)}")
+        except PyMongoError as e:
+            # p. ej. un índice con el mismo nombre y otra definición: hay que resolverlo a mano
+            logging.error(f"Error al crear índices de {collection.name}: {str(e)}")
+
+
+def crear_indices_en_segundo_plano(modelos: Sequence[Type[Document]]) -> "asyncio.Task":
+    """
+    Lanza crear_indices sin esperarla (arranque de la app)
+    Se guarda la referencia a la tarea para que no la recoja el recolector de basura
+    """
+    global _tarea
+    if _tarea is None or _tarea.done():
+        _tarea = asyncio.create_task(crear_indices(modelos))
+    return _tarea
+
+
+async def esperar_indices() -> None:
+    """
+    Espera a la tarea lanzada por crear_indices_en_segundo_plano, si la hay
+    Para procesos cortos (manage.py) que terminarían el bucle de eventos antes de crearlos
+    """
+    if _tarea is not None:
+        await _tarea
+
+
+async def informe_indices(modelos: Sequence[Type[Document]]) -> Dict[str, dict]:
+    """
+    Estado de los índices gestionados de cada colección según $indexStats:
+    - faltan: declarados pero no creados
+    - sin_uso: creados pero sin ningún acceso desde `desde` (arranque del servidor o creación del índice)
+    - no_declarados: existen en la colección pero no en el modelo
+    Los contadores de $indexStats son por nodo y se reinician al reiniciar mongod
+    """
+    informe = {}
+    for modelo in modelos:
+        collection = modelo.get_motor_collection()
+        declarados = {indice.document["name"] for indice in indices_gestionados(modelo)}
+        declarados |= {indice.document["name"] for indice in getattr(modelo.Settings, "indexes", [])}
+
+        estadisticas = await collection.aggregate([{"$indexStats": {}}]).to_list(None)
+        existentes = {e["name"]: e for e in estadisticas if e["name"] != "_id_"}
+
+        informe[collection.name] = {
+            "faltan": sorted(declarados - existentes.keys()),
+            "sin_uso": [
+                {"nombre": nombre, "desde": e["accesses"]["since"]}
+                for nombre, e in sorted(existentes.items())
+                if e["accesses"]["ops"] == 0
+            ],
+            "no_declarados": sorted(existentes.keys() - declarados),
+        }
+    return informe
@@ -1,9 +1,12 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 import logging
 from app.database.database import init_db
-from app.routers import auth, resenas
+from app.core.geocoding import close_geocoding_client
+from app.core.gazetteer import load_gazetteer, get_gazetteer
+from app.routers import auth, resenas, establecimientos, metricas
 from app.core.config import settings
 
 # Configurar logging
@@ -23,6 +26,14 @@ app = FastAPI(
 @app.on_event("startup")
 async def startup_event():
     await init_db()
+    
+    # Gazetteer para reverse geocoding offline (se construye en un hilo: puede tardar en ficheros grandes)
+    if settings.GAZETTEER_PATH and get_gazetteer() is None:
+        await asyncio.to_thread(load_gazetteer, settings.GAZETTEER_PATH)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_geocoding_client()
 
 # Configurar SessionMiddleware (requerido para OAuth)
 app.add_middleware(
@@ -37,11 +48,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor de paginación en endpoints que devuelven listas y acierto de la caché de respuestas
+    expose_headers=["X-Next-Cursor", "X-Cache"],
 )
 
 # Incluir routers
 app.include_router(auth.router)
 app.include_router(resenas.router)
+app.include_router(establecimientos.router)
+app.include_router(metricas.router)
 
 @app.get("/")
 def read_root():
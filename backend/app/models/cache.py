@@ -0,0 +1,40 @@
+from beanie import Document
+from pydantic import Field
+from pymongo import IndexModel
+from typing import List
+from datetime import datetime
+
+
+class CacheRespuesta(Document):
+    """
+    Respuesta cacheada en el backend compartido (RESPONSE_CACHE_BACKEND=mongo)
+    Se identifica por la clave de la caché (ruta + parámetros normalizados); MongoDB la
+    borra sola al pasar `expira_at` (índice TTL)
+    """
+    id: str = Field(..., alias="_id")  # Clave de la caché
+    valor: bytes  # Cabeceras y cuerpo serializados
+    etiquetas: List[str] = Field(default_factory=list)  # Al invalidar una etiqueta se borra la entrada
+    expira_at: datetime
+
+    class Settings:
+        name = "cache_respuestas"
+        indexes = [
+            IndexModel("etiquetas", name="etiquetas"),
+            IndexModel("expira_at", expireAfterSeconds=0, name="expira_at_ttl"),
+        ]
+
+
+class CacheEtiqueta(Document):
+    """
+    Versión de una etiqueta de invalidación de la caché compartida: sube en cada invalidación
+    Una respuesta calculada antes de una invalidación no se guarda si la versión ha cambiado
+    """
+    id: str = Field(..., alias="_id")  # Etiqueta, p. ej. "resena:<id>" o "autor:<email>"
+    version: int = 0
+    expira_at: datetime  # Se renueva en cada invalidación; caduca mucho después que las respuestas
+
+    class Settings:
+        name = "cache_etiquetas"
+        indexes = [
+            IndexModel("expira_at", expireAfterSeconds=0, name="expira_at_ttl"),
+        ]
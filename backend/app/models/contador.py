@@ -0,0 +1,28 @@
+from beanie import Document, PydanticObjectId
+from pydantic import Field, ConfigDict
+from pymongo import IndexModel
+from typing import Optional
+from datetime import datetime
+
+
+class Contador(Document):
+    """
+    Contador mantenido con $inc para totales que serían caros de recalcular
+    (p. ej. número de reseñas de un autor: clave "autor:<email>")
+    """
+    id: Optional[PydanticObjectId] = Field(default=None, alias="_id")
+    clave: str
+    total: int = 0
+    exacto: bool = True  # False mientras solo acumula incrementos, antes del primer conteo exacto
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    
+    model_config = ConfigDict(
+        populate_by_name=True,
+        json_encoders={PydanticObjectId: str}
+    )
+    
+    class Settings:
+        name = "contadores"
+        indexes = [
+            IndexModel("clave", unique=True, name="clave_unique"),
+        ]
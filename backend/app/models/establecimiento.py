@@ -0,0 +1,43 @@
+from beanie import Document, PydanticObjectId
+from pydantic import Field, ConfigDict
+from pymongo import IndexModel
+from typing import Dict, Optional
+from datetime import datetime
+
+
+class Establecimiento(Document):
+    """
+    Establecimiento canónico con los agregados de sus reseñas desnormalizados
+    Se identifica por `clave`: nombre normalizado + geohash de la ubicación de su primera reseña
+    (las reseñas del mismo nombre en celdas vecinas y a menos de ESTABLECIMIENTO_RADIO_FUSION_M
+    se agrupan con él)
+    (dos locales con el mismo nombre en sitios distintos son establecimientos distintos)
+    Los agregados se mantienen con $inc en cada alta, edición y baja de reseña
+    """
+    id: Optional[PydanticObjectId] = Field(default=None, alias="_id")
+    clave: str
+    nombre: str  # Nombre tal como se escribió en la primera reseña
+    direccion: str = ""
+    latitud: float = Field(..., ge=-90, le=90)
+    longitud: float = Field(..., ge=-180, le=180)
+    geohash: str
+    num_resenas: int = Field(0, alias="count")  # Número de reseñas ("count" chocaría con Document.count)
+    sum: float = 0  # Suma de valoraciones
+    avg: Optional[float] = None  # Valoración media (sum / count)
+    min: Optional[float] = None
+    max: Optional[float] = None
+    histograma: Dict[str, int] = Field(default_factory=dict)  # Reseñas por valoración entera "0".."5"
+    ultima_resena_at: Optional[datetime] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    model_config = ConfigDict(
+        populate_by_name=True,
+        json_encoders={PydanticObjectId: str}
+    )
+
+    class Settings:
+        name = "establecimientos"
+        indexes = [
+            IndexModel("clave", unique=True, name="clave_unique"),
+            IndexModel("geohash", name="geohash"),
+        ]
@@ -0,0 +1,28 @@
+from beanie import Document, PydanticObjectId
+from pydantic import Field, ConfigDict
+from pymongo import IndexModel
+from typing import Optional
+from datetime import datetime
+
+
+class ImagenSubida(Document):
+    """
+    Imagen ya subida a Cloudinary, indexada por el SHA-256 de su contenido
+    Permite reutilizar la URL cuando se vuelve a subir exactamente la misma imagen
+    """
+    id: Optional[PydanticObjectId] = Field(default=None, alias="_id")
+    sha256: str  # Digest hexadecimal del contenido original
+    url: str  # secure_url devuelta por Cloudinary
+    size: int  # Tamaño en bytes del original
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    
+    model_config = ConfigDict(
+        populate_by_name=True,
+        json_encoders={PydanticObjectId: str}
+    )
+    
+    class Settings:
+        name = "imagenes"
+        indexes = [
+            IndexModel("sha256", unique=True, name="sha256_unique"),
+        ]
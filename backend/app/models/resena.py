@@ -1,9 +1,23 @@
 from beanie import Document, PydanticObjectId
-from pydantic import EmailStr, Field, ConfigDict, field_validator
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, ConfigDict, field_validator
+from pymongo import IndexModel, ASCENDING, DESCENDING, GEOSPHERE
+from typing import Optional, List, Literal
 from datetime import datetime
 
 
+class PuntoGeoJSON(BaseModel):
+    """
+    Punto GeoJSON usado por el índice 2dsphere de MongoDB
+    Las coordenadas van en orden [longitud, latitud]
+    """
+    type: Literal["Point"] = "Point"
+    coordinates: List[float] = Field(..., min_length=2, max_length=2)
+
+    @classmethod
+    def desde_coordenadas(cls, latitud: float, longitud: float) -> "PuntoGeoJSON":
+        return cls(coordinates=[longitud, latitud])
+
+
 class Resena(Document):
     """
     Modelo de Reseña de Establecimiento
@@ -15,12 +29,18 @@ class Resena(Document):
     latitud: float = Field(..., ge=-90, le=90)  # Coordenada GPS latitud (-90 a 90)
     longitud: float = Field(..., ge=-180, le=180)  # Coordenada GPS longitud (-180 a 180)
     valoracion: float = Field(..., ge=0, le=5)  # Valoración de 0 a 5
-    email_autor: EmailStr = Field(..., index=True)  # Email del autor de la reseña (del token OAuth)
+    email_autor: EmailStr  # Email del autor de la reseña (del token OAuth)
     nombre_autor: str  # Nombre del autor de la reseña (del token OAuth)
     token_emision: datetime  # Timestamp de emisión del token OAuth
     token_caducidad: datetime  # Timestamp de caducidad del token OAuth
     token_oauth: str  # Token de identificación OAuth con el que se creó la reseña
     imagenes: List[str] = Field(default_factory=list)  # URLs de imágenes en Cloudinary
+    ubicacion: Optional[PuntoGeoJSON] = None  # Copia GeoJSON de latitud/longitud para el índice 2dsphere
+    geohash: Optional[str] = None  # Geohash (9 caracteres) de latitud/longitud para agrupar por celdas
+    busqueda_nombre: Optional[str] = None  # Nombre normalizado (sin tildes, minúsculas) para búsqueda
+    terminos_nombre: List[str] = Field(default_factory=list)  # Términos normalizados del nombre
+    terminos: List[str] = Field(default_factory=list)  # Términos normalizados de nombre y dirección (indexado)
+    establecimiento: Optional[str] = None  # Clave del Establecimiento canónico (nombre normalizado + geohash)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     
     @field_validator('valoracion')
@@ -56,3 +76,24 @@ class Resena(Document):
     
     class Settings:
         name = "resenas"
+        # $geoNear (get_by_location, /cercanas) falla sin el índice 2dsphere: init_beanie lo crea
+        # esperando a que exista, como los demás índices de los que depende la corrección
+        indexes = [
+            IndexModel([("ubicacion", GEOSPHERE)], name="ubicacion_2dsphere"),
+        ]
+        # Índices de rendimiento: se crean en segundo plano al arrancar (app/database/indices.py)
+        # en lugar de en init_beanie, para no bloquear el arranque en frío
+        indices_gestionados = [
+            # Listados "más recientes primero" y paginación keyset (created_at, _id)
+            IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at"),
+            # Reseñas de un autor, más recientes primero (mis-resenas y su conteo)
+            IndexModel(
+                [("email_autor", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="email_autor_created_at"
+            ),
+            # Rangos de valoración (get_by_valoracion)
+            IndexModel([("valoracion", ASCENDING)], name="valoracion"),
+            IndexModel("geohash", name="geohash"),
+            IndexModel("terminos", name="terminos"),
+            IndexModel("establecimiento", name="establecimiento"),
+        ]
@@ -3,7 +3,7 @@ from fastapi.responses import RedirectResponse
 from authlib.integrations.starlette_client import OAuth
 from starlette.requests import Request
 from app.models.user import User
-from app.core.auth import create_access_token, get_current_user
+from app.core.auth import create_access_token, get_current_user, invalidate_user
 from app.core.config import settings
 from datetime import datetime, timedelta
 import logging
@@ -73,6 +73,8 @@ async def auth_google(request: Request):
             await user.save()
             logging.info(f"Usuario existente logueado: {email}")
         
+        invalidate_user(user.email)
+        
         # Crear token JWT
         access_token = await create_access_token(data={"sub": user.email})
         
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from app.schemas.establecimiento import EstablecimientoResponse
+from app.crud.establecimiento_crud import EstablecimientoCRUD
+from app.models.user import User
+from app.core.auth import get_current_user
+import logging
+
+router = APIRouter(prefix="/establecimientos", tags=["Establecimientos"])
+
+
+@router.get("/", response_model=EstablecimientoResponse)
+async def obtener_establecimiento(
+    nombre: str = Query(..., min_length=1, max_length=200),
+    latitud: float = Query(..., ge=-90, le=90),
+    longitud: float = Query(..., ge=-180, le=180),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Obtiene un establecimiento y sus valoraciones agregadas (media, extremos, histograma)
+    Se identifica por nombre y ubicación, igual que al agrupar sus reseñas
+    Requiere autenticación OAuth
+    """
+    try:
+        establecimiento = await EstablecimientoCRUD.buscar(nombre, latitud, longitud)
+        
+        if not establecimiento:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Establecimiento no encontrado"
+            )
+        
+        return EstablecimientoResponse(**establecimiento.model_dump(by_alias=True, exclude={"id"}))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error al obtener establecimiento: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al obtener establecimiento: {str(e)}"
+        )
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends
+from app.core.auth import user_cache, token_cache, get_current_user
+from app.core.cloudinary_service import upload_executor, image_url_cache
+from app.core.geocoding import forward_cache, reverse_cache
+from app.core.sugerencias import indice_sugerencias
+from app.core.mvt import tile_cache
+from app.core.response_cache import response_cache
+from app.crud.resena_crud import consultas_singleflight
+from app.models.user import User
+
+router = APIRouter(prefix="/metricas", tags=["Métricas"])
+
+
+@router.get("/")
+async def obtener_metricas(current_user: User = Depends(get_current_user)):
+    """
+    Métricas internas del proceso (cachés en memoria)
+    Cada instancia serverless tiene sus propios contadores
+    Requiere autenticación
+    """
+    return {
+        "user_cache": user_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "cloudinary_uploads": upload_executor.stats(),
+        "image_dedup_cache": image_url_cache.stats(),
+        "geocoding_forward_cache": forward_cache.stats(),
+        "geocoding_reverse_cache": reverse_cache.stats(),
+        "sugerencias": indice_sugerencias.stats(),
+        "tile_cache": tile_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "consultas_singleflight": consultas_singleflight.stats()
+    }
@@ -1,42 +1,158 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query, UploadFile, File
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, Response
+from typing import Any, AsyncIterator, Dict, FrozenSet, List, Literal, Optional, Tuple
+from pydantic import TypeAdapter
 from beanie import PydanticObjectId
+from bson.errors import InvalidId
 from app.models.user import User
 from app.models.resena import Resena
-from app.schemas.resena import ResenaCreate, ResenaUpdate, ResenaResponse, ResenaListResponse
+from app.schemas.resena import (
+    ResenaCreate, ResenaUpdate, ResenaResponse, ResenaCercanaResponse, ResenaListResponse,
+    ClusterResponse, SugerenciaResponse, ImagenSubidaResultado, ImagenesSubidaResponse, ImportacionResponse,
+    CAMPOS_RESPUESTA, proyeccion_resena, resena_lectura, resena_lectura_adapter, resenas_lectura_adapter,
+    resenas_cercanas_lectura_adapter, resena_lista_lectura_adapter
+)
 from app.crud.resena_crud import ResenaCRUD
-from app.core.auth import get_current_user
-from app.core.cloudinary_service import upload_image
-from datetime import datetime
-from jose import JWTError, jwt
-from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from fastapi import UploadFile, File
+from app.crud.imagen_crud import ImagenCRUD
+from app.core.auth import get_current_user, get_token_context, TokenContext
+from app.core.cloudinary_service import upload_image, image_url_cache, UploadQueueFull
+from app.core.pagination import (
+    decode_keyset_cursor, next_cursor, decode_search_cursor, next_search_cursor,
+    decode_distance_cursor, next_distance_cursor
+)
+from app.core.uploads import recibir_archivos, ArchivoRecibido
+from app.core.streaming import ClosingStreamingResponse
+from app.core.response_cache import (
+    response_cache, ETIQUETA_RESENAS, etiqueta_autor, etiqueta_resena,
+    etiquetas_rango_valoracion, etiquetas_zona
+)
+from app.core.sugerencias import indice_sugerencias
+from app.core import geohash
+from app.core import mvt
 from app.core.config import settings
+from contextlib import aclosing
+import asyncio
 import logging
 
 router = APIRouter(prefix="/resenas", tags=["Reseñas"])
-security = HTTPBearer()
 
+MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB por imagen
+MAX_IMAGES_PER_BATCH = 10  # Imágenes por petición en /upload-images
 
-async def extract_token_info(credentials: HTTPAuthorizationCredentials = Depends(security)) -> tuple:
+CURSOR_DESCRIPTION = "Cursor opaco de la página anterior (next_cursor / X-Next-Cursor). Si se indica, se ignora skip"
+FIELDS_DESCRIPTION = (
+    "Campos de cada reseña separados por comas (p. ej. latitud,longitud,valoracion); "
+    "_id se devuelve siempre. Si no se indica, se devuelven todos"
+)
+
+
+async def extract_token_info(token_context: Optional[TokenContext] = Depends(get_token_context)) -> tuple:
     """
     Extrae la información del token OAuth (emisión, caducidad y el propio token)
+    Reutiliza el token ya decodificado por get_token_context en esta petición
     """
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-        
-        # Extraer timestamps del token
-        token_emision = datetime.fromtimestamp(payload.get("iat", datetime.utcnow().timestamp()))
-        token_caducidad = datetime.fromtimestamp(payload.get("exp"))
-        
-        return token_emision, token_caducidad, token
-    except JWTError as e:
-        logging.error(f"Error al extraer información del token: {str(e)}")
+    if token_context is None:
+        logging.error("Error al extraer información del token: token ausente o inválido")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido"
         )
+    
+    return token_context.emision, token_context.caducidad, token_context.token
+
+
+def respuesta_json(adapter: TypeAdapter, contenido: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Respuesta JSON serializada con un TypeAdapter precompilado
+    Al devolver la Response directamente FastAPI no vuelve a validar con response_model
+    (que se mantiene en el decorador para la documentación OpenAPI)
+    """
+    return Response(content=adapter.dump_json(contenido), media_type="application/json", headers=headers)
+
+
+def parse_bbox(bbox: str) -> Tuple[float, float, float, float]:
+    """
+    Convierte "oeste,sur,este,norte" (formato de LatLngBounds.toBBoxString de Leaflet)
+    en (lat_min, lon_min, lat_max, lon_max); oeste > este indica que cruza el antimeridiano
+    """
+    try:
+        oeste, sur, este, norte = (float(v) for v in bbox.split(","))
+    except ValueError:
+        oeste = sur = este = norte = None
+    
+    if (
+        oeste is None
+        or not (-90 <= sur <= norte <= 90)
+        or not (-180 <= oeste <= 180 and -180 <= este <= 180)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="bbox no es válido (formato: oeste,sur,este,norte)"
+        )
+    return sur, oeste, norte, este
+
+
+def parse_resena_id(resena_id: str) -> PydanticObjectId:
+    """
+    ID de reseña de la ruta como ObjectId (400 si no es válido)
+    str() del resultado es la forma canónica (hex en minúsculas) con la que se etiqueta en la caché
+    """
+    try:
+        return PydanticObjectId(resena_id)
+    except InvalidId:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ID de reseña no válido"
+        )
+
+
+def parse_fields(fields: Optional[str]) -> Optional[FrozenSet[str]]:
+    """
+    Convierte "campo1,campo2" en el conjunto de campos de ResenaResponse pedidos
+    (None = todos); "id" equivale a "_id"
+    """
+    if fields is None:
+        return None
+    
+    campos = frozenset("_id" if c.strip() == "id" else c.strip() for c in fields.split(",") if c.strip())
+    desconocidos = campos - CAMPOS_RESPUESTA
+    if not campos or desconocidos:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=(
+                f"fields no es válido ({', '.join(sorted(desconocidos)) or 'vacío'}); "
+                f"campos disponibles: {', '.join(sorted(CAMPOS_RESPUESTA))}"
+            )
+        )
+    return campos
+
+
+def normalizar_fields(campos: Optional[FrozenSet[str]]) -> Optional[str]:
+    """fields en forma canónica para la clave de la caché de respuestas"""
+    return ",".join(sorted(campos)) if campos is not None else None
+
+
+async def subir_archivo(archivo: ArchivoRecibido) -> str:
+    """
+    Sube un archivo recibido a Cloudinary y devuelve su URL
+    Si ya se subió una imagen con el mismo contenido (SHA-256) se reutiliza su URL
+    sin volver a transferirla (caché en memoria y después colección `imagenes`)
+    Si otra petición subió el mismo contenido a la vez, se devuelve la URL que quedó registrada
+    """
+    sha256 = archivo.sha256
+    url = image_url_cache.get(sha256) or await ImagenCRUD.get_url(sha256)
+    
+    if url is None:
+        subida = await upload_image(archivo.file, archivo.filename or "resena.jpg")
+        if subida is None:
+            raise ValueError("No se pudo subir la imagen a Cloudinary")
+        url = await ImagenCRUD.registrar(sha256, subida, archivo.size)
+        if url != subida:
+            logging.warning(f"Imagen {sha256[:12]} subida a la vez por otra petición; {subida} queda sin usar")
+    else:
+        logging.info(f"Imagen duplicada ({sha256[:12]}), se reutiliza {url}")
+    
+    image_url_cache.set(sha256, url)
+    return url
 
 
 @router.post("/", response_model=ResenaResponse, status_code=status.HTTP_201_CREATED)
@@ -87,61 +203,174 @@ async def crear_resena(
         )
 
 
+@router.post(
+    "/import",
+    response_model=ImportacionResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/x-ndjson": {
+                    "schema": {"type": "string", "description": "Una reseña (ResenaCreate) en JSON por línea"}
+                }
+            }
+        }
+    }
+)
+async def importar_resenas(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    token_info: tuple = Depends(extract_token_info)
+):
+    """
+    Importación masiva de reseñas desde un cuerpo NDJSON (una reseña en JSON por línea,
+    con los campos de ResenaCreate), todas a nombre del usuario autenticado
+    El cuerpo se procesa según llega y se escribe en lotes de IMPORT_BATCH_SIZE, así que no
+    hay límite de tamaño; las filas no válidas se saltan y se detallan en el informe
+    Requiere autenticación OAuth
+    """
+    token_emision, token_caducidad, token_oauth = token_info
+    
+    try:
+        informe = await ResenaCRUD.importar(
+            request.stream(),
+            email_autor=current_user.email,
+            nombre_autor=current_user.name,
+            token_emision=token_emision,
+            token_caducidad=token_caducidad,
+            token_oauth=token_oauth,
+            batch_size=settings.IMPORT_BATCH_SIZE,
+            max_bytes_linea=settings.IMPORT_MAX_LINE_BYTES,
+            max_errores=settings.IMPORT_MAX_ERRORES
+        )
+        logging.info(
+            f"Importación de {current_user.email}: {informe.insertadas} insertadas, {informe.fallidas} fallidas"
+        )
+        return informe
+    except Exception as e:
+        logging.error(f"Error al importar reseñas: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al importar reseñas: {str(e)}"
+        )
+
+
 @router.get("/", response_model=ResenaListResponse)
 async def listar_resenas(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
     email_autor: Optional[str] = None,
+    with_total: bool = Query(True, description="Si es false no se calcula el total (total=null)"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Lista todas las reseñas con paginación
+    Lista todas las reseñas con paginación, más recientes primero
     Si se proporciona email_autor, filtra por ese autor
+    Paginación por skip/limit o por cursor (next_cursor de la respuesta)
+    Con fields solo se leen de MongoDB y se devuelven esos campos
+    El listado y el total se consultan en paralelo
+    Respuesta cacheada (X-Cache), invalidada por cualquier escritura (o del autor, si se filtra por él)
     Requiere autenticación OAuth
     """
-    try:
-        resenas = await ResenaCRUD.get_all(skip=skip, limit=limit, email_autor=email_autor)
-        total = await ResenaCRUD.count(email_autor=email_autor)
-        
-        resenas_response = [
-            ResenaResponse(
-                _id=str(r.id),
-                nombre_establecimiento=r.nombre_establecimiento,
-                direccion=r.direccion,
-                latitud=r.latitud,
-                longitud=r.longitud,
-                valoracion=r.valoracion,
-                email_autor=r.email_autor,
-                nombre_autor=r.nombre_autor,
-                token_emision=r.token_emision,
-                token_caducidad=r.token_caducidad,
-                token_oauth=r.token_oauth,
-                imagenes=r.imagenes,
-                created_at=r.created_at
+    despues_de = decode_keyset_cursor(cursor)
+    campos = parse_fields(fields)
+    
+    async def calcular() -> Response:
+        try:
+            listado = ResenaCRUD.get_all(
+                skip=skip,
+                limit=limit,
+                email_autor=email_autor,
+                despues_de=despues_de,
+                proyeccion=proyeccion_resena(campos, requeridos=("created_at",))
             )
-            for r in resenas
-        ]
-        
-        return ResenaListResponse(resenas=resenas_response, total=total)
-    except Exception as e:
-        logging.error(f"Error al listar reseñas: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al listar reseñas: {str(e)}"
-        )
+            
+            if with_total:
+                resenas, total = await asyncio.gather(listado, ResenaCRUD.count(email_autor=email_autor))
+            else:
+                resenas, total = await listado, None
+            
+            siguiente = next_cursor(resenas, limit)
+            
+            return respuesta_json(resena_lista_lectura_adapter, {
+                "resenas": [resena_lectura(r, campos) for r in resenas],
+                "total": total,
+                "next_cursor": siguiente
+            })
+        except Exception as e:
+            logging.error(f"Error al listar reseñas: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error al listar reseñas: {str(e)}"
+            )
+    
+    return await response_cache.responder(
+        "resenas.listar",
+        {
+            "skip": skip,
+            "limit": limit,
+            "cursor": cursor,
+            "email_autor": email_autor,
+            "with_total": with_total,
+            "fields": normalizar_fields(campos)
+        },
+        [etiqueta_autor(email_autor)] if email_autor else [ETIQUETA_RESENAS],
+        calcular
+    )
 
 
 @router.get("/mis-resenas", response_model=ResenaListResponse)
 async def mis_resenas(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    with_total: bool = Query(True, description="Si es false no se calcula el total (total=null)"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
     current_user: User = Depends(get_current_user)
 ):
     """
     Lista las reseñas del usuario autenticado
     Requiere autenticación OAuth
     """
-    return await listar_resenas(skip=skip, limit=limit, email_autor=current_user.email, current_user=current_user)
+    return await listar_resenas(
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        email_autor=current_user.email,
+        with_total=with_total,
+        fields=fields,
+        current_user=current_user
+    )
+
+
+@router.get("/sugerencias", response_model=List[SugerenciaResponse])
+async def sugerir_establecimientos(
+    q: str = Query(..., min_length=1, max_length=200),
+    k: int = Query(10, ge=1, le=50),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Autocompletado de nombres de establecimiento mientras el usuario escribe
+    Devuelve los k establecimientos con más reseñas que tienen alguna palabra que empieza
+    por el texto (sin distinguir tildes ni mayúsculas); se sirve desde memoria, sin consultar MongoDB
+    salvo para construir el índice la primera vez en cada proceso y cada SUGERENCIAS_TTL_SECONDS
+    (así recoge las reseñas creadas en otras instancias)
+    Requiere autenticación OAuth
+    """
+    try:
+        await indice_sugerencias.asegurar(ResenaCRUD.count_by_establecimiento)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al cargar las sugerencias: {str(e)}"
+        )
+    
+    return [
+        SugerenciaResponse(nombre_establecimiento=nombre, total_resenas=total)
+        for nombre, total in indice_sugerencias.buscar(q, k)
+    ]
 
 
 @router.get("/establecimiento/{nombre}", response_model=List[ResenaResponse])
@@ -149,33 +378,35 @@ async def buscar_por_establecimiento(
     nombre: str,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Busca reseñas por nombre del establecimiento (búsqueda parcial)
+    Busca reseñas por nombre del establecimiento o dirección (por prefijo, sin distinguir tildes
+    ni mayúsculas), ordenadas por relevancia
+    El cursor de la página siguiente se devuelve en la cabecera X-Next-Cursor
     Requiere autenticación OAuth
     """
+    despues_de = decode_search_cursor(cursor)
+    campos = parse_fields(fields)
+    
     try:
-        resenas = await ResenaCRUD.get_by_establecimiento(nombre, skip=skip, limit=limit)
+        resultados = await ResenaCRUD.get_by_establecimiento(
+            nombre,
+            skip=skip,
+            limit=limit,
+            despues_de=despues_de,
+            proyeccion=proyeccion_resena(campos, requeridos=("created_at",))
+        )
         
-        return [
-            ResenaResponse(
-                _id=str(r.id),
-                nombre_establecimiento=r.nombre_establecimiento,
-                direccion=r.direccion,
-                latitud=r.latitud,
-                longitud=r.longitud,
-                valoracion=r.valoracion,
-                email_autor=r.email_autor,
-                nombre_autor=r.nombre_autor,
-                token_emision=r.token_emision,
-                token_caducidad=r.token_caducidad,
-                token_oauth=r.token_oauth,
-                imagenes=r.imagenes,
-                created_at=r.created_at
-            )
-            for r in resenas
-        ]
+        siguiente = next_search_cursor(resultados, limit)
+        
+        return respuesta_json(
+            resenas_lectura_adapter,
+            [resena_lectura(r, campos) for r, _ in resultados],
+            headers={"X-Next-Cursor": siguiente} if siguiente else None
+        )
     except Exception as e:
         logging.error(f"Error al buscar reseñas por establecimiento: {str(e)}")
         raise HTTPException(
@@ -184,43 +415,184 @@ async def buscar_por_establecimiento(
         )
 
 
-@router.get("/ubicacion", response_model=List[ResenaResponse])
+@router.get("/ubicacion", response_model=List[ResenaCercanaResponse])
 async def buscar_por_ubicacion(
     latitud: float = Query(..., ge=-90, le=90),
     longitud: float = Query(..., ge=-180, le=180),
     radio_km: float = Query(5.0, ge=0.1, le=100),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="Cursor opaco de la página anterior (X-Next-Cursor)"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Busca reseñas cercanas a una ubicación, ordenadas por distancia (km)
+    Devuelve como mucho `limit` reseñas por página; si hay más dentro del radio, el cursor de
+    la página siguiente se devuelve en la cabecera X-Next-Cursor
+    distancia_km se devuelve siempre, también con fields
+    Respuesta cacheada (X-Cache), invalidada por escrituras en las celdas de geohash de la zona
+    Requiere autenticación OAuth
+    """
+    despues_de = decode_distance_cursor(cursor)
+    campos = parse_fields(fields)
+    salida = campos | {"distancia_km"} if campos is not None else None
+    
+    async def calcular() -> Response:
+        try:
+            resenas = await ResenaCRUD.get_by_location(
+                latitud, longitud, radio_km, limit=limit, despues_de=despues_de,
+                proyeccion=proyeccion_resena(campos)
+            )
+            
+            siguiente = next_distance_cursor(resenas, limit, despues_de)
+            
+            return respuesta_json(
+                resenas_cercanas_lectura_adapter,
+                [resena_lectura(r, salida) for r in resenas],
+                headers={"X-Next-Cursor": siguiente} if siguiente else None
+            )
+        except Exception as e:
+            logging.error(f"Error al buscar reseñas por ubicación: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error al buscar reseñas por ubicación: {str(e)}"
+            )
+    
+    return await response_cache.responder(
+        "resenas.ubicacion",
+        {
+            "latitud": latitud,
+            "longitud": longitud,
+            "radio_km": radio_km,
+            "limit": limit,
+            "cursor": cursor,
+            "fields": normalizar_fields(campos)
+        },
+        etiquetas_zona(latitud, longitud, radio_km),
+        calcular
+    )
+
+
+@router.get("/cercanas", response_model=List[ResenaCercanaResponse])
+async def buscar_cercanas(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=100),
+    min_valoracion: Optional[float] = Query(None, ge=0, le=5),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Busca reseñas cercanas a una ubicación
+    Devuelve las k reseñas más cercanas a (lat, lon), ordenadas por distancia (km)
+    Con min_valoracion solo se consideran reseñas con al menos esa valoración
+    distancia_km se devuelve siempre, también con fields
     Requiere autenticación OAuth
     """
+    campos = parse_fields(fields)
+    salida = campos | {"distancia_km"} if campos is not None else None
+    
     try:
-        resenas = await ResenaCRUD.get_by_location(latitud, longitud, radio_km)
+        resenas = await ResenaCRUD.get_nearest(
+            lat, lon, k=k, min_valoracion=min_valoracion, proyeccion=proyeccion_resena(campos)
+        )
+        
+        return respuesta_json(
+            resenas_cercanas_lectura_adapter,
+            [resena_lectura(r, salida) for r in resenas]
+        )
+    except Exception as e:
+        logging.error(f"Error al buscar reseñas cercanas: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al buscar reseñas cercanas: {str(e)}"
+        )
+
+
+@router.get("/clusters", response_model=List[ClusterResponse])
+async def agrupar_por_zona(
+    bbox: str = Query(..., description="Rectángulo visible: oeste,sur,este,norte"),
+    zoom: int = Query(..., ge=0, le=22),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Agrupa las reseñas del rectángulo visible del mapa en celdas de geohash según el zoom
+    Cada grupo trae su centroide, número de reseñas y valoración media
+    (y el ID de la reseña cuando es una sola, para pintarla como marcador normal)
+    Requiere autenticación OAuth
+    """
+    lat_min, lon_min, lat_max, lon_max = parse_bbox(bbox)
+    
+    try:
+        clusters = await ResenaCRUD.get_clusters(
+            lat_min, lon_min, lat_max, lon_max,
+            precision=geohash.precision_para_zoom(zoom)
+        )
         
         return [
-            ResenaResponse(
-                _id=str(r.id),
-                nombre_establecimiento=r.nombre_establecimiento,
-                direccion=r.direccion,
-                latitud=r.latitud,
-                longitud=r.longitud,
-                valoracion=r.valoracion,
-                email_autor=r.email_autor,
-                nombre_autor=r.nombre_autor,
-                token_emision=r.token_emision,
-                token_caducidad=r.token_caducidad,
-                token_oauth=r.token_oauth,
-                imagenes=r.imagenes,
-                created_at=r.created_at
+            ClusterResponse(
+                geohash=c["geohash"],
+                latitud=c["latitud"],
+                longitud=c["longitud"],
+                count=c["count"],
+                valoracion_media=c["valoracion_media"],
+                resena_id=str(c["resena_id"]) if c["resena_id"] else None
             )
-            for r in resenas
+            for c in clusters
         ]
     except Exception as e:
-        logging.error(f"Error al buscar reseñas por ubicación: {str(e)}")
+        logging.error(f"Error al agrupar reseñas por zona: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al buscar reseñas por ubicación: {str(e)}"
+            detail=f"Error al agrupar reseñas: {str(e)}"
+        )
+
+
+@router.get(
+    "/tiles/{z}/{x}/{y}.mvt",
+    response_class=Response,
+    responses={200: {"content": {mvt.MEDIA_TYPE: {}}, "description": "Tesela vectorial (capa 'resenas')"}}
+)
+async def tesela_resenas(
+    z: int,
+    x: int,
+    y: int,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Tesela vectorial Mapbox (MVT) con las reseñas de la tesela z/x/y como puntos
+    Capa "resenas" con las propiedades id y valoracion
+    Las teselas se cachean en memoria y cada escritura invalida solo las que contienen la reseña
+    (en el proceso que la atiende; en otras instancias, como mucho TILE_CACHE_TTL_SECONDS después)
+    Requiere autenticación OAuth
+    """
+    if z > settings.TILE_MAX_ZOOM or not mvt.tesela_valida(z, x, y):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Tesela no válida (zoom máximo {settings.TILE_MAX_ZOOM})"
+        )
+    
+    try:
+        version, datos = mvt.tile_cache.get((z, x, y))
+        if datos is None:
+            puntos = await ResenaCRUD.get_puntos(
+                *mvt.bbox_tesela(z, x, y, buffer=mvt.BUFFER),
+                limit=settings.TILE_MAX_FEATURES
+            )
+            datos = mvt.encode_tesela_puntos(
+                "resenas", z, x, y,
+                (
+                    (p["latitud"], p["longitud"], {"id": str(p["_id"]), "valoracion": p["valoracion"]})
+                    for p in puntos
+                )
+            )
+            mvt.tile_cache.set((z, x, y), version, datos)
+        
+        return Response(content=datos, media_type=mvt.MEDIA_TYPE)
+    except Exception as e:
+        logging.error(f"Error al generar tesela {z}/{x}/{y}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al generar tesela: {str(e)}"
         )
 
 
@@ -230,47 +602,137 @@ async def buscar_por_valoracion(
     max_valoracion: float = Query(5, ge=0, le=5),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
     current_user: User = Depends(get_current_user)
 ):
     """
     Busca reseñas por rango de valoración
+    El cursor de la página siguiente se devuelve en la cabecera X-Next-Cursor
+    Respuesta cacheada (X-Cache), invalidada por escrituras de reseñas con valoración en el rango
     Requiere autenticación OAuth
     """
-    try:
-        if min_valoracion > max_valoracion:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="min_valoracion no puede ser mayor que max_valoracion"
+    despues_de = decode_keyset_cursor(cursor)
+    campos = parse_fields(fields)
+    
+    async def calcular() -> Response:
+        try:
+            if min_valoracion > max_valoracion:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="min_valoracion no puede ser mayor que max_valoracion"
+                )
+            
+            resenas = await ResenaCRUD.get_by_valoracion(
+                min_valoracion,
+                max_valoracion,
+                skip,
+                limit,
+                despues_de=despues_de,
+                proyeccion=proyeccion_resena(campos, requeridos=("created_at",))
             )
-        
-        resenas = await ResenaCRUD.get_by_valoracion(min_valoracion, max_valoracion, skip, limit)
-        
-        return [
-            ResenaResponse(
-                _id=str(r.id),
-                nombre_establecimiento=r.nombre_establecimiento,
-                direccion=r.direccion,
-                latitud=r.latitud,
-                longitud=r.longitud,
-                valoracion=r.valoracion,
-                email_autor=r.email_autor,
-                nombre_autor=r.nombre_autor,
-                token_emision=r.token_emision,
-                token_caducidad=r.token_caducidad,
-                token_oauth=r.token_oauth,
-                imagenes=r.imagenes,
-                created_at=r.created_at
+            
+            siguiente = next_cursor(resenas, limit)
+            
+            return respuesta_json(
+                resenas_lectura_adapter,
+                [resena_lectura(r, campos) for r in resenas],
+                headers={"X-Next-Cursor": siguiente} if siguiente else None
             )
-            for r in resenas
-        ]
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.error(f"Error al buscar reseñas por valoración: {str(e)}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            logging.error(f"Error al buscar reseñas por valoración: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error al buscar reseñas por valoración: {str(e)}"
+            )
+    
+    return await response_cache.responder(
+        "resenas.valoracion",
+        {
+            "min_valoracion": min_valoracion,
+            "max_valoracion": max_valoracion,
+            "skip": skip,
+            "limit": limit,
+            "cursor": cursor,
+            "fields": normalizar_fields(campos)
+        },
+        etiquetas_rango_valoracion(min_valoracion, max_valoracion),
+        calcular
+    )
+
+
+@router.get(
+    "/export",
+    response_class=ClosingStreamingResponse,
+    responses={200: {
+        "content": {"application/x-ndjson": {}, "application/json": {}},
+        "description": "Reseñas en NDJSON (una por línea) o como array JSON"
+    }}
+)
+async def exportar_resenas(
+    formato: Literal["ndjson", "json"] = Query("ndjson", description="ndjson (una reseña por línea) o json (array)"),
+    email_autor: Optional[str] = None,
+    min_valoracion: Optional[float] = Query(None, ge=0, le=5),
+    max_valoracion: Optional[float] = Query(None, ge=0, le=5),
+    q: Optional[str] = Query(None, min_length=1, max_length=200, description="Texto en el nombre o la dirección"),
+    bbox: Optional[str] = Query(None, description="Rectángulo: oeste,sur,este,norte"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Exporta en streaming todas las reseñas que cumplen los filtros, más recientes primero,
+    sin límite de tamaño: se leen de MongoDB y se envían por lotes de EXPORT_BATCH_SIZE
+    con memoria constante. Si el cliente se desconecta se cierra el cursor
+    Un error a mitad de exportación corta la conexión (la respuesta queda incompleta)
+    Requiere autenticación OAuth
+    """
+    if min_valoracion is not None and max_valoracion is not None and min_valoracion > max_valoracion:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al buscar reseñas por valoración: {str(e)}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="min_valoracion no puede ser mayor que max_valoracion"
         )
+    rectangulo = parse_bbox(bbox) if bbox else None
+    campos = parse_fields(fields)
+    
+    lotes = ResenaCRUD.exportar(
+        email_autor=email_autor,
+        min_valoracion=min_valoracion,
+        max_valoracion=max_valoracion,
+        texto=q,
+        bbox=rectangulo,
+        proyeccion=proyeccion_resena(campos),
+        batch_size=settings.EXPORT_BATCH_SIZE
+    )
+    
+    async def cuerpo() -> AsyncIterator[bytes]:
+        exportadas = 0
+        try:
+            async with aclosing(lotes):
+                if formato == "json":
+                    yield b"["
+                async for lote in lotes:
+                    docs = [resena_lectura(doc, campos) for doc in lote]
+                    if formato == "ndjson":
+                        yield b"".join(resena_lectura_adapter.dump_json(doc) + b"\n" for doc in docs)
+                    else:
+                        # Array del lote sin corchetes, unido al anterior con una coma
+                        yield (b"," if exportadas else b"") + resenas_lectura_adapter.dump_json(docs)[1:-1]
+                    exportadas += len(docs)
+                if formato == "json":
+                    yield b"]"
+            logging.info(f"Exportación de {current_user.email}: {exportadas} reseñas")
+        except Exception as e:
+            logging.error(f"Error al exportar reseñas tras {exportadas}: {str(e)}")
+            raise
+    
+    extension = "ndjson" if formato == "ndjson" else "json"
+    return ClosingStreamingResponse(
+        cuerpo(),
+        media_type="application/x-ndjson" if formato == "ndjson" else "application/json",
+        headers={"Content-Disposition": f'attachment; filename="resenas.{extension}"'}
+    )
 
 
 @router.get("/{resena_id}", response_model=ResenaResponse)
@@ -280,40 +742,39 @@ async def obtener_resena(
 ):
     """
     Obtiene una reseña por su ID
+    Respuesta cacheada (X-Cache), invalidada al editar o eliminar la reseña
     Requiere autenticación OAuth
     """
-    try:
-        resena = await ResenaCRUD.get_by_id(PydanticObjectId(resena_id))
-        
-        if not resena:
+    # Clave y etiqueta con el ID canónico: las escrituras invalidan con str(ObjectId)
+    oid = parse_resena_id(resena_id)
+    resena_id = str(oid)
+    
+    async def calcular() -> Response:
+        try:
+            resena = await ResenaCRUD.get_by_id(oid)
+            
+            if not resena:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Reseña no encontrada"
+                )
+            
+            return respuesta_json(resena_lectura_adapter, resena_lectura(resena))
+        except HTTPException:
+            raise
+        except Exception as e:
+            logging.error(f"Error al obtener reseña: {str(e)}")
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Reseña no encontrada"
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error al obtener reseña: {str(e)}"
             )
-        
-        return ResenaResponse(
-            _id=str(resena.id),
-            nombre_establecimiento=resena.nombre_establecimiento,
-            direccion=resena.direccion,
-            latitud=resena.latitud,
-            longitud=resena.longitud,
-            valoracion=resena.valoracion,
-            email_autor=resena.email_autor,
-            nombre_autor=resena.nombre_autor,
-            token_emision=resena.token_emision,
-            token_caducidad=resena.token_caducidad,
-            token_oauth=resena.token_oauth,
-            imagenes=resena.imagenes,
-            created_at=resena.created_at
-        )
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.error(f"Error al obtener reseña: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al obtener reseña: {str(e)}"
-        )
+    
+    return await response_cache.responder(
+        "resenas.obtener",
+        {"resena_id": resena_id},
+        [etiqueta_resena(resena_id)],
+        calcular
+    )
 
 
 @router.put("/{resena_id}", response_model=ResenaResponse)
@@ -327,9 +788,11 @@ async def actualizar_resena(
     Solo el autor puede actualizar su reseña
     Requiere autenticación OAuth
     """
+    oid = parse_resena_id(resena_id)
+    
     try:
         resena = await ResenaCRUD.update(
-            resena_id=PydanticObjectId(resena_id),
+            resena_id=oid,
             resena_data=resena_data,
             email_autor=current_user.email
         )
@@ -377,9 +840,11 @@ async def eliminar_resena(
     Solo el autor puede eliminar su reseña
     Requiere autenticación OAuth
     """
+    oid = parse_resena_id(resena_id)
+    
     try:
         deleted = await ResenaCRUD.delete(
-            resena_id=PydanticObjectId(resena_id),
+            resena_id=oid,
             email_autor=current_user.email
         )
         
@@ -401,38 +866,128 @@ async def eliminar_resena(
         )
 
 
-@router.post("/upload-image", response_model=dict)
+@router.post(
+    "/upload-image",
+    response_model=dict,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {"file": {"type": "string", "format": "binary"}}
+                    }
+                }
+            }
+        }
+    }
+)
 async def upload_resena_image(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
     """
     Subir una imagen a Cloudinary (requiere autenticación)
+    El archivo se recibe en streaming y el límite de 10MB se aplica según llegan los bytes
     
     Returns:
         {"url": "https://res.cloudinary.com/..."}
     """
-    # Validar tipo de archivo
-    if not file.content_type or not file.content_type.startswith('image/'):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="El archivo debe ser una imagen"
-        )
-    
-    # Validar tamaño (max 10MB)
-    file_content = await file.read()
-    if len(file_content) > 10 * 1024 * 1024:  # 10MB
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="La imagen no puede superar los 10MB"
-        )
+    archivos = await recibir_archivos(
+        request,
+        max_bytes=MAX_IMAGE_SIZE,
+        max_files=1,
+        error_tamano="La imagen no puede superar los 10MB"
+    )
+    file = archivos[0]
     
     try:
-        url = await upload_image(file_content, file.filename or "resena.jpg")
+        # Validar tipo de archivo
+        if not file.content_type or not file.content_type.startswith('image/'):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El archivo debe ser una imagen"
+            )
+        
+        url = await subir_archivo(file)
         return {"url": url}
+    except HTTPException:
+        raise
+    except UploadQueueFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
     except Exception as e:
         logging.error(f"Error al subir imagen: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al subir imagen: {str(e)}"
         )
+    finally:
+        file.close()
+
+
+@router.post(
+    "/upload-images",
+    response_model=ImagenesSubidaResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["files"],
+                        "properties": {
+                            "files": {"type": "array", "items": {"type": "string", "format": "binary"}}
+                        }
+                    }
+                }
+            }
+        }
+    }
+)
+async def upload_resena_images(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Subir varias imágenes a Cloudinary en una sola petición (requiere autenticación)
+    Las subidas se hacen en paralelo (máximo CLOUDINARY_BATCH_PARALLELISM a la vez)
+    Las imágenes ya subidas anteriormente (mismo contenido) no se vuelven a transferir
+    Los resultados mantienen el orden de envío y cada imagen informa de su propio error
+    
+    Returns:
+        {"resultados": [{"filename": "...", "url": "https://...", "error": null}, ...]}
+    """
+    archivos = await recibir_archivos(
+        request,
+        max_bytes=MAX_IMAGE_SIZE,
+        max_files=MAX_IMAGES_PER_BATCH,
+        error_tamano="La imagen no puede superar los 10MB",
+        abortar_si_excede=False
+    )
+    semaforo = asyncio.Semaphore(settings.CLOUDINARY_BATCH_PARALLELISM)
+    
+    async def subir(archivo: ArchivoRecibido) -> ImagenSubidaResultado:
+        resultado = ImagenSubidaResultado(filename=archivo.filename)
+        try:
+            if archivo.error:
+                resultado.error = archivo.error
+            elif not archivo.content_type.startswith('image/'):
+                resultado.error = "El archivo debe ser una imagen"
+            else:
+                async with semaforo:
+                    resultado.url = await subir_archivo(archivo)
+        except Exception as e:
+            logging.error(f"Error al subir imagen {archivo.filename}: {str(e)}")
+            resultado.error = str(e)
+        finally:
+            archivo.close()
+        return resultado
+    
+    resultados = await asyncio.gather(*(subir(archivo) for archivo in archivos))
+    return ImagenesSubidaResponse(resultados=resultados)
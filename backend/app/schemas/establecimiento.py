@@ -0,0 +1,18 @@
+from pydantic import BaseModel, Field
+from typing import Optional, Dict
+from datetime import datetime
+
+
+class EstablecimientoResponse(BaseModel):
+    """Schema para respuesta de establecimiento con sus valoraciones agregadas (Response)"""
+    clave: str
+    nombre: str
+    direccion: str
+    latitud: float
+    longitud: float
+    count: int = Field(..., description="Número de reseñas")
+    avg: Optional[float] = Field(None, description="Valoración media")
+    min: Optional[float] = None
+    max: Optional[float] = None
+    histograma: Dict[str, int] = Field(default_factory=dict, description="Reseñas por valoración entera")
+    ultima_resena_at: Optional[datetime] = None
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr, Field, field_validator
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, TypeAdapter, field_validator
+from typing import AbstractSet, Dict, Iterable, Optional, List
+from typing_extensions import TypedDict  # pydantic requiere la de typing_extensions en Python < 3.12
 from datetime import datetime
 from beanie import PydanticObjectId
 
@@ -30,8 +31,21 @@ class ResenaCreate(ResenaBase):
     pass
 
 
+class ResenaImportacion(ResenaCreate):
+    """
+    Fila de una importación desde la línea de comandos (migraciones)
+    El autor y la fecha son opcionales: por defecto, los indicados al lanzar la importación
+    """
+    email_autor: Optional[EmailStr] = None
+    nombre_autor: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
 class ResenaUpdate(BaseModel):
-    """Schema para actualizar una reseña (Request)"""
+    """
+    Schema para actualizar una reseña (Request)
+    Los campos son opcionales (solo se actualizan los enviados), pero no admiten null
+    """
     nombre_establecimiento: Optional[str] = Field(None, min_length=1, max_length=200)
     direccion: Optional[str] = Field(None, max_length=300)
     latitud: Optional[float] = Field(None, ge=-90, le=90)
@@ -39,6 +53,14 @@ class ResenaUpdate(BaseModel):
     valoracion: Optional[float] = Field(None, ge=0, le=5)
     imagenes: Optional[List[str]] = None
     
+    @field_validator('nombre_establecimiento', 'direccion', 'latitud', 'longitud', 'valoracion', 'imagenes')
+    @classmethod
+    def validate_no_null(cls, v):
+        """Rechaza null explícito: se escribiría con $set en un campo obligatorio de la reseña"""
+        if v is None:
+            raise ValueError('El campo no puede ser null; para no modificarlo, no lo envíes')
+        return v
+    
     @field_validator('valoracion')
     @classmethod
     def validate_valoracion(cls, v: Optional[float]) -> Optional[float]:
@@ -65,7 +87,132 @@ class ResenaResponse(ResenaBase):
         }
 
 
+class ResenaCercanaResponse(ResenaResponse):
+    """Schema para reseña devuelta por búsqueda geográfica, con distancia al punto (Response)"""
+    distancia_km: float
+
+
 class ResenaListResponse(BaseModel):
     """Schema para lista de reseñas (Response)"""
     resenas: List[ResenaResponse]
-    total: int
+    total: Optional[int] = None  # None si se pidió with_total=false
+    next_cursor: Optional[str] = None  # Cursor para pedir la página siguiente (None si no hay más)
+
+
+# --- Lectura rápida ---
+# Los endpoints de lectura no construyen Resena ni ResenaResponse por documento: leen de
+# MongoDB solo los campos de ResenaResponse (RESENA_PROYECCION) y los serializan a JSON
+# directamente con TypeAdapters precompilados sobre TypedDicts con la misma forma,
+# sin volver a validar lo que ya se validó al escribir
+
+RESENA_PROYECCION = {
+    campo: 1
+    for campo in (
+        "nombre_establecimiento", "direccion", "latitud", "longitud", "valoracion",
+        "email_autor", "nombre_autor", "token_emision", "token_caducidad", "token_oauth",
+        "imagenes", "created_at"
+    )
+}
+
+ResenaLectura = TypedDict("ResenaLectura", {
+    "_id": str,
+    "nombre_establecimiento": str,
+    "direccion": str,
+    "latitud": float,
+    "longitud": float,
+    "valoracion": float,
+    "email_autor": str,
+    "nombre_autor": str,
+    "token_emision": datetime,
+    "token_caducidad": datetime,
+    "token_oauth": str,
+    "imagenes": List[str],
+    "created_at": datetime,
+})
+
+
+class ResenaCercanaLectura(ResenaLectura):
+    distancia_km: float
+
+
+class ResenaListaLectura(TypedDict):
+    resenas: List[ResenaLectura]
+    total: Optional[int]
+    next_cursor: Optional[str]
+
+
+resena_lectura_adapter = TypeAdapter(ResenaLectura)
+resenas_lectura_adapter = TypeAdapter(List[ResenaLectura])
+resenas_cercanas_lectura_adapter = TypeAdapter(List[ResenaCercanaLectura])
+resena_lista_lectura_adapter = TypeAdapter(ResenaListaLectura)
+
+
+# Campos de ResenaResponse con su nombre en el JSON ("_id", no "id"), para ?fields=
+CAMPOS_RESPUESTA = frozenset(campo.alias or nombre for nombre, campo in ResenaResponse.model_fields.items())
+
+
+def proyeccion_resena(campos: Optional[Iterable[str]] = None, requeridos: Iterable[str] = ()) -> Dict[str, int]:
+    """
+    Proyección de MongoDB para leer solo `campos` (todos los de ResenaResponse si es None)
+    más los `requeridos` por la consulta aunque no se devuelvan (p. ej. created_at para el cursor)
+    """
+    if campos is None:
+        return RESENA_PROYECCION
+    # _id explícito: una proyección vacía devolvería el documento entero
+    return {"_id": 1, **{campo: 1 for campo in (*campos, *requeridos)}}
+
+
+def resena_lectura(doc: dict, campos: Optional[AbstractSet[str]] = None) -> dict:
+    """
+    Adapta en el sitio un documento leído con RESENA_PROYECCION a la forma de ResenaResponse
+    Con `campos` (?fields=) deja solo esos campos y _id, quitando los leídos solo para la consulta
+    """
+    doc["_id"] = str(doc["_id"])
+    if "imagenes" not in doc and (campos is None or "imagenes" in campos):
+        doc["imagenes"] = []
+    if campos is not None:
+        for campo in doc.keys() - campos - {"_id"}:
+            del doc[campo]
+    return doc
+
+
+class ClusterResponse(BaseModel):
+    """Grupo de reseñas de una celda de geohash para pintar en el mapa"""
+    geohash: str
+    latitud: float = Field(..., description="Latitud del centroide de las reseñas de la celda")
+    longitud: float = Field(..., description="Longitud del centroide de las reseñas de la celda")
+    count: int
+    valoracion_media: float
+    resena_id: Optional[str] = Field(None, description="ID de la reseña si la celda solo tiene una")
+
+
+class SugerenciaResponse(BaseModel):
+    """Sugerencia de autocompletado de nombre de establecimiento"""
+    nombre_establecimiento: str
+    total_resenas: int
+
+
+class ImagenSubidaResultado(BaseModel):
+    """Resultado de la subida de una imagen dentro de un lote (Response)"""
+    filename: str
+    url: Optional[str] = None
+    error: Optional[str] = None
+
+
+class ImagenesSubidaResponse(BaseModel):
+    """Schema para la subida de varias imágenes, en el mismo orden en que se enviaron (Response)"""
+    resultados: List[ImagenSubidaResultado]
+
+
+class ImportacionError(BaseModel):
+    """Fila rechazada en una importación"""
+    linea: int  # Número de línea en el fichero NDJSON (desde 1)
+    error: str
+
+
+class ImportacionResponse(BaseModel):
+    """Informe de una importación masiva de reseñas"""
+    insertadas: int = 0
+    fallidas: int = 0
+    errores: List[ImportacionError] = Field(default_factory=list)
+    errores_omitidos: int = 0  # Fallidas sin detalle en `errores` (pasado IMPORT_MAX_ERRORES)
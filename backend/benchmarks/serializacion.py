@@ -0,0 +1,136 @@
+"""
+Coste de CPU por documento al serializar una página de reseñas
+
+Compara, sobre documentos sintéticos tal como llegan de MongoDB (sin consultarla):
+- camino anterior: Resena (Beanie) → ResenaResponse → ResenaListResponse → validación y
+  jsonable_encoder del response_model de FastAPI → JSONResponse
+- camino rápido: documento proyectado → resena_lectura → TypeAdapter.dump_json
+
+Resena es un Document de Beanie y necesita init_beanie, así que se lanza desde manage.py
+con la base de datos configurada: python manage.py bench-serializacion [--pagina 100]
+"""
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from app.models.resena import Resena
+from app.schemas.resena import (
+    RESENA_PROYECCION,
+    ResenaListResponse,
+    ResenaResponse,
+    resena_lectura,
+    resena_lista_lectura_adapter,
+)
+
+
+def documentos(n: int) -> List[dict]:
+    """Documentos completos de la colección de reseñas, como los devuelve motor"""
+    ahora = datetime(2024, 1, 1)
+    docs = []
+    for i in range(n):
+        latitud, longitud = 40.0 + i / 1000, -3.7 + i / 1000
+        docs.append({
+            "_id": ObjectId(),
+            "nombre_establecimiento": f"Restaurante número {i}",
+            "direccion": f"Calle Mayor {i}, Madrid",
+            "latitud": latitud,
+            "longitud": longitud,
+            "ubicacion": {"type": "Point", "coordinates": [longitud, latitud]},
+            "geohash": "ezjmgtwyz",
+            "valoracion": float(i % 6),
+            "email_autor": f"autor{i % 7}@example.com",
+            "nombre_autor": f"Autor {i % 7}",
+            "token_emision": ahora,
+            "token_caducidad": ahora + timedelta(hours=1),
+            "token_oauth": "x" * 180,
+            "imagenes": [f"https://res.cloudinary.com/demo/image/upload/{i}.jpg"],
+            "created_at": ahora - timedelta(minutes=i),
+            "busqueda_nombre": f"restaurante numero {i}",
+            "terminos_nombre": ["restaurante", "numero", str(i)],
+            "terminos": ["restaurante", "numero", str(i), "calle", "mayor", "madrid"],
+            "establecimiento": f"restaurante numero {i}|ezjmgtw",
+        })
+    return docs
+
+
+campo_respuesta = create_model_field(name="Response_listar", type_=ResenaListResponse, mode="serialization")
+
+
+async def camino_anterior(docs: List[dict]) -> bytes:
+    resenas = [Resena.model_validate(doc) for doc in docs]
+    contenido = ResenaListResponse(
+        resenas=[
+            ResenaResponse(
+                _id=str(r.id),
+                nombre_establecimiento=r.nombre_establecimiento,
+                direccion=r.direccion,
+                latitud=r.latitud,
+                longitud=r.longitud,
+                valoracion=r.valoracion,
+                email_autor=r.email_autor,
+                nombre_autor=r.nombre_autor,
+                token_emision=r.token_emision,
+                token_caducidad=r.token_caducidad,
+                token_oauth=r.token_oauth,
+                imagenes=r.imagenes,
+                created_at=r.created_at
+            )
+            for r in resenas
+        ],
+        total=len(resenas),
+        next_cursor=None
+    )
+    contenido = await serialize_response(field=campo_respuesta, response_content=contenido)
+    return JSONResponse(content=contenido).body
+
+
+async def camino_rapido(docs: List[dict]) -> bytes:
+    return resena_lista_lectura_adapter.dump_json({
+        "resenas": [resena_lectura(doc) for doc in docs],
+        "total": len(docs),
+        "next_cursor": None
+    })
+
+
+async def medir(
+    nombre: str,
+    funcion: Callable[[List[dict]], Awaitable[bytes]],
+    pagina: int,
+    repeticiones: int,
+    proyectar: bool
+) -> float:
+    # Cada repetición recibe documentos nuevos: resena_lectura los modifica en el sitio
+    lotes = []
+    for _ in range(repeticiones):
+        docs = documentos(pagina)
+        if proyectar:
+            docs = [{k: v for k, v in doc.items() if k == "_id" or k in RESENA_PROYECCION} for doc in docs]
+        lotes.append(docs)
+
+    inicio = time.perf_counter()
+    for docs in lotes:
+        await funcion(docs)
+    segundos = time.perf_counter() - inicio
+
+    us_por_doc = segundos / (pagina * repeticiones) * 1e6
+    print(f"{nombre:<10} {us_por_doc:8.2f} µs/documento  {segundos / repeticiones * 1e3:8.3f} ms/página")
+    return us_por_doc
+
+
+async def ejecutar(pagina: int = 100, repeticiones: int = 200) -> float:
+    """Mide los dos caminos y devuelve la aceleración del rápido sobre el anterior"""
+    # Mismo JSON por los dos caminos
+    docs = documentos(3)
+    anterior = json.loads(await camino_anterior([dict(d) for d in docs]))
+    rapido = json.loads(await camino_rapido([{k: v for k, v in d.items() if k == "_id" or k in RESENA_PROYECCION} for d in docs]))
+    assert anterior == rapido, "Los dos caminos producen JSON distinto"
+
+    print(f"Página de {pagina} reseñas, {repeticiones} repeticiones")
+    t_anterior = await medir("anterior", camino_anterior, pagina, repeticiones, proyectar=False)
+    t_rapido = await medir("rápido", camino_rapido, pagina, repeticiones, proyectar=True)
+    print(f"Aceleración: x{t_anterior / t_rapido:.1f}")
+    return t_anterior / t_rapido
@@ -0,0 +1,140 @@
+"""
+Comandos de mantenimiento del backend
+
+Uso:
+    python manage.py backfill-ubicacion
+    python manage.py backfill-geohash
+    python manage.py backfill-busqueda
+    python manage.py backfill-establecimientos
+    python manage.py indices [--crear]
+    python manage.py importar FICHERO.ndjson [--email-autor EMAIL] [--nombre-autor NOMBRE]
+    python manage.py bench-serializacion [--pagina 100] [--repeticiones 200]
+"""
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime
+from app.database.database import init_db, close_mongo_connection, DOCUMENT_MODELS
+from app.database.indices import crear_indices, esperar_indices, informe_indices
+from app.crud.resena_crud import ResenaCRUD
+from app.crud.establecimiento_crud import EstablecimientoCRUD
+from app.core.config import settings
+from app.core.importacion import leer_fichero
+from app.schemas.resena import ResenaImportacion
+
+
+async def backfill_ubicacion(args: argparse.Namespace) -> None:
+    """Rellena el campo GeoJSON `ubicacion` de las reseñas que no lo tienen"""
+    actualizadas = await ResenaCRUD.backfill_ubicacion()
+    logging.info(f"Reseñas con ubicación GeoJSON rellenada: {actualizadas}")
+
+
+async def backfill_geohash(args: argparse.Namespace) -> None:
+    """Calcula el geohash de las reseñas que no lo tienen (agrupación de marcadores)"""
+    actualizadas = await ResenaCRUD.backfill_geohash()
+    logging.info(f"Reseñas con geohash rellenado: {actualizadas}")
+
+
+async def backfill_busqueda(args: argparse.Namespace) -> None:
+    """Calcula los términos de búsqueda normalizados de las reseñas que no los tienen"""
+    actualizadas = await ResenaCRUD.backfill_busqueda()
+    logging.info(f"Reseñas con campos de búsqueda rellenados: {actualizadas}")
+
+
+async def backfill_establecimientos(args: argparse.Namespace) -> None:
+    """Reconstruye la colección de establecimientos y sus agregados a partir de las reseñas"""
+    total = await EstablecimientoCRUD.reconstruir()
+    logging.info(f"Establecimientos reconstruidos: {total}")
+
+
+async def indices(args: argparse.Namespace) -> None:
+    """Informa de índices que faltan, sin uso ($indexStats) o no declarados; con --crear crea los que faltan"""
+    if args.crear:
+        await crear_indices(DOCUMENT_MODELS)
+    informe = await informe_indices(DOCUMENT_MODELS)
+    print(json.dumps(informe, indent=2, default=str, ensure_ascii=False))
+
+
+async def importar(args: argparse.Namespace) -> None:
+    """
+    Importa reseñas desde un fichero NDJSON (seed de una ciudad, migraciones)
+    Cada fila puede traer email_autor, nombre_autor y created_at; si no, se usan los de los argumentos
+    Las reseñas importadas no tienen token OAuth (token_oauth vacío, emisión y caducidad = ahora)
+    """
+    ahora = datetime.utcnow()
+    informe = await ResenaCRUD.importar(
+        leer_fichero(args.fichero),
+        email_autor=args.email_autor,
+        nombre_autor=args.nombre_autor,
+        token_emision=ahora,
+        token_caducidad=ahora,
+        token_oauth="",
+        esquema=ResenaImportacion,
+        batch_size=args.batch_size,
+        max_bytes_linea=settings.IMPORT_MAX_LINE_BYTES,
+        max_errores=settings.IMPORT_MAX_ERRORES
+    )
+    logging.info(f"Reseñas importadas: {informe.insertadas}, fallidas: {informe.fallidas}")
+    print(informe.model_dump_json(indent=2))
+
+
+async def bench_serializacion(args: argparse.Namespace) -> None:
+    """Coste de CPU por documento de serializar una página de reseñas (camino anterior frente al rápido)"""
+    from benchmarks import serializacion  # Solo en el repositorio: las imágenes Docker no copian benchmarks/
+    await serializacion.ejecutar(args.pagina, args.repeticiones)
+
+
+COMANDOS = {
+    "backfill-ubicacion": backfill_ubicacion,
+    "backfill-geohash": backfill_geohash,
+    "backfill-busqueda": backfill_busqueda,
+    "backfill-establecimientos": backfill_establecimientos,
+    "indices": indices,
+    "importar": importar,
+    "bench-serializacion": bench_serializacion,
+}
+
+
+async def main(args: argparse.Namespace) -> None:
+    client = await init_db()
+    try:
+        await COMANDOS[args.comando](args)
+        # init_db lanza la creación de índices en segundo plano: se espera antes de cerrar el bucle
+        await esperar_indices()
+    finally:
+        await close_mongo_connection(client)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Comandos de mantenimiento de ReViews")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+    subparsers.add_parser("backfill-ubicacion", help="Rellena el campo GeoJSON ubicacion en reseñas antiguas")
+    subparsers.add_parser("backfill-geohash", help="Calcula el geohash de reseñas antiguas")
+    subparsers.add_parser("backfill-busqueda", help="Calcula los términos de búsqueda en reseñas antiguas")
+    subparsers.add_parser(
+        "backfill-establecimientos",
+        help="Reconstruye los establecimientos y sus valoraciones agregadas desde las reseñas"
+    )
+    parser_indices = subparsers.add_parser(
+        "indices",
+        help="Informa de índices que faltan o no se usan según $indexStats"
+    )
+    parser_indices.add_argument("--crear", action="store_true", help="Crea antes los índices que falten")
+    parser_importar = subparsers.add_parser("importar", help="Importa reseñas desde un fichero NDJSON")
+    parser_importar.add_argument("fichero", help="Fichero NDJSON: una reseña en JSON por línea")
+    parser_importar.add_argument("--email-autor", help="Autor de las filas que no indiquen email_autor")
+    parser_importar.add_argument("--nombre-autor", help="Nombre del autor de las filas que no lo indiquen")
+    parser_importar.add_argument(
+        "--batch-size", type=int, default=settings.IMPORT_BATCH_SIZE, help="Reseñas por insert_many"
+    )
+    parser_bench = subparsers.add_parser(
+        "bench-serializacion",
+        help="Mide el coste de CPU por documento de serializar una página de reseñas"
+    )
+    parser_bench.add_argument("--pagina", type=int, default=100, help="Reseñas por página")
+    parser_bench.add_argument("--repeticiones", type=int, default=200, help="Páginas serializadas por camino")
+
+    asyncio.run(main(parser.parse_args()))
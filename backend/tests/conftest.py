@@ -0,0 +1,14 @@
+import os
+
+# app.core.config exige estas variables al importarse; los tests no se conectan a nada
+for variable in (
+    "MONGODB_CONNECTION_STRING",
+    "MONGODB_DATABASE_NAME",
+    "JWT_SECRET_KEY",
+    "GOOGLE_CLIENT_ID",
+    "GOOGLE_CLIENT_SECRET",
+    "CLOUDINARY_CLOUD_NAME",
+    "CLOUDINARY_API_KEY",
+    "CLOUDINARY_API_SECRET",
+):
+    os.environ.setdefault(variable, "test")
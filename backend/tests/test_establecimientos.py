@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core import geohash
+from app.crud.establecimiento_crud import claves_candidatas, elegir_clave
+
+
+def test_vecinas_son_las_8_celdas_adyacentes():
+    celda = geohash.encode(40.4168, -3.7038, 7)
+    lat_min, lon_min, lat_max, lon_max = geohash.bounds(celda)
+    vecinas = geohash.vecinas(celda)
+
+    assert len(vecinas) == 8
+    assert celda not in vecinas
+    for vecina in vecinas:
+        v_lat_min, v_lon_min, v_lat_max, v_lon_max = geohash.bounds(vecina)
+        # Comparten al menos una esquina con la celda
+        assert v_lat_min <= lat_max and v_lat_max >= lat_min
+        assert v_lon_min <= lon_max and v_lon_max >= lon_min
+
+
+def test_vecinas_junto_al_polo_y_el_antimeridiano():
+    polo = geohash.encode(89.99, 10.0, 3)
+    assert len(geohash.vecinas(polo)) == 5
+
+    este = geohash.encode(0.0, 179.99, 5)
+    oeste = {geohash.bounds(v)[1] < 0 for v in geohash.vecinas(este)}
+    assert oeste == {True, False}
+
+
+def _junto_al_borde_este(nombre="Bar Pepe"):
+    """Punto a ~5 m del borde este de su celda y otro a ~5 m al otro lado del borde"""
+    celda = geohash.encode(40.4168, -3.7038, 7)
+    lat_min, _, lat_max, lon_max = geohash.bounds(celda)
+    latitud = (lat_min + lat_max) / 2
+    oeste = (latitud, lon_max - 0.00006)
+    este = (latitud, lon_max + 0.00006)
+    assert geohash.encode(*este, 7) != celda
+    return f"bar pepe|{celda}", oeste, este
+
+
+def test_misma_resena_a_ambos_lados_del_borde_es_un_establecimiento():
+    clave, oeste, este = _junto_al_borde_este()
+    assert elegir_clave("Bar Pepe", *este, {clave: oeste}) == clave
+
+
+def test_nombre_distinto_o_lejos_es_otro_establecimiento():
+    clave, oeste, este = _junto_al_borde_este()
+    propia = claves_candidatas("Bar Pepe", *este)[0]
+
+    assert elegir_clave("Bar Paco", *este, {clave: oeste}) == claves_candidatas("Bar Paco", *este)[0]
+    # A más de ESTABLECIMIENTO_RADIO_FUSION_M aunque la celda sea vecina
+    lejos = (oeste[0], oeste[1] - 0.0025)
+    assert elegir_clave("Bar Pepe", *este, {clave: lejos}) == propia
+
+
+def test_elige_el_establecimiento_mas_cercano():
+    clave, oeste, este = _junto_al_borde_este()
+    propia = claves_candidatas("Bar Pepe", *este)[0]
+    posiciones = {clave: (oeste[0], oeste[1] - 0.0005), propia: este}
+    assert elegir_clave("Bar Pepe", *este, posiciones) == propia
+
+
+# --- Agregados ($inc/$min/$max) sobre una MongoDB simulada ---
+
+def test_agregados_en_alta_cambio_y_baja():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from beanie import init_beanie
+    from app.crud.establecimiento_crud import EstablecimientoCRUD
+    from app.models.establecimiento import Establecimiento
+    from app.models.resena import Resena
+
+    inicio = datetime(2024, 1, 1)
+
+    def resena(valoracion: float, minutos: int) -> Resena:
+        return Resena(
+            nombre_establecimiento="Bar Pepe",
+            direccion="Calle Mayor 1",
+            latitud=40.4168,
+            longitud=-3.7038,
+            valoracion=valoracion,
+            email_autor="autor@example.com",
+            nombre_autor="Autor",
+            token_emision=inicio,
+            token_caducidad=inicio,
+            token_oauth="",
+            establecimiento="bar pepe|ezjmgtw",
+            created_at=inicio + timedelta(minutes=minutos)
+        )
+
+    async def escenario():
+        cliente = mongomock_motor.AsyncMongoMockClient()
+        await init_beanie(database=cliente.test, document_models=[Resena, Establecimiento])
+
+        resenas = [resena(4.0, 0), resena(2.5, 1), resena(5.0, 2)]
+        for r in resenas:
+            await r.insert()
+            await EstablecimientoCRUD.registrar_resena(r)
+
+        doc = await EstablecimientoCRUD.get("bar pepe|ezjmgtw")
+        assert (doc.num_resenas, doc.sum, doc.min, doc.max) == (3, 11.5, 2.5, 5.0)
+        assert doc.avg == pytest.approx(11.5 / 3)
+        assert doc.histograma == {"4": 1, "2": 1, "5": 1}
+        assert doc.ultima_resena_at == inicio + timedelta(minutes=2)
+
+        # La valoración máxima cambia: el nuevo máximo se relee de las reseñas
+        await resenas[2].set({"valoracion": 3.0})
+        await EstablecimientoCRUD.cambiar_valoracion("bar pepe|ezjmgtw", 5.0, 3.0)
+        doc = await EstablecimientoCRUD.get("bar pepe|ezjmgtw")
+        assert (doc.sum, doc.min, doc.max) == (9.5, 2.5, 4.0)
+        assert doc.histograma == {"4": 1, "2": 1, "3": 1}
+
+        await resenas[1].delete()
+        await EstablecimientoCRUD.retirar_resena("bar pepe|ezjmgtw", 2.5)
+        doc = await EstablecimientoCRUD.get("bar pepe|ezjmgtw")
+        assert (doc.num_resenas, doc.sum, doc.min, doc.avg) == (2, 7.0, 3.0, 3.5)
+        assert doc.histograma == {"4": 1, "3": 1}
+
+        for r, valoracion in ((resenas[0], 4.0), (resenas[2], 3.0)):
+            await r.delete()
+            await EstablecimientoCRUD.retirar_resena("bar pepe|ezjmgtw", valoracion)
+        assert await EstablecimientoCRUD.get("bar pepe|ezjmgtw") is None
+
+    asyncio.run(escenario())
@@ -0,0 +1,103 @@
+import struct
+from types import SimpleNamespace
+
+from app.core import cache, mvt
+
+
+def leer_mensaje(datos: bytes) -> list:
+    """Campos (número, valor) de un mensaje protobuf: varint (tipo 0), 64 bits (1) o bytes (2)"""
+    campos, i = [], 0
+
+    def varint():
+        nonlocal i
+        valor = desplazamiento = 0
+        while True:
+            byte = datos[i]
+            i += 1
+            valor |= (byte & 0x7F) << desplazamiento
+            desplazamiento += 7
+            if not byte & 0x80:
+                return valor
+
+    while i < len(datos):
+        clave = varint()
+        tipo = clave & 7
+        if tipo == 0:
+            campos.append((clave >> 3, varint()))
+        elif tipo == 1:
+            campos.append((clave >> 3, datos[i:i + 8]))
+            i += 8
+        else:
+            longitud = varint()
+            campos.append((clave >> 3, datos[i:i + longitud]))
+            i += longitud
+    return campos
+
+
+def test_tesela_con_un_punto():
+    tesela = mvt.encode_tesela_puntos("resenas", 0, 0, 0, [(0.0, 0.0, {"valoracion": 4.5, "n": 3, "id": "a"})])
+
+    [(numero, capa)] = leer_mensaje(tesela)
+    assert numero == 3  # layers
+    campos = leer_mensaje(capa)
+    assert (15, 2) in campos  # version
+    assert (1, b"resenas") in campos
+    assert (5, mvt.EXTENT) in campos
+    assert [v for n, v in campos if n == 3] == [b"valoracion", b"n", b"id"]
+
+    valores = [leer_mensaje(v)[0] for n, v in campos if n == 4]
+    assert valores == [(3, struct.pack("<d", 4.5)), (5, 3), (1, b"a")]
+
+    [feature] = [leer_mensaje(v) for n, v in campos if n == 2]
+    assert (3, 1) in feature  # POINT
+    geometria = dict(feature)[4]
+    # MoveTo(1) al centro de la tesela: (EXTENT / 2, EXTENT / 2) en zigzag
+    assert geometria == bytes([9]) + bytes([0x80, 0x20]) * 2  # 4096 = zigzag(2048)
+
+
+def test_propiedades_none_se_omiten_y_los_valores_se_comparten():
+    puntos = [(10.0, 10.0, {"valoracion": 4, "foto": None}), (11.0, 11.0, {"valoracion": 4})]
+    campos = leer_mensaje(leer_mensaje(mvt.encode_tesela_puntos("c", 1, 1, 0, puntos))[0][1])
+    assert [v for n, v in campos if n == 3] == [b"valoracion"]
+    assert len([v for n, v in campos if n == 4]) == 1
+    for n, v in campos:
+        if n == 2:
+            assert dict(leer_mensaje(v))[2] == bytes([0, 0])  # tags: clave 0, valor 0
+
+
+def test_punto_junto_al_borde_aparece_en_la_tesela_vecina():
+    # Longitud 0 es el borde entre las teselas x=0 y x=1 a zoom 1
+    assert {x for _, x, _ in mvt.teselas_de_punto(45.0, 0.0, 1)} == {0, 1}
+    assert {x for _, x, _ in mvt.teselas_de_punto(45.0, 90.0, 1)} == {1}
+
+
+def test_cache_caduca_por_ttl(monkeypatch):
+    reloj = SimpleNamespace(ahora=1000.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: reloj.ahora))
+    teselas = mvt.TileCache(maxsize=10, ttl=30.0, max_zoom=2)
+
+    version, datos = teselas.get((2, 1, 1))
+    assert datos is None
+    teselas.set((2, 1, 1), version, b"tesela")
+
+    reloj.ahora += 29.0
+    assert teselas.get((2, 1, 1)) == (version, b"tesela")
+    reloj.ahora += 2.0
+    assert teselas.get((2, 1, 1)) == (version, None)
+
+
+def test_invalidar_punto_descarta_la_tesela_y_los_calculos_en_curso():
+    teselas = mvt.TileCache(maxsize=10, ttl=30.0, max_zoom=2)
+    tesela = mvt.teselas_de_punto(40.0, -3.0, 2)[0]
+    otra = (2, 3, 3)
+
+    version, _ = teselas.get(tesela)
+    teselas.set(tesela, version, b"antes")
+    version_en_curso, _ = teselas.get(tesela)
+    teselas.set(otra, teselas.get(otra)[0], b"otra")
+
+    teselas.invalidar_punto(40.0, -3.0)
+    assert teselas.get(tesela)[1] is None
+    teselas.set(tesela, version_en_curso, b"calculada antes de invalidar")
+    assert teselas.get(tesela)[1] is None
+    assert teselas.get(otra)[1] == b"otra"
@@ -0,0 +1,82 @@
+import base64
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.core.pagination import (
+    decode_distance_cursor,
+    decode_keyset_cursor,
+    decode_search_cursor,
+    encode_cursor,
+    next_distance_cursor,
+)
+
+
+def cursor_crudo(json_texto: str) -> str:
+    """Cursor en base64 bien formado con un contenido JSON arbitrario"""
+    return base64.urlsafe_b64encode(json_texto.encode()).decode().rstrip("=")
+
+
+def test_keyset_ida_y_vuelta():
+    created_at = datetime(2024, 1, 1, 12, 30)
+    resena_id = ObjectId()
+    assert decode_keyset_cursor(encode_cursor(created_at, resena_id)) == (created_at, resena_id)
+
+
+def test_busqueda_ida_y_vuelta():
+    created_at = datetime(2024, 1, 1, 12, 30)
+    resena_id = ObjectId()
+    cursor = encode_cursor(5, created_at, resena_id)
+    assert decode_search_cursor(cursor) == (5, created_at, resena_id)
+
+
+
+def test_distancia_lleva_los_empatados_de_la_ultima_distancia():
+    a, b, c = ObjectId(), ObjectId(), ObjectId()
+    pagina = [
+        {"_id": a, "distancia_km": 0.5},
+        {"_id": b, "distancia_km": 1.25},
+        {"_id": c, "distancia_km": 1.25},
+    ]
+    assert decode_distance_cursor(next_distance_cursor(pagina, 3)) == (1.25, [b, c])
+    assert next_distance_cursor(pagina, 4) is None
+
+
+def test_distancia_acumula_empatados_de_paginas_anteriores():
+    a, b, c = ObjectId(), ObjectId(), ObjectId()
+    pagina = [{"_id": c, "distancia_km": 1.25}]
+    cursor = next_distance_cursor(pagina, 1, anterior=(1.25, [a, b]))
+    assert decode_distance_cursor(cursor) == (1.25, [a, b, c])
+    cursor = next_distance_cursor(pagina, 1, anterior=(0.5, [a]))
+    assert decode_distance_cursor(cursor) == (1.25, [c])
+
+
+def test_distancia_con_ids_no_validos_da_400():
+    with pytest.raises(HTTPException) as error:
+        decode_distance_cursor(encode_cursor(1.0, ["no-es-objectid"]))
+    assert error.value.status_code == 400
+
+@pytest.mark.parametrize("contenido", [
+    pytest.param('[{"$date": "2024-01-01T00:00:00Z"}, {"$oid": "zz"}]', id="objectid"),
+    pytest.param(
+        '[{"$date": {"$numberLong": "99999999999999999999"}}, {"$oid": "000000000000000000000000"}]',
+        id="fecha-fuera-de-rango"
+    ),
+    pytest.param('[{"$numberDecimal": "abc"}, {"$oid": "000000000000000000000000"}]', id="decimal"),
+    pytest.param('[' * 5000 + ']' * 5000, id="anidado"),
+    pytest.param('{"created_at": 1}', id="no-es-lista"),
+    pytest.param('[1, 2]', id="tipos"),
+])
+def test_cursor_con_contenido_no_valido_da_400(contenido):
+    with pytest.raises(HTTPException) as error:
+        decode_keyset_cursor(cursor_crudo(contenido))
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", ["%%%", "no-es-base64!", cursor_crudo("no es json")])
+def test_cursor_corrupto_da_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_search_cursor(cursor)
+    assert error.value.status_code == 400
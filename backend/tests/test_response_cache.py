@@ -0,0 +1,80 @@
+import asyncio
+
+from starlette.responses import Response
+
+from app.core.response_cache import MemoriaBackend, ResponseCache, etiqueta_resena, etiquetas_resena
+
+
+def nueva_cache() -> ResponseCache:
+    return ResponseCache(MemoriaBackend(maxsize=100, max_bytes=1 << 20, ttl=60.0))
+
+
+def test_invalidar_una_etiqueta_solo_descarta_sus_respuestas():
+    async def escenario():
+        cache = nueva_cache()
+        calculos = []
+
+        def calcular(cuerpo: bytes):
+            async def _calcular() -> Response:
+                calculos.append(cuerpo)
+                return Response(cuerpo, media_type="application/json")
+            return _calcular
+
+        primera = await cache.responder("resena", {"id": "a"}, [etiqueta_resena("a")], calcular(b"a"))
+        await cache.responder("resena", {"id": "b"}, [etiqueta_resena("b")], calcular(b"b"))
+        assert primera.headers["X-Cache"] == "MISS"
+
+        repetida = await cache.responder("resena", {"id": "a"}, [etiqueta_resena("a")], calcular(b"a"))
+        assert repetida.headers["X-Cache"] == "HIT"
+
+        await cache.invalidar([etiqueta_resena("a")])
+        a = await cache.responder("resena", {"id": "a"}, [etiqueta_resena("a")], calcular(b"a2"))
+        b = await cache.responder("resena", {"id": "b"}, [etiqueta_resena("b")], calcular(b"b2"))
+        assert (a.body, a.headers["X-Cache"]) == (b"a2", "MISS")
+        assert (b.body, b.headers["X-Cache"]) == (b"b", "HIT")
+        assert calculos == [b"a", b"b", b"a2"]
+
+    asyncio.run(escenario())
+
+
+def test_respuesta_calculada_durante_una_invalidacion_no_se_guarda():
+    async def escenario():
+        cache = nueva_cache()
+        etiquetas = etiquetas_resena("a", "autor@example.com", 4.0, 40.4168, -3.7038)
+
+        async def calcular_con_escritura() -> Response:
+            # Una escritura de la reseña llega mientras se calcula la respuesta
+            await cache.invalidar(etiquetas_resena("a", "autor@example.com", 4.0, 40.4168, -3.7038))
+            return Response(b"antigua", media_type="application/json")
+
+        await cache.responder("resena", {"id": "a"}, etiquetas, calcular_con_escritura)
+        assert cache.rechazadas == 1
+
+        async def calcular() -> Response:
+            return Response(b"nueva", media_type="application/json")
+
+        respuesta = await cache.responder("resena", {"id": "a"}, etiquetas, calcular)
+        assert (respuesta.body, respuesta.headers["X-Cache"]) == (b"nueva", "MISS")
+
+    asyncio.run(escenario())
+
+
+def test_etiquetas_de_zona_invalidan_busquedas_amplias():
+    # Una escritura etiqueta su celda con todos los prefijos: invalida búsquedas con celdas mayores
+    etiquetas = etiquetas_resena("a", "autor@example.com", 4.0, 40.4168, -3.7038)
+    assert {"celda:e", "celda:ez", "celda:ezj", "celda:ezjm"} <= etiquetas
+    assert "valoracion:4" in etiquetas and "autor:autor@example.com" in etiquetas
+
+
+def test_cabecera_de_cursor_se_guarda_con_la_respuesta():
+    async def escenario():
+        cache = nueva_cache()
+
+        async def calcular() -> Response:
+            return Response(b"[]", media_type="application/json", headers={"X-Next-Cursor": "abc"})
+
+        await cache.responder("lista", {}, ["resenas"], calcular)
+        respuesta = await cache.responder("lista", {}, ["resenas"], calcular)
+        assert (respuesta.headers["X-Cache"], respuesta.headers["X-Next-Cursor"]) == ("HIT", "abc")
+
+    asyncio.run(escenario())
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight
+
+
+class Consulta:
+    """Operación que cuenta sus ejecuciones y termina cuando se abre `puerta`"""
+
+    def __init__(self):
+        self.ejecuciones = 0
+        self.puerta = asyncio.Event()
+
+    async def __call__(self):
+        self.ejecuciones += 1
+        await self.puerta.wait()
+        return {"ejecucion": self.ejecuciones}
+
+
+async def lanzar(grupo: SingleFlight, clave, consulta: Consulta, n: int):
+    tareas = [asyncio.create_task(grupo.do(clave, consulta)) for _ in range(n)]
+    await asyncio.sleep(0)
+    consulta.puerta.set()
+    return await asyncio.gather(*tareas)
+
+
+def test_llamadas_simultaneas_comparten_una_ejecucion():
+    async def escenario():
+        grupo = SingleFlight()
+        consulta = Consulta()
+        resultados = await lanzar(grupo, ("ubicacion", 40.0, -3.0), consulta, 5)
+
+        assert consulta.ejecuciones == 1
+        assert resultados == [{"ejecucion": 1}] * 5
+        assert (grupo.llamadas, grupo.ejecuciones, grupo.compartidas) == (5, 1, 4)
+        assert len(grupo) == 0
+
+        # Terminada la operación la clave se libera: la siguiente llamada vuelve a ejecutar
+        await grupo.do(("ubicacion", 40.0, -3.0), consulta)
+        assert consulta.ejecuciones == 2
+
+    asyncio.run(escenario())
+
+
+def test_claves_distintas_no_se_agrupan():
+    async def escenario():
+        grupo = SingleFlight()
+        consulta = Consulta()
+        tareas = [asyncio.create_task(grupo.do(clave, consulta)) for clave in ("a", "b")]
+        await asyncio.sleep(0)
+        consulta.puerta.set()
+        await asyncio.gather(*tareas)
+        assert consulta.ejecuciones == 2
+
+    asyncio.run(escenario())
+
+
+def test_max_waiters_lanza_otra_ejecucion():
+    async def escenario():
+        grupo = SingleFlight(max_waiters=2)
+        consulta = Consulta()
+        await lanzar(grupo, "clave", consulta, 6)
+        # 1 + 2 que esperan, y otra vez 1 + 2
+        assert consulta.ejecuciones == 2
+        assert grupo.desbordes == 1
+
+    asyncio.run(escenario())
+
+
+def test_olvidar_hace_que_las_siguientes_llamadas_no_se_unan():
+    async def escenario():
+        grupo = SingleFlight()
+        consulta = Consulta()
+        antes = asyncio.create_task(grupo.do("clave", consulta))
+        await asyncio.sleep(0)
+        grupo.olvidar()  # Una escritura cambia los resultados
+        despues = asyncio.create_task(grupo.do("clave", consulta))
+        await asyncio.sleep(0)
+        consulta.puerta.set()
+        assert await asyncio.gather(antes, despues) == [{"ejecucion": 2}, {"ejecucion": 2}]
+        assert consulta.ejecuciones == 2
+
+    asyncio.run(escenario())
+
+
+def test_error_y_cancelacion():
+    async def escenario():
+        grupo = SingleFlight()
+        consulta = Consulta()
+
+        async def falla():
+            await consulta.puerta.wait()
+            raise ValueError("consulta fallida")
+
+        tareas = [asyncio.create_task(grupo.do("clave", falla)) for _ in range(3)]
+        await asyncio.sleep(0)
+        tareas[0].cancel()  # Un llamador cancelado no cancela la operación de los demás
+        consulta.puerta.set()
+        resultados = await asyncio.gather(*tareas, return_exceptions=True)
+        assert isinstance(resultados[0], asyncio.CancelledError)
+        assert all(isinstance(r, ValueError) for r in resultados[1:])
+
+    asyncio.run(escenario())
+
+
+def test_stats_no_exponen_la_clave():
+    async def escenario():
+        grupo = SingleFlight()
+        consulta = Consulta()
+        await lanzar(grupo, ("establecimiento", "bar de mi vecino", 0, 20), consulta, 3)
+        [clave] = grupo.stats()["claves"]
+        assert clave["operacion"] == "establecimiento"
+        assert "vecino" not in repr(grupo.stats())
+        assert (clave["llamadas"], clave["compartidas"]) == (3, 2)
+
+    asyncio.run(escenario())
+
+
+@pytest.mark.parametrize("max_claves", [1, 3])
+def test_stats_por_clave_acotadas(max_claves):
+    async def escenario():
+        grupo = SingleFlight(max_claves_stats=max_claves)
+        for i in range(5):
+            consulta = Consulta()
+            consulta.puerta.set()
+            await grupo.do(("op", i), consulta)
+        assert len(grupo.stats()["claves"]) == max_claves
+
+    asyncio.run(escenario())
@@ -5,6 +5,15 @@ import type { Resena, ResenaCreate, ResenaUpdate } from '@/interfaces/eventual';
 // En producción (Vercel): usa rutas relativas con prefijo /api
 const API_BASE = import.meta.env.VITE_API_URL || '/api';
 
+// Debe coincidir con MAX_IMAGES_PER_BATCH del backend (/resenas/upload-images)
+export const MAX_IMAGENES_POR_PETICION = 10;
+
+export interface ImagenSubida {
+  filename: string;
+  url: string | null;
+  error: string | null;
+}
+
 class ResenaService {
   private getAuthHeaders(): HeadersInit {
     const token = localStorage.getItem('auth_token');
@@ -180,6 +189,51 @@ class ResenaService {
     }
     return response.json();
   }
+
+  /**
+   * Subir varias imágenes, en peticiones de como mucho MAX_IMAGENES_POR_PETICION
+   * (el backend rechaza lotes mayores con un 400)
+   * Los resultados llegan en el mismo orden que los archivos, con error por archivo;
+   * si falla una petición entera, sus archivos llevan ese error y se sigue con las demás
+   */
+  async subirImagenes(
+    files: File[]
+  ): Promise<{ resultados: ImagenSubida[] }> {
+    const resultados: ImagenSubida[] = [];
+    for (let inicio = 0; inicio < files.length; inicio += MAX_IMAGENES_POR_PETICION) {
+      const lote = files.slice(inicio, inicio + MAX_IMAGENES_POR_PETICION);
+      try {
+        resultados.push(...(await this.subirLoteImagenes(lote)));
+      } catch (error: any) {
+        const mensaje = error.message || 'Error al subir imágenes';
+        resultados.push(...lote.map((file) => ({ filename: file.name, url: null, error: mensaje })));
+      }
+    }
+    return { resultados };
+  }
+
+  /**
+   * Subir un lote de imágenes en una sola petición (el backend las sube en paralelo)
+   */
+  private async subirLoteImagenes(files: File[]): Promise<ImagenSubida[]> {
+    const formData = new FormData();
+    files.forEach((file) => formData.append('files', file));
+
+    const token = localStorage.getItem('auth_token');
+    const response = await fetch(`${API_BASE}/resenas/upload-images`, {
+      method: 'POST',
+      headers: {
+        ...(token && { Authorization: `Bearer ${token}` }),
+      },
+      body: formData,
+    });
+
+    if (!response.ok) {
+      throw new Error('Error al subir imágenes');
+    }
+    const { resultados } = await response.json();
+    return resultados;
+  }
 }
 
 export const resenaService = new ResenaService();